@@ -0,0 +1,10 @@
+"""Helpers shared by the command-line entry points."""
+
+from __future__ import annotations
+
+from typing import List
+
+
+def split_list(text: str) -> List[str]:
+    """Parse a comma-separated flag value, dropping blanks: "a, b," -> ["a", "b"]."""
+    return [part.strip() for part in (text or "").split(",") if part.strip()]
@@ -1,9 +1,10 @@
 """Configuration helpers for the reconstructed simulation."""
 
 from dataclasses import dataclass
+import functools
 import json
 import os
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
 
 def _load_config(path: str) -> Dict[str, Any]:
@@ -22,7 +23,21 @@ class Settings:
 
     log_llm_calls: bool = False
     log_llm_path: str = "logs/llm_calls.jsonl"
+    # Rotate the call log past this size (MB) or age (minutes); 0 disables either.
+    log_llm_max_mb: float = 64.0
+    log_llm_rotate_minutes: float = 0.0
+    log_llm_compress: bool = True
+    log_llm_dedup: bool = True
+    # Fraction of calls logged with prompts and outputs; the rest keep metadata only.
+    log_llm_full_rate: float = 1.0
+    log_llm_queue_size: int = 1024
     print_llm_calls: bool = False
+    # "full" prints prompts and output, "compact" one line per call.
+    print_llm_mode: str = "full"
+    print_llm_max_chars: int = 2000
+    print_llm_rate: float = 1.0
+    # Only these stages are printed; empty prints all.
+    print_llm_stages: Tuple[str, ...] = ()
 
     openai_api_key: str = os.environ.get("OPENAI_API_KEY", "")
     anthropic_api_key: str = os.environ.get("ANTHROPIC_KEY", "")
@@ -34,6 +49,22 @@ class Settings:
         return Settings(
             log_llm_calls=bool(data.get("log_llm_calls", False)),
             log_llm_path=str(data.get("log_llm_path", "logs/llm_calls.jsonl")),
+            log_llm_max_mb=float(data.get("log_llm_max_mb", 64.0)),
+            log_llm_rotate_minutes=float(data.get("log_llm_rotate_minutes", 0.0)),
+            log_llm_compress=bool(data.get("log_llm_compress", True)),
+            log_llm_dedup=bool(data.get("log_llm_dedup", True)),
+            log_llm_full_rate=float(data.get("log_llm_full_rate", 1.0)),
+            log_llm_queue_size=int(data.get("log_llm_queue_size", 1024)),
             print_llm_calls=bool(data.get("print_llm_calls", False)),
+            print_llm_mode=str(data.get("print_llm_mode", "full")),
+            print_llm_max_chars=int(data.get("print_llm_max_chars", 2000)),
+            print_llm_rate=float(data.get("print_llm_rate", 1.0)),
+            print_llm_stages=tuple(data.get("print_llm_stages", ())),
         )
 
+
+@functools.lru_cache(maxsize=None)
+def load_settings(path: str = "simulation/config.json") -> Settings:
+    """Settings from `path`, read once per process."""
+    return Settings.from_config(path)
+
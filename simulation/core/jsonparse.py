@@ -0,0 +1,32 @@
+"""Recover JSON objects from model outputs."""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Dict, Optional
+
+_DECODER = json.JSONDecoder()
+
+
+def parse_json_object(
+    text: str,
+    accept: Optional[Callable[[Dict[str, Any]], bool]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Return the first JSON object in `text` that decodes (and that `accept` approves),
+    or None. Decoding starts at each "{" in turn, so prose, code fences or trailing
+    text around the object do not matter and a truncated outer object falls through
+    to the objects after it.
+    """
+    if not text:
+        return None
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            value, _ = _DECODER.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            value = None
+        if isinstance(value, dict) and (accept is None or accept(value)):
+            return value
+        pos = text.find("{", pos + 1)
+    return None
@@ -3,20 +3,32 @@
 from __future__ import annotations
 
 import asyncio
+import atexit
+import glob
+import gzip
+import hashlib
 import json
 import os
+import queue
+import random
+import re
+import shutil
+import sys
+import threading
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from .config import Settings
+from .config import Settings, load_settings
 
-_LOG_LOCK = asyncio.Lock()
 _LOG_PATH_CACHED: Optional[str] = None
-_LOG_FH: Optional[Any] = None
+_WRITER: Optional["LLMLogWriter"] = None
+_TRACER: Optional["ConsoleTracer"] = None
+_STOP = object()
 
 
 def get_log_path(settings: Optional[Settings] = None) -> Optional[str]:
-    settings = settings or Settings.from_config()
+    settings = settings or load_settings()
     if not settings.log_llm_calls:
         return None
     global _LOG_PATH_CACHED
@@ -33,38 +45,393 @@ def get_log_path(settings: Optional[Settings] = None) -> Optional[str]:
 
 
 def should_print_calls(settings: Optional[Settings] = None) -> bool:
-    settings = settings or Settings.from_config()
+    settings = settings or load_settings()
     return settings.print_llm_calls
 
 
+def _blob_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def _segment_path(path: str, number: int) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{number:03d}{ext}"
+
+
+_SEGMENT_RE = re.compile(r"^(.*)\.\d{3}(\.[^./\\]*)(?:\.gz)?$")
+
+
+def log_base_path(path: str) -> str:
+    """The active log path for a rotated segment path; other paths are returned as-is."""
+    match = _SEGMENT_RE.match(path)
+    return match.group(1) + match.group(2) if match else path
+
+
+def log_segments(path: str) -> List[str]:
+    """Rotated segments of a call log (compressed or not) in order, then the active file."""
+    root, ext = os.path.splitext(path)
+    pattern = f"{glob.escape(root)}.[0-9][0-9][0-9]{glob.escape(ext)}"
+    segments = sorted(glob.glob(pattern) + glob.glob(pattern + ".gz"))
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+
+class LLMLogWriter:
+    """
+    Writes call log entries from a background thread. Batches go through a bounded
+    queue (when it is full, log_llm_calls waits for room in a worker thread, so
+    entries are not dropped and the event loop keeps running); the file is
+    flushed whenever the queue runs dry. Past `max_bytes` or `rotate_s` the file is
+    moved to `<root>.NNN<ext>` and, with `compress`, gzipped.
+
+    With `dedup`, system prompts and messages are written once per file as blob
+    lines and entries refer to them by hash: {"blob", "text"} for system prompts and
+    {"blob", "parent", "message"} for messages, chained so that a conversation's
+    history is one blob per message however many turns re-send it. Only a
+    `full_rate` fraction of calls keeps prompts and outputs; the rest are logged
+    as metadata only. `iter_log_entries` reverses all of this.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_bytes: int = 64 << 20,
+        rotate_s: float = 0.0,
+        compress: bool = True,
+        dedup: bool = True,
+        full_rate: float = 1.0,
+        queue_size: int = 1024,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_s = rotate_s
+        self.compress = compress
+        self.dedup = dedup
+        self.full_rate = full_rate
+        self.entries = 0
+        self.blobs = 0
+        self.rotations = 0
+        # Batches that found the queue full and had to wait for room.
+        self.waits = 0
+        self._rng = random.Random()
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+        self._f: Optional[Any] = None
+        self._seen: set = set()
+        self._opened_at = 0.0
+        self._bytes = 0
+        self._segment = len(log_segments(path)) - (1 if os.path.exists(path) else 0)
+        self._thread = threading.Thread(target=self._run, name="llm-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, entries: List[Dict[str, Any]], block: bool = True) -> None:
+        """Queue a batch; with block=False raises queue.Full instead of waiting."""
+        if entries and self._thread.is_alive():
+            self._queue.put(entries, block=block)
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                for entry in item:
+                    self._write(entry)
+                if self._queue.empty() and self._f is not None:
+                    self._f.flush()
+        finally:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._f = open(self.path, "ab")
+        self._bytes = self._f.tell()
+        self._opened_at = time.monotonic()
+        self._seen = set()
+
+    def _rotate(self) -> None:
+        self._f.close()
+        self._f = None
+        target = _segment_path(self.path, self._segment)
+        self._segment += 1
+        os.replace(self.path, target)
+        if self.compress:
+            with open(target, "rb") as src, gzip.open(f"{target}.gz.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(f"{target}.gz.tmp", f"{target}.gz")
+            os.remove(target)
+        self.rotations += 1
+
+    def _emit(self, record: Dict[str, Any]) -> None:
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self._f.write(data)
+        self._bytes += len(data)
+
+    def _blob(self, key: str, record: Dict[str, Any]) -> str:
+        if key not in self._seen:
+            self._seen.add(key)
+            self._emit({"blob": key, **record})
+            self.blobs += 1
+        return key
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        if self._f is None:
+            self._open()
+        elif (self.max_bytes > 0 and self._bytes >= self.max_bytes) or (
+            self.rotate_s > 0 and time.monotonic() - self._opened_at >= self.rotate_s
+        ):
+            self._rotate()
+            self._open()
+        entry = dict(entry)
+        messages = entry.pop("messages", None) or []
+        if self.full_rate < 1.0 and self._rng.random() >= self.full_rate:
+            for key in ("system_prompt", "user_prompt", "output"):
+                entry.pop(key, None)
+            entry["metadata_only"] = True
+            entry["message_count"] = len(messages)
+        elif self.dedup:
+            system_prompt = entry.pop("system_prompt", "")
+            entry["system_prompt_ref"] = self._blob(_blob_hash("text", system_prompt), {"text": system_prompt})
+            parent = None
+            for message in messages:
+                text = json.dumps(message, ensure_ascii=False, sort_keys=True)
+                parent = self._blob(_blob_hash(parent or "", text), {"parent": parent, "message": message})
+            entry["messages_ref"] = parent
+            entry["message_count"] = len(messages)
+        else:
+            entry["messages"] = messages
+        self._emit(entry)
+        self.entries += 1
+
+
+def _get_writer(settings: Optional[Settings] = None) -> Optional[LLMLogWriter]:
+    global _WRITER
+    if _WRITER is None:
+        settings = settings or load_settings()
+        log_path = get_log_path(settings)
+        if not log_path:
+            return None
+        _WRITER = LLMLogWriter(
+            log_path,
+            max_bytes=int(settings.log_llm_max_mb * (1 << 20)),
+            rotate_s=settings.log_llm_rotate_minutes * 60,
+            compress=settings.log_llm_compress,
+            dedup=settings.log_llm_dedup,
+            full_rate=settings.log_llm_full_rate,
+            queue_size=settings.log_llm_queue_size,
+        )
+        atexit.register(close_llm_log)
+    return _WRITER
+
+
+def close_llm_log() -> None:
+    """Write out queued entries and stop the writer thread."""
+    global _WRITER
+    if _WRITER is not None:
+        _WRITER.close()
+        _WRITER = None
+
+
 async def log_llm_calls(entries: List[Dict[str, Any]], settings: Optional[Settings] = None) -> None:
-    """Append LLM call logs as JSONL entries."""
-    log_path = get_log_path(settings)
-    if not log_path or not entries:
+    """Queue LLM call logs for the background writer."""
+    if not entries:
+        return
+    writer = _get_writer(settings)
+    if writer is None:
         return
-    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
-    async with _LOG_LOCK:
-        global _LOG_FH
-        if _LOG_FH is None:
-            _LOG_FH = open(log_path, "a", encoding="utf-8")
-        for entry in entries:
-            _LOG_FH.write(json.dumps(entry, ensure_ascii=False) + "\n")
-        _LOG_FH.flush()
+    try:
+        writer.submit(entries, block=False)
+    except queue.Full:
+        writer.waits += 1
+        await asyncio.to_thread(writer.submit, entries)
+
+
+def iter_log_entries(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Call log entries of `path` and its rotated segments, with deduplicated prompts
+    and messages expanded again; also reads logs written before deduplication. A
+    torn line (e.g. the end of a log still being written) is skipped.
+    """
+    for segment in log_segments(path):
+        opener = gzip.open if segment.endswith(".gz") else open
+        blobs: Dict[str, Dict[str, Any]] = {}
+        with opener(segment, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "blob" in record:
+                    blobs[record["blob"]] = record
+                    continue
+                if "system_prompt_ref" in record:
+                    record["system_prompt"] = blobs[record.pop("system_prompt_ref")]["text"]
+                if "messages_ref" in record:
+                    messages = []
+                    ref = record.pop("messages_ref")
+                    while ref is not None:
+                        messages.append(blobs[ref]["message"])
+                        ref = blobs[ref]["parent"]
+                    record["messages"] = messages[::-1]
+                    record.pop("message_count", None)
+                yield record
+
+
+def _truncate(text: Any, max_chars: int) -> str:
+    text = "\n---\n".join(str(item) for item in text) if isinstance(text, list) else str(text or "")
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more chars]"
+
+
+def format_call_compact(entry: Dict[str, Any], max_chars: int = 80) -> str:
+    """One line: time, stage, model, latency, tokens, finish reason and the start of the user prompt."""
+    usage = entry.get("usage") or {}
+    timestamp = str(entry.get("timestamp", ""))[11:19]
+    tokens = f"in={usage.get('prompt_tokens', 0)}"
+    if usage.get("cached_tokens"):
+        tokens += f" (cached {usage['cached_tokens']})"
+    tokens += f" out={usage.get('completion_tokens', 0)}"
+    prompt = " ".join(_truncate(entry.get("user_prompt", ""), max_chars).split())
+    return (
+        f"[{timestamp}] {entry.get('stage') or 'unlabeled'} {entry.get('model_name')} "
+        f"{usage.get('latency_s', 0.0):.2f}s {tokens} finish={usage.get('finish_reason')} | {prompt}"
+    )
+
+
+def format_call_full(entry: Dict[str, Any], max_chars: int = 0) -> str:
+    return "\n".join(
+        [
+            "",
+            "=== LLM CALL ===",
+            f"model: {entry.get('model_name')}",
+            f"temperature: {entry.get('temperature')}, max_tokens: {entry.get('max_tokens')}, n: {entry.get('n')}",
+            "--- system_prompt ---",
+            _truncate(entry.get("system_prompt", ""), max_chars),
+            "--- user_prompt ---",
+            _truncate(entry.get("user_prompt", ""), max_chars),
+            "--- output ---",
+            _truncate(entry.get("output"), max_chars),
+        ]
+    )
+
+
+class ConsoleTracer:
+    """
+    Prints LLM calls from a background thread, so formatting and terminal writes stay
+    off the event loop. Calls are kept at `rate` (and only for `stages`, if given);
+    when the bounded queue is full, batches are dropped instead of making callers
+    wait, and the number dropped is printed once the queue drains.
+    """
+
+    def __init__(
+        self,
+        *,
+        mode: str = "full",
+        max_chars: int = 2000,
+        rate: float = 1.0,
+        stages: Tuple[str, ...] = (),
+        queue_size: int = 256,
+        stream: Any = None,
+    ) -> None:
+        if mode not in ("full", "compact"):
+            raise ValueError(f"Unknown print_llm_mode: {mode}")
+        self.mode = mode
+        self.max_chars = max_chars
+        self.rate = rate
+        self.stages = set(stages)
+        self.stream = stream or sys.stdout
+        self.printed = 0
+        self.dropped = 0
+        self._reported_drops = 0
+        self._rng = random.Random()
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = threading.Thread(target=self._run, name="llm-console-tracer", daemon=True)
+        self._thread.start()
+
+    def submit(self, entries: List[Dict[str, Any]]) -> None:
+        if self.stages:
+            entries = [entry for entry in entries if entry.get("stage") in self.stages]
+        if self.rate < 1.0:
+            entries = [entry for entry in entries if self._rng.random() < self.rate]
+        if not entries or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put_nowait(entries)
+        except queue.Full:
+            self.dropped += len(entries)
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _format(self, entry: Dict[str, Any]) -> str:
+        if self.mode == "compact":
+            return format_call_compact(entry, min(self.max_chars, 80) if self.max_chars > 0 else 80)
+        return format_call_full(entry, self.max_chars)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            stop = item is _STOP
+            lines = [] if stop else [self._format(entry) for entry in item]
+            self.printed += len(lines)
+            if (stop or self._queue.empty()) and self.dropped > self._reported_drops:
+                lines.append(f"[llm trace] {self.dropped - self._reported_drops} calls not printed (console queue full)")
+                self._reported_drops = self.dropped
+            if lines:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            if stop:
+                break
+
+
+def _get_tracer(settings: Optional[Settings] = None) -> Optional[ConsoleTracer]:
+    global _TRACER
+    if _TRACER is None:
+        settings = settings or load_settings()
+        if not settings.print_llm_calls:
+            return None
+        _TRACER = ConsoleTracer(
+            mode=settings.print_llm_mode,
+            max_chars=settings.print_llm_max_chars,
+            rate=settings.print_llm_rate,
+            stages=settings.print_llm_stages,
+        )
+        atexit.register(close_console_tracer)
+    return _TRACER
+
+
+def close_console_tracer() -> None:
+    """Print queued calls and stop the tracer thread."""
+    global _TRACER
+    if _TRACER is not None:
+        _TRACER.close()
+        _TRACER = None
 
 
 def print_llm_calls(entries: List[Dict[str, Any]], settings: Optional[Settings] = None) -> None:
-    if not entries or not should_print_calls(settings):
+    if not entries:
         return
-    for entry in entries:
-        print("\n=== LLM CALL ===")
-        print(f"model: {entry.get('model_name')}")
-        print(f"temperature: {entry.get('temperature')}, max_tokens: {entry.get('max_tokens')}, n: {entry.get('n')}")
-        print("--- system_prompt ---")
-        print(entry.get("system_prompt", ""))
-        print("--- user_prompt ---")
-        print(entry.get("user_prompt", ""))
-        print("--- output ---")
-        print(entry.get("output"))
+    tracer = _get_tracer(settings)
+    if tracer is not None:
+        tracer.submit(entries)
 
 
 def build_log_entry(
@@ -77,16 +444,22 @@ def build_log_entry(
     temperature: float,
     max_tokens: int,
     n: int,
+    stage: Optional[str] = None,
+    usage: Optional[Dict[str, Any]] = None,
+    reasoning_effort: Optional[str] = None,
 ) -> Dict[str, Any]:
     return {
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "model_name": model_name,
+        "stage": stage,
+        "reasoning_effort": reasoning_effort,
         "temperature": temperature,
         "max_tokens": max_tokens,
         "n": n,
         "system_prompt": system_prompt,
         "user_prompt": user_prompt,
-        "messages": messages,
+        "messages": list(messages),
         "output": output,
+        "usage": usage or {},
     }
 
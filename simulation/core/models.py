@@ -3,20 +3,38 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
 
 import aiolimiter
 from openai import AsyncOpenAI
 from tqdm.asyncio import tqdm_asyncio
 
 from .logging import build_log_entry, log_llm_calls, print_llm_calls
+from .reasoning import resolve_reasoning_effort
+from .usage import record_usage, usage_from_response
 
 
 class SingleModelClient:
     """Adapter for a single configured model (no routing)."""
 
-    def __init__(self, model_name: str) -> None:
+    def __init__(
+        self,
+        model_name: str,
+        reasoning_profile: Optional[Dict[str, str]] = None,
+        max_concurrency: int = 100,
+        requests_per_minute: int = 100,
+    ) -> None:
         self.model_name = model_name
+        self.reasoning_profile = reasoning_profile or {}
+        self.max_concurrency = max_concurrency
+        # Request starts allowed per minute across all calls on this client.
+        self.requests_per_minute = requests_per_minute
+        # Shared by all calls on this client so concurrent batches (e.g. the
+        # streaming pool) reuse one connection pool, one concurrency cap and one rate limit.
+        self._client: Optional[AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._limiter: Optional[aiolimiter.AsyncLimiter] = None
 
     async def _throttled_openai_chat_completion(
         self,
@@ -29,7 +47,7 @@ class SingleModelClient:
         n: int,
         limiter: aiolimiter.AsyncLimiter,
         reasoning_effort: Optional[str] = None,
-        json_mode: bool = False,
+        response_format: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         async with limiter:
             for _ in range(20):
@@ -44,8 +62,8 @@ class SingleModelClient:
                     }
                     if reasoning_effort is not None:
                         params["reasoning_effort"] = reasoning_effort
-                    if json_mode:
-                        params["response_format"] = {"type": "json_object"}
+                    if response_format is not None:
+                        params["response_format"] = response_format
                     return await client.chat.completions.create(**params)
                 except Exception as e:
                     raise e
@@ -68,52 +86,129 @@ class SingleModelClient:
         self,
         full_contexts: List[List[Dict[str, str]]],
         temperature: float,
-        max_tokens: int,
+        max_tokens: Union[int, Sequence[int]],
         n: int = 1,
         show_progress: bool = True,
         json_mode: bool = False,
+        stage: Optional[str] = None,
+        retry_truncated_max_tokens: Optional[int] = None,
+        on_complete: Optional[Callable[[], Any]] = None,
+        json_schema: Optional[Union[Dict[str, Any], Sequence[Dict[str, Any]]]] = None,
+        request_errors: Optional[Dict[int, BaseException]] = None,
     ) -> List[List[str]]:
         """
         Generate responses for a batch of contexts using a single OpenAI model.
         Returns a list of response lists (one list per context).
+        `stage` labels the calls for per-stage usage accounting and logs.
+        `max_tokens` may be one budget per context. Generations that stop with
+        finish_reason == "length" are counted as truncated and, if
+        `retry_truncated_max_tokens` is set, retried once with a doubled budget
+        capped at that value. `on_complete` is called once per context when its first
+        request finishes, e.g. to drive a caller-owned progress bar. `json_schema` (one
+        for the batch or one per context) requests schema-constrained output; models
+        without structured output support fall back to plain JSON mode. With
+        `request_errors` a failed request does not fail the batch: its exception is
+        stored there under the context index and the context gets empty responses
+        (a failed truncation retry keeps the truncated response instead).
         """
-        client = AsyncOpenAI()
+        if self._client is None:
+            self._client = AsyncOpenAI()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._limiter = aiolimiter.AsyncLimiter(self.requests_per_minute, time_period=60)
+        client = self._client
+        semaphore = self._semaphore
+        limiter = self._limiter
 
-        reasoning_effort = None
-        if self.model_name in ["gpt-5", "gpt-5-mini", "gpt-5-nano"]:
-            reasoning_effort = "minimal"
-            temperature = 1.0
-        elif self.model_name in ["gpt-5-thinking", "gpt-5-mini-thinking", "gpt-5-nano-thinking"]:
-            reasoning_effort = "medium"
+        reasoning_effort = resolve_reasoning_effort(self.model_name, stage, self.reasoning_profile)
+        if reasoning_effort is not None:
             temperature = 1.0
+        # Usage is tracked per stage and effort so profiles can be compared.
+        usage_stage = f"{stage or 'unlabeled'}@{reasoning_effort}" if reasoning_effort else stage
 
         actual_model = self._map_model(self.model_name)
-        limiter = aiolimiter.AsyncLimiter(100, time_period=60)
-        semaphore = asyncio.Semaphore(100)
 
-        async def limited_task(context):
+        if isinstance(json_schema, (list, tuple)):
+            schemas: List[Optional[Dict[str, Any]]] = list(json_schema)
+        else:
+            schemas = [json_schema] * len(full_contexts)
+        response_formats = [_response_format(actual_model, json_mode, schema) for schema in schemas]
+
+        budgets = list(max_tokens) if isinstance(max_tokens, (list, tuple)) else [max_tokens] * len(full_contexts)
+        responses: List[Any] = [None] * len(full_contexts)
+        latencies: List[float] = [0.0] * len(full_contexts)
+        failed_retries: set = set()
+
+        async def limited_task(index, context, budget, first):
             async with semaphore:
-                return await self._throttled_openai_chat_completion(
-                    client=client,
-                    model=actual_model,
-                    messages=context,
-                    temperature=temperature if temperature is not None else 0,
-                    max_tokens=max_tokens,
-                    top_p=1.0,
-                    n=n,
-                    limiter=limiter,
-                    reasoning_effort=reasoning_effort,
-                    json_mode=json_mode,
+                started = time.perf_counter()
+                try:
+                    responses[index] = await self._throttled_openai_chat_completion(
+                        client=client,
+                        model=actual_model,
+                        messages=context,
+                        temperature=temperature if temperature is not None else 0,
+                        max_tokens=budget,
+                        top_p=1.0,
+                        n=n,
+                        limiter=limiter,
+                        reasoning_effort=reasoning_effort,
+                        response_format=response_formats[index],
+                    )
+                except Exception as e:
+                    if request_errors is None:
+                        raise
+                    if first:
+                        request_errors[index] = e
+                    else:
+                        failed_retries.add(index)
+                latencies[index] = time.perf_counter() - started
+                if first and on_complete is not None:
+                    on_complete()
+
+        async def run_indices(indices: List[int], progress: bool, first: bool = True) -> None:
+            tasks = [limited_task(i, full_contexts[i], budgets[i], first) for i in indices]
+            if progress:
+                await tqdm_asyncio.gather(*tasks)
+            else:
+                await asyncio.gather(*tasks)
+
+        def account(indices: List[int], retry: bool) -> List[int]:
+            truncated = []
+            for i in indices:
+                if (request_errors is not None and i in request_errors) or (retry and i in failed_retries):
+                    continue
+                finish_reason = _finish_reason(responses[i])
+                record_usage(
+                    usage_stage,
+                    latency_s=latencies[i],
+                    finish_reason=finish_reason,
+                    retry=retry,
+                    **usage_from_response(responses[i]),
                 )
+                if finish_reason == "length":
+                    truncated.append(i)
+            return truncated
 
-        async_responses = [limited_task(context) for context in full_contexts]
-        if show_progress:
-            responses = await tqdm_asyncio.gather(*async_responses)
-        else:
-            responses = await asyncio.gather(*async_responses)
+        all_indices = list(range(len(full_contexts)))
+        await run_indices(all_indices, show_progress)
+        truncated = account(all_indices, retry=False)
+
+        # Capped retry: re-issue truncated generations once with a larger budget.
+        if truncated and retry_truncated_max_tokens:
+            retry_indices = [i for i in truncated if budgets[i] < retry_truncated_max_tokens]
+            for i in retry_indices:
+                budgets[i] = min(budgets[i] * 2, retry_truncated_max_tokens)
+            if retry_indices:
+                await run_indices(retry_indices, False, first=False)
+                account(retry_indices, retry=True)
 
         generated_responses: List[List[str]] = []
-        for resp in responses:
+        usages: List[Dict[str, Any]] = []
+        for resp, latency in zip(responses, latencies):
+            usage: Dict[str, Any] = dict(usage_from_response(resp))
+            usage["finish_reason"] = _finish_reason(resp)
+            usage["latency_s"] = round(latency, 3)
+            usages.append(usage)
             scenario_responses: List[str] = []
             for i in range(n):
                 try:
@@ -129,23 +224,58 @@ class SingleModelClient:
             full_contexts=full_contexts,
             outputs=generated_responses,
             temperature=temperature,
-            max_tokens=max_tokens,
+            max_tokens=budgets,
             n=n,
+            stage=stage,
+            usages=usages,
+            reasoning_effort=reasoning_effort,
         )
         return generated_responses
 
 
+# Snapshots and families that reject response_format={"type": "json_schema"}.
+STRUCTURED_OUTPUT_UNSUPPORTED = ("gpt-4o-2024-05-13", "gpt-4-", "gpt-3.5")
+
+
+def supports_json_schema(model: str) -> bool:
+    return not model.startswith(STRUCTURED_OUTPUT_UNSUPPORTED)
+
+
+def _response_format(model: str, json_mode: bool, schema: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if schema is not None and supports_json_schema(model):
+        return {"type": "json_schema", "json_schema": schema}
+    if json_mode or schema is not None:
+        return {"type": "json_object"}
+    return None
+
+
+def _finish_reason(resp: Any) -> Optional[str]:
+    """Return "length" if any choice was truncated, else the first finish reason."""
+    try:
+        reasons = [choice.finish_reason for choice in resp.choices]
+    except Exception:
+        return None
+    if "length" in reasons:
+        return "length"
+    return reasons[0] if reasons else None
+
+
 async def log_batch_calls(
     *,
     model_name: str,
     full_contexts: List[List[Dict[str, str]]],
     outputs: List[List[str]],
     temperature: float,
-    max_tokens: int,
+    max_tokens: Union[int, Sequence[int]],
     n: int,
+    stage: Optional[str] = None,
+    usages: Optional[List[Dict[str, Any]]] = None,
+    reasoning_effort: Optional[str] = None,
 ) -> None:
     log_entries = []
-    for context, out in zip(full_contexts, outputs):
+    usages = usages or [{} for _ in full_contexts]
+    budgets = list(max_tokens) if isinstance(max_tokens, (list, tuple)) else [max_tokens] * len(full_contexts)
+    for context, out, usage, budget in zip(full_contexts, outputs, usages, budgets):
         system_prompt = ""
         user_prompt = ""
         for msg in context:
@@ -163,8 +293,11 @@ async def log_batch_calls(
                 messages=context,
                 output=out,
                 temperature=temperature,
-                max_tokens=max_tokens,
+                max_tokens=budget,
                 n=n,
+                stage=stage,
+                usage=usage,
+                reasoning_effort=reasoning_effort,
             )
         )
     await log_llm_calls(log_entries)
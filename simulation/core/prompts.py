@@ -2,7 +2,10 @@
 
 from __future__ import annotations
 
-from typing import Dict
+import glob
+import os
+import string
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 
 def load_prompt(path: str) -> str:
@@ -13,3 +16,125 @@ def load_prompt(path: str) -> str:
 def format_prompt(template: str, values: Dict[str, str]) -> str:
     return template.format(**values)
 
+
+
+def template_fields(template: str) -> List[str]:
+    """Return the placeholder names used by a str.format template."""
+    fields = []
+    for _, field_name, _, _ in string.Formatter().parse(template):
+        if field_name and field_name not in fields:
+            fields.append(field_name)
+    return fields
+
+
+def split_template_for_caching(template: str, volatile_fields: Iterable[str]) -> Tuple[str, str]:
+    """
+    Split a prompt template at its top-level "# " headings into a static and a
+    volatile part. Sections that reference any volatile placeholder go to the
+    volatile part; everything else keeps its relative order in the static part.
+    """
+    volatile = set(volatile_fields)
+    sections: List[List[str]] = [[]]
+    for line in template.splitlines(keepends=True):
+        if line.startswith("# ") and sections[-1]:
+            sections.append([])
+        sections[-1].append(line)
+
+    static_parts: List[str] = []
+    volatile_parts: List[str] = []
+    for lines in sections:
+        section = "".join(lines)
+        if volatile.intersection(template_fields(section)):
+            volatile_parts.append(section)
+        else:
+            static_parts.append(section)
+    return "".join(static_parts).strip() + "\n", "".join(volatile_parts).strip() + "\n"
+
+
+class CompiledPrompt:
+    """
+    A str.format template parsed once into literal/placeholder pieces, so
+    rendering is a join over the pieces instead of a full re-parse.
+    """
+
+    __slots__ = ("name", "text", "fields", "_pieces")
+
+    def __init__(self, text: str, name: str = "") -> None:
+        self.name = name
+        self.text = text
+        self._pieces = list(string.Formatter().parse(text))
+        self.fields = template_fields(text)
+
+    def render(self, values: Dict[str, Any]) -> str:
+        parts: List[str] = []
+        for literal, field_name, format_spec, conversion in self._pieces:
+            parts.append(literal)
+            if field_name is None:
+                continue
+            if "." in field_name or "[" in field_name:
+                return self.text.format(**values)
+            value = values[field_name]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "a":
+                value = ascii(value)
+            elif conversion == "s":
+                value = str(value)
+            parts.append(format(value, format_spec or ""))
+        return "".join(parts)
+
+    def format(self, **values: Any) -> str:
+        return self.render(values)
+
+
+class PromptRegistry:
+    """All templates under a prompts directory, loaded and compiled once."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.prompts: Dict[str, CompiledPrompt] = {}
+        self.errors: Dict[str, str] = {}
+        for path in sorted(glob.glob(os.path.join(root, "*.txt"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            try:
+                self.prompts[name] = _cache_prompt(path, load_prompt(path), name)
+            except ValueError as e:
+                self.errors[name] = f"unparsable template: {e}"
+
+    def get(self, name: str) -> CompiledPrompt:
+        if name in self.errors:
+            raise ValueError(f"Prompt {name}: {self.errors[name]}")
+        return self.prompts[name]
+
+    def check(self, name: str, supplied: Iterable[str]) -> List[str]:
+        """Problems with a template given the placeholder values its call site supplies."""
+        if name in self.errors:
+            return [f"{name}: {self.errors[name]}"]
+        if name not in self.prompts:
+            return [f"{name}: template not found under {self.root}"]
+        missing = [field for field in self.prompts[name].fields if field not in set(supplied)]
+        return [f"{name}: placeholder {{{field}}} is not supplied by its call site" for field in missing]
+
+    def validate(self, call_sites: Dict[str, Iterable[str]]) -> List[str]:
+        problems = [f"{name}: {error}" for name, error in self.errors.items() if name not in call_sites]
+        for name, supplied in call_sites.items():
+            problems.extend(self.check(name, supplied))
+        return problems
+
+
+_COMPILED: Dict[str, CompiledPrompt] = {}
+
+
+def _cache_prompt(path: str, text: str, name: str) -> CompiledPrompt:
+    compiled = CompiledPrompt(text, name)
+    _COMPILED[os.path.abspath(path)] = compiled
+    return compiled
+
+
+def get_prompt(path: str) -> CompiledPrompt:
+    """Compiled template for a path, read from disk only the first time."""
+    compiled: Optional[CompiledPrompt] = _COMPILED.get(os.path.abspath(path))
+    if compiled is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+        compiled = _cache_prompt(path, load_prompt(path), name)
+    return compiled
@@ -0,0 +1,64 @@
+"""Per-stage reasoning-effort profiles for reasoning models."""
+
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+REASONING_MODELS = ["gpt-5", "gpt-5-mini", "gpt-5-nano"]
+THINKING_MODELS = ["gpt-5-thinking", "gpt-5-mini-thinking", "gpt-5-nano-thinking"]
+
+# Named profiles map a stage (or "*" for any stage) to a reasoning effort.
+# The empty "default" profile keeps the model-name rule: "minimal" for gpt-5*,
+# "medium" for the *-thinking aliases.
+REASONING_PROFILES: Dict[str, Dict[str, str]] = {
+    "default": {},
+    "fast": {"*": "minimal"},
+    "balanced": {
+        "user": "minimal",
+        "assistant": "low",
+        "knowledge_extract": "minimal",
+        "knowledge_update": "low",
+        "iu_graph": "medium",
+    },
+    "thorough": {"*": "medium", "user": "low"},
+}
+
+
+def parse_reasoning_profile(spec: str) -> Dict[str, str]:
+    """
+    Parse a profile name ("balanced") or explicit stage overrides
+    ("user=minimal,assistant=medium", "*" matches any stage).
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        return {}
+    if spec in REASONING_PROFILES:
+        return dict(REASONING_PROFILES[spec])
+    profile: Dict[str, str] = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            raise ValueError(f"Unknown reasoning profile: {spec}")
+        stage, effort = part.split("=", 1)
+        profile[stage.strip()] = effort.strip()
+    return profile
+
+
+def default_reasoning_effort(model_name: str) -> Optional[str]:
+    if model_name in REASONING_MODELS:
+        return "minimal"
+    if model_name in THINKING_MODELS:
+        return "medium"
+    return None
+
+
+def resolve_reasoning_effort(
+    model_name: str,
+    stage: Optional[str],
+    profile: Optional[Dict[str, str]] = None,
+) -> Optional[str]:
+    """Effort for a call, or None for models that do not accept reasoning_effort."""
+    default = default_reasoning_effort(model_name)
+    if default is None:
+        return None
+    profile = profile or {}
+    return profile.get(stage or "", profile.get("*", default))
@@ -0,0 +1,223 @@
+"""Per-stage accounting of LLM token usage."""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+
+@dataclass
+class StageUsage:
+    """Aggregated usage for one pipeline stage."""
+
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    latency_s: float = 0.0
+    truncated: int = 0
+    retries: int = 0
+    output_tokens: List[int] = field(default_factory=list)
+    latencies: List[float] = field(default_factory=list)
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+@dataclass
+class StageParsing:
+    """Structured-output parsing outcomes for one stage."""
+
+    parsed: int = 0
+    failed: int = 0
+    retried: int = 0
+
+
+@dataclass
+class StagePacking:
+    """Requests sent by a packed stage against the one-item-per-request equivalent."""
+
+    calls: int = 0
+    fallback_calls: int = 0
+    unpacked_calls: int = 0
+    prompt_chars: int = 0
+    unpacked_prompt_chars: int = 0
+
+
+_USAGE: Dict[str, StageUsage] = {}
+_PARSING: Dict[str, StageParsing] = {}
+_PACKING: Dict[str, StagePacking] = {}
+# Rough characters per prompt token, used to express packing savings in tokens.
+CHARS_PER_TOKEN = 4
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile; 0 for an empty sequence."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def usage_from_response(resp: Any) -> Dict[str, int]:
+    """Read prompt/cached/completion token counts from a chat completion."""
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) if details is not None else 0
+    return {
+        "prompt_tokens": int(getattr(usage, "prompt_tokens", 0) or 0),
+        "cached_tokens": int(cached or 0),
+        "completion_tokens": int(getattr(usage, "completion_tokens", 0) or 0),
+    }
+
+
+def record_usage(
+    stage: Optional[str],
+    *,
+    prompt_tokens: int,
+    cached_tokens: int,
+    completion_tokens: int,
+    latency_s: float,
+    finish_reason: Optional[str] = None,
+    retry: bool = False,
+) -> None:
+    stats = _USAGE.setdefault(stage or "unlabeled", StageUsage())
+    stats.calls += 1
+    stats.prompt_tokens += prompt_tokens
+    stats.cached_tokens += cached_tokens
+    stats.completion_tokens += completion_tokens
+    stats.latency_s += latency_s
+    stats.output_tokens.append(completion_tokens)
+    stats.latencies.append(latency_s)
+    if finish_reason == "length":
+        stats.truncated += 1
+    if retry:
+        stats.retries += 1
+
+
+def record_parse(stage: str, ok: bool, retry: bool = False) -> None:
+    """Count one attempt to parse a stage's JSON output; `retry` marks a re-issued call."""
+    stats = _PARSING.setdefault(stage, StageParsing())
+    if ok:
+        stats.parsed += 1
+    else:
+        stats.failed += 1
+    if retry:
+        stats.retried += 1
+
+
+def record_packing(
+    stage: str,
+    *,
+    calls: int,
+    fallback_calls: int,
+    unpacked_calls: int,
+    prompt_chars: int,
+    unpacked_prompt_chars: int,
+) -> None:
+    """
+    Count one packed batch: `calls` packed requests plus `fallback_calls` single-item
+    retries, against `unpacked_calls` requests of `unpacked_prompt_chars` in total.
+    """
+    stats = _PACKING.setdefault(stage, StagePacking())
+    stats.calls += calls
+    stats.fallback_calls += fallback_calls
+    stats.unpacked_calls += unpacked_calls
+    stats.prompt_chars += prompt_chars
+    stats.unpacked_prompt_chars += unpacked_prompt_chars
+
+
+def packing_summary() -> Dict[str, Dict[str, Any]]:
+    summary = {}
+    for stage, stats in sorted(_PACKING.items()):
+        sent = stats.calls + stats.fallback_calls
+        summary[stage] = {
+            "calls": stats.calls,
+            "fallback_calls": stats.fallback_calls,
+            "unpacked_calls": stats.unpacked_calls,
+            "call_reduction": round(1 - sent / stats.unpacked_calls, 4) if stats.unpacked_calls else 0.0,
+            "est_prompt_tokens": stats.prompt_chars // CHARS_PER_TOKEN,
+            "est_unpacked_prompt_tokens": stats.unpacked_prompt_chars // CHARS_PER_TOKEN,
+            "prompt_reduction": (
+                round(1 - stats.prompt_chars / stats.unpacked_prompt_chars, 4)
+                if stats.unpacked_prompt_chars
+                else 0.0
+            ),
+        }
+    return summary
+
+
+def parse_summary() -> Dict[str, Dict[str, Any]]:
+    summary = {}
+    for stage, stats in sorted(_PARSING.items()):
+        attempts = stats.parsed + stats.failed
+        summary[stage] = {
+            "parsed": stats.parsed,
+            "failed": stats.failed,
+            "failure_rate": round(stats.failed / attempts, 4) if attempts else 0.0,
+            "retried": stats.retried,
+            "retry_rate": round(stats.retried / attempts, 4) if attempts else 0.0,
+        }
+    return summary
+
+
+def usage_summary() -> Dict[str, Dict[str, Any]]:
+    return {
+        stage: {
+            "calls": stats.calls,
+            "prompt_tokens": stats.prompt_tokens,
+            "cached_tokens": stats.cached_tokens,
+            "cache_hit_rate": round(stats.cache_hit_rate, 4),
+            "completion_tokens": stats.completion_tokens,
+            "p50_output_tokens": percentile(stats.output_tokens, 50),
+            "p95_output_tokens": percentile(stats.output_tokens, 95),
+            "truncated": stats.truncated,
+            "truncation_rate": round(stats.truncated / stats.calls, 4) if stats.calls else 0.0,
+            "retries": stats.retries,
+            "mean_latency_s": round(stats.latency_s / stats.calls, 3) if stats.calls else 0.0,
+            "p95_latency_s": round(percentile(stats.latencies, 95), 3),
+        }
+        for stage, stats in sorted(_USAGE.items())
+    }
+
+
+def format_usage_summary() -> str:
+    lines = ["stage                        calls   prompt   cached  hit%   completion   p50   p95  trunc%  retries"]
+    for stage, row in usage_summary().items():
+        lines.append(
+            f"{stage:<28} {row['calls']:>5} {row['prompt_tokens']:>8} {row['cached_tokens']:>8} "
+            f"{row['cache_hit_rate'] * 100:>5.1f} {row['completion_tokens']:>12} "
+            f"{row['p50_output_tokens']:>5} {row['p95_output_tokens']:>5} "
+            f"{row['truncation_rate'] * 100:>6.1f} {row['retries']:>8}"
+        )
+    parsing = parse_summary()
+    if parsing:
+        lines.append("")
+        lines.append("stage                       parsed   failed  fail%  retried  retry%")
+        for stage, row in parsing.items():
+            lines.append(
+                f"{stage:<28} {row['parsed']:>6} {row['failed']:>8} {row['failure_rate'] * 100:>6.1f} "
+                f"{row['retried']:>8} {row['retry_rate'] * 100:>7.1f}"
+            )
+    packing = packing_summary()
+    if packing:
+        lines.append("")
+        lines.append("stage                       packed fallback unpacked  calls-%  ~prompt  ~unpacked prompt-%")
+        for stage, row in packing.items():
+            lines.append(
+                f"{stage:<28} {row['calls']:>5} {row['fallback_calls']:>8} {row['unpacked_calls']:>8} "
+                f"{row['call_reduction'] * 100:>8.1f} {row['est_prompt_tokens']:>8} "
+                f"{row['est_unpacked_prompt_tokens']:>10} {row['prompt_reduction'] * 100:>8.1f}"
+            )
+    return "\n".join(lines)
+
+
+def reset_usage() -> None:
+    _USAGE.clear()
+    _PARSING.clear()
+    _PACKING.clear()
@@ -0,0 +1,244 @@
+"""Byte-offset index over a CSV file for random access, sharding and sampling."""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+from array import array
+from typing import Dict, Iterator, List, Optional, Protocol, Sequence, Tuple
+
+STRATA_COLUMNS = ("level", "type")
+INDEX_VERSION = 1
+
+
+class RowStrata(Protocol):
+    """What row selection needs from a source: its row count and each row's stratum."""
+
+    def __len__(self) -> int: ...
+
+    def stratum(self, i: int, by: Sequence[str]) -> Tuple[str, ...]: ...
+
+
+def _parse_row(text: str) -> List[str]:
+    # Same newline handling as csv over a text-mode file (universal newlines).
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return next(csv.reader(io.StringIO(text)), [])
+
+
+class CsvIndex:
+    """
+    Start offsets of every data row of a CSV file, found by tracking quote parity
+    line by line, so quoted fields may span lines. Rows are parsed only when read.
+    The `level` / `type` values of each row are kept (dictionary-encoded) for
+    stratified sampling.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fieldnames: List[str],
+        offsets: array,
+        end: int,
+        strata: Dict[str, Tuple[List[str], array]],
+    ) -> None:
+        self.path = path
+        self.fieldnames = fieldnames
+        self.offsets = offsets
+        self.end = end
+        # column -> (distinct values, per-row code into them)
+        self.strata = strata
+        self._file = None
+
+    @classmethod
+    def build(cls, path: str) -> "CsvIndex":
+        offsets = array("q")
+        strata_values: Dict[str, Dict[str, int]] = {}
+        strata_codes: Dict[str, array] = {}
+        with open(path, "rb") as f:
+            header = b""
+            position = 0
+            in_quotes = False
+            for line in f:
+                header += line
+                position += len(line)
+                in_quotes ^= line.count(b'"') % 2 == 1
+                if not in_quotes:
+                    break
+            fieldnames = _parse_row(header.decode("utf-8-sig"))
+            columns = {name: i for i, name in enumerate(fieldnames) if name in STRATA_COLUMNS}
+            for name in columns:
+                strata_values[name] = {}
+                strata_codes[name] = array("i")
+
+            row_start = position
+            row = b""
+            for line in f:
+                if not in_quotes:
+                    row_start = position
+                    row = b""
+                position += len(line)
+                row += line
+                in_quotes ^= line.count(b'"') % 2 == 1
+                if in_quotes or not row.strip():
+                    continue
+                offsets.append(row_start)
+                if columns:
+                    values = _parse_row(row.decode("utf-8"))
+                    for name, column in columns.items():
+                        value = values[column] if column < len(values) else ""
+                        codes = strata_values[name]
+                        strata_codes[name].append(codes.setdefault(value, len(codes)))
+            end = position
+        strata = {name: (list(strata_values[name]), strata_codes[name]) for name in columns}
+        return cls(path, fieldnames, offsets, end, strata)
+
+    @classmethod
+    def load_or_build(cls, path: str, cache_dir: str = os.path.join("cache", "csv_index")) -> "CsvIndex":
+        """The cached index for `path` if the file is unchanged, else a fresh one (then cached)."""
+        stat = os.stat(path)
+        digest = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+        cache_path = os.path.join(cache_dir, f"{os.path.basename(path)}.{digest}.json")
+        signature = {"version": INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("signature") == signature:
+                return cls(
+                    path,
+                    cached["fieldnames"],
+                    array("q", cached["offsets"]),
+                    cached["end"],
+                    {name: (values, array("i", codes)) for name, (values, codes) in cached["strata"].items()},
+                )
+        index = cls.build(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "signature": signature,
+                    "fieldnames": index.fieldnames,
+                    "offsets": index.offsets.tolist(),
+                    "end": index.end,
+                    "strata": {name: [values, codes.tolist()] for name, (values, codes) in index.strata.items()},
+                },
+                f,
+                separators=(",", ":"),
+            )
+        return index
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def row(self, i: int) -> Dict[str, str]:
+        """Row i (0-based, header excluded) as a dict, read with one seek."""
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        start = self.offsets[i]
+        stop = self.offsets[i + 1] if i + 1 < len(self.offsets) else self.end
+        self._file.seek(start)
+        values = _parse_row(self._file.read(stop - start).decode("utf-8"))
+        return dict(zip(self.fieldnames, values))
+
+    def rows(self, indices: Sequence[int]) -> Iterator[Tuple[int, Dict[str, str]]]:
+        """(index, row) pairs in the given order; the file is closed when iteration ends."""
+        try:
+            for i in indices:
+                yield i, self.row(i)
+        finally:
+            self.close()
+
+    def stratum(self, i: int, by: Sequence[str]) -> Tuple[str, ...]:
+        return tuple(self.strata[name][0][self.strata[name][1][i]] for name in by if name in self.strata)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parse "k/N" (1-based) into (k, N)."""
+    try:
+        k, n = (int(part) for part in spec.split("/", 1))
+    except ValueError:
+        raise ValueError(f"Invalid shard (expected k/N): {spec}") from None
+    if n < 1 or not 1 <= k <= n:
+        raise ValueError(f"Invalid shard (expected 1 <= k <= N): {spec}")
+    return k, n
+
+
+def shard_indices(indices: Sequence[int], shard: Tuple[int, int]) -> List[int]:
+    """The k-th of N contiguous, near-equal blocks of `indices`."""
+    k, n = shard
+    total = len(indices)
+    return list(indices[total * (k - 1) // n: total * k // n])
+
+
+def stratified_sample(
+    index: RowStrata,
+    indices: Sequence[int],
+    size: int,
+    by: Sequence[str],
+    seed: int,
+) -> List[int]:
+    """
+    `size` of `indices`, allocated to the strata (combinations of the `by` columns)
+    in proportion to their sizes by largest remainder, drawn at random within each
+    stratum and returned in file order.
+    """
+    if size >= len(indices):
+        return list(indices)
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for i in indices:
+        groups.setdefault(index.stratum(i, by), []).append(i)
+    keys = sorted(groups)
+    quotas = {key: size * len(groups[key]) / len(indices) for key in keys}
+    counts = {key: int(quotas[key]) for key in keys}
+    leftover = size - sum(counts.values())
+    for key in sorted(keys, key=lambda key: (counts[key] - quotas[key], key))[:leftover]:
+        counts[key] += 1
+    rng = random.Random(seed)
+    chosen: List[int] = []
+    for key in keys:
+        chosen.extend(rng.sample(groups[key], counts[key]))
+    return sorted(chosen)
+
+
+def select_rows(
+    index: RowStrata,
+    *,
+    where: Optional[Dict[str, Sequence[str]]] = None,
+    shard: Optional[str] = None,
+    offset: int = 0,
+    limit: int = -1,
+    sample: int = 0,
+    stratify: Sequence[str] = STRATA_COLUMNS,
+    seed: int = 0,
+) -> List[int]:
+    """
+    Row indices after filtering (`where`: column -> accepted values), stratified
+    sampling, sharding and offset/limit, in that order.
+    """
+    indices: Sequence[int] = range(len(index))
+    for name, values in (where or {}).items():
+        accepted = {(value,) for value in values}
+        indices = [i for i in indices if index.stratum(i, (name,)) in accepted]
+    if sample > 0:
+        indices = stratified_sample(index, indices, sample, stratify, seed)
+    if shard:
+        indices = shard_indices(indices, parse_shard(shard))
+    indices = list(indices[offset:])
+    return indices[:limit] if limit >= 0 else indices
+
+
+def describe_selection(index: RowStrata, indices: Sequence[int], by: Sequence[str]) -> str:
+    counts: Dict[Tuple[str, ...], int] = {}
+    for i in indices:
+        key = index.stratum(i, by)
+        counts[key] = counts.get(key, 0) + 1
+    parts = [f"{' / '.join(key) or 'all'}: {count}" for key, count in sorted(counts.items())]
+    return f"Selected {len(indices)} of {len(index)} rows ({', '.join(parts)})"
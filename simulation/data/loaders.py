@@ -4,7 +4,7 @@ from __future__ import annotations
 
 import json
 import csv
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List
 
 
 def load_json(path: str) -> Any:
@@ -21,3 +21,9 @@ def load_csv_rows(path: str) -> List[Dict[str, Any]]:
         reader = csv.DictReader(f)
         return [row for row in reader]
 
+
+
+def iter_csv_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield CSV rows one at a time instead of loading the whole file."""
+    with open(path, "r", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
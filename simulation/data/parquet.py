@@ -0,0 +1,87 @@
+"""Direct Parquet input with filter pushdown and column projection (needs pyarrow)."""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+ROW_COLUMNS = ("problem", "solution", "level", "type")
+
+
+class ParquetRows:
+    """
+    Rows of a Parquet file (or directory of files), optionally restricted to some
+    `level` / `type` values. The filter is pushed down to pyarrow, so row groups
+    whose statistics exclude it are skipped, and only `columns` are decoded.
+    Row indices count the rows that pass the filter, in file order.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        levels: Sequence[str] = (),
+        types: Sequence[str] = (),
+        columns: Sequence[str] = ROW_COLUMNS,
+        batch_size: int = 1024,
+    ) -> None:
+        try:
+            import pyarrow.dataset as ds
+        except ImportError as e:
+            raise ImportError("Reading Parquet input requires pyarrow (pip install pyarrow).") from e
+        self.path = path
+        self._dataset = ds.dataset(path, format="parquet")
+        available = set(self._dataset.schema.names)
+        self.columns = [name for name in columns if name in available]
+        self.batch_size = batch_size
+        self._filter = None
+        for name, values in (("level", levels), ("type", types)):
+            if values:
+                if name not in available:
+                    raise ValueError(f"{path} has no '{name}' column to filter on")
+                condition = ds.field(name).isin(list(values))
+                self._filter = condition if self._filter is None else self._filter & condition
+        self._count: Optional[int] = None
+        self._strata: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        if self._count is None:
+            self._count = self._dataset.count_rows(filter=self._filter)
+        return self._count
+
+    def stratum(self, i: int, by: Sequence[str]) -> Tuple[str, ...]:
+        """Values of the `by` columns for row i; only those columns are ever read for this."""
+        missing = [name for name in by if name in self.columns and name not in self._strata]
+        if missing:
+            table = self._dataset.to_table(columns=missing, filter=self._filter)
+            for name in missing:
+                self._strata[name] = [str(value) for value in table.column(name).to_pylist()]
+        return tuple(self._strata[name][i] for name in by if name in self._strata)
+
+    def rows(self, indices: Optional[Sequence[int]] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        (index, row) pairs streamed batch by batch. With `indices` only those rows are
+        converted, in ascending order, and reading stops after the last one.
+        """
+        order = sorted(set(indices)) if indices is not None else None
+        if order is not None and not order:
+            return
+        k = 0
+        position = 0
+        for batch in self._dataset.to_batches(
+            columns=self.columns, filter=self._filter, batch_size=self.batch_size
+        ):
+            end = position + batch.num_rows
+            if order is None:
+                picks = list(range(batch.num_rows))
+                rows = batch.to_pylist()
+            else:
+                picks = []
+                while k < len(order) and order[k] < end:
+                    picks.append(order[k] - position)
+                    k += 1
+                rows = batch.take(picks).to_pylist() if picks else []
+            for pick, row in zip(picks, rows):
+                yield position + pick, {key: "" if value is None else str(value) for key, value in row.items()}
+            if order is not None and k == len(order):
+                return
+            position = end
@@ -3,8 +3,12 @@
 from __future__ import annotations
 
 import json
-import re
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+
+from ..core.jsonparse import parse_json_object
+from ..core.usage import record_packing, record_parse
+from .concept_kb import ConceptKB
+from .graph import normalize_concept_name
 
 
 def format_concept_list_with_prerequisites(concepts: List[Dict[str, Any]]) -> str:
@@ -18,38 +22,86 @@ def format_concept_list_with_prerequisites(concepts: List[Dict[str, Any]]) -> st
     return "\n".join(lines)
 
 
+def _prereq_prompt(item: Dict[str, Any], existing_names: List[str]) -> str:
+    return (
+        "You are given a target concept from a math problem.\n"
+        "Generate 1-3 prerequisite concepts that are more foundational.\n"
+        "Return JSON in this format:\n"
+        "{\n"
+        '  "prerequisites": [\n'
+        '    {"concept_id": "Prereq 1", "description": "Short description"},\n'
+        '    {"concept_id": "Prereq 2", "description": "Short description"}\n'
+        "  ]\n"
+        "}\n"
+        "Rules:\n"
+        "- Do not include the target concept itself.\n"
+        "- Keep descriptions short and factual.\n"
+        "- Avoid duplicates with the existing concept list unless truly necessary.\n"
+        f"Target concept: {item['concept_id']}\n"
+        f"Target description: {item['description']}\n"
+        f"Existing concepts: {json.dumps(existing_names, ensure_ascii=False)}"
+    )
+
+
+def _packed_prereq_prompt(items: List[Dict[str, Any]], existing_names: List[str]) -> str:
+    targets = [{"concept_id": item["concept_id"], "description": item["description"]} for item in items]
+    return (
+        "You are given target concepts from a math problem.\n"
+        "For each target concept, generate 1-3 prerequisite concepts that are more foundational.\n"
+        "Return JSON in this format, with one key per target concept:\n"
+        "{\n"
+        '  "prerequisites": {\n'
+        '    "Target concept": [\n'
+        '      {"concept_id": "Prereq 1", "description": "Short description"},\n'
+        '      {"concept_id": "Prereq 2", "description": "Short description"}\n'
+        "    ]\n"
+        "  }\n"
+        "}\n"
+        "Rules:\n"
+        "- Use every target concept name exactly as given as a key.\n"
+        "- Do not list a target concept as its own prerequisite.\n"
+        "- Keep descriptions short and factual.\n"
+        "- Avoid duplicates with the existing concept list unless truly necessary.\n"
+        f"Target concepts:\n{json.dumps(targets, indent=2, ensure_ascii=False)}\n"
+        f"Existing concepts: {json.dumps(existing_names, ensure_ascii=False)}"
+    )
+
+
 async def build_concept_graph_from_extracted(
     extracted_concepts: Dict[str, Dict[str, Any]],
     *,
     model_client: Any,
     max_tokens: int = 800,
     show_progress: bool = False,
+    pack_size: int = 1,
+    kb: Optional[ConceptKB] = None,
 ) -> Dict[str, List[Dict[str, Any]]]:
     """
     Build a concept graph from extracted concepts (two-step LLM process).
-    """
-    def _normalize(name: str) -> str:
-        return re.sub(r"\s+", " ", (name or "").strip().lower())
 
+    Step 2 sends one request per concept by default. With `pack_size` 0 it asks for
+    all of a problem's concepts in one request, with N > 1 for chunks of N, and the
+    reply is a map keyed by concept name. Concepts missing from a packed reply are
+    asked for one at a time. Call and prompt-size savings go to the usage summary.
+
+    With a `kb`, concepts already in the knowledge base take their stored prerequisites
+    instead of a generation call, and newly generated ones are added to it.
+    """
     def _append_prereq(item: Dict[str, Any], prereq_name: str) -> None:
         if not prereq_name:
             return
         if prereq_name not in item["prerequisites"]:
             item["prerequisites"].append(prereq_name)
 
-    def _extract_json_object(text: str) -> Dict[str, Any]:
-        if not text:
-            return {}
-        match = re.search(r"\{.*\}", text, re.DOTALL)
-        if not match:
-            return {}
-        try:
-            return json.loads(match.group(0))
-        except json.JSONDecodeError:
-            return {}
+    def _parse(stage: str, response: List[str]) -> Dict[str, Any]:
+        parsed = parse_json_object(response[0] if response else "", accept=lambda obj: "prerequisites" in obj)
+        record_parse(stage, parsed is not None)
+        return parsed or {}
 
     concept_graph: Dict[str, List[Dict[str, Any]]] = {}
     original_concepts_by_problem: Dict[str, List[Dict[str, Any]]] = {}
+    # Normalized name -> item per problem, kept up to date as prerequisites are added.
+    items_by_norm: Dict[str, Dict[str, Dict[str, Any]]] = {}
 
     for problem_id, payload in extracted_concepts.items():
         concepts = payload.get("extracted_concepts", [])
@@ -67,6 +119,7 @@ async def build_concept_graph_from_extracted(
             )
         concept_graph[problem_id] = items
         original_concepts_by_problem[problem_id] = list(items)
+        items_by_norm[problem_id] = {normalize_concept_name(item["concept_id"]): item for item in items}
 
     # Step 1: Check prerequisite relations among existing concepts
     relation_contexts: List[List[Dict[str, str]]] = []
@@ -103,53 +156,145 @@ async def build_concept_graph_from_extracted(
             temperature=0.2,
             max_tokens=max_tokens,
             show_progress=show_progress,
+            stage="concept_relations",
         )
         for problem_id, response in zip(relation_problem_ids, relation_responses):
-            parsed = _extract_json_object(response[0] if response else "")
+            parsed = _parse("concept_relations", response)
             prereq_map = parsed.get("prerequisites", {}) if isinstance(parsed, dict) else {}
             if not isinstance(prereq_map, dict):
                 continue
-            item_by_norm = {
-                _normalize(item["concept_id"]): item
-                for item in concept_graph.get(problem_id, [])
-            }
+            item_by_norm = items_by_norm[problem_id]
             for concept_name, prereqs in prereq_map.items():
-                concept_item = item_by_norm.get(_normalize(concept_name))
+                concept_item = item_by_norm.get(normalize_concept_name(concept_name))
                 if not concept_item or not isinstance(prereqs, list):
                     continue
                 for prereq in prereqs:
                     prereq_name = str(prereq).strip()
                     if not prereq_name:
                         continue
-                    if _normalize(prereq_name) in item_by_norm and _normalize(prereq_name) != _normalize(concept_name):
+                    prereq_norm = normalize_concept_name(prereq_name)
+                    if prereq_norm in item_by_norm and prereq_norm != normalize_concept_name(concept_name):
                         _append_prereq(concept_item, prereq_name)
 
+    model_name = getattr(model_client, "model_name", "")
+
+    def _add_generated(problem_id: str, target_name: str, prereq_items: Any) -> None:
+        if not isinstance(prereq_items, list):
+            return
+        concept_items = concept_graph.get(problem_id, [])
+        item_by_norm = items_by_norm[problem_id]
+        target_norm = normalize_concept_name(target_name)
+        target_item = item_by_norm.get(target_norm)
+        if not target_item:
+            return
+        for prereq in prereq_items:
+            if not isinstance(prereq, dict):
+                continue
+            prereq_name = str(prereq.get("concept_id", "")).strip()
+            prereq_norm = normalize_concept_name(prereq_name)
+            if not prereq_name or prereq_norm == target_norm:
+                continue
+            prereq_desc = str(prereq.get("description", "")).strip()
+            existing_item = item_by_norm.get(prereq_norm)
+            if existing_item is None:
+                new_item = {
+                    "concept_id": prereq_name,
+                    "description": prereq_desc,
+                    "prerequisites": [],
+                }
+                concept_items.append(new_item)
+                item_by_norm[prereq_norm] = new_item
+                existing_item = new_item
+            _append_prereq(target_item, existing_item["concept_id"])
+
+    def _remember(item: Dict[str, Any], prereq_items: Any) -> None:
+        if kb is None or not isinstance(prereq_items, list):
+            return
+        stored = [
+            {"concept_id": str(p.get("concept_id", "")).strip(), "description": str(p.get("description", "")).strip()}
+            for p in prereq_items
+            if isinstance(p, dict) and str(p.get("concept_id", "")).strip()
+        ]
+        if stored:
+            kb.put(item["concept_id"], item["description"], stored, model_name)
+
     # Step 2: Generate 1-3 prerequisite concepts for each original concept
-    gen_contexts: List[List[Dict[str, str]]] = []
-    gen_meta: List[Dict[str, str]] = []
+    to_generate: Dict[str, List[Dict[str, Any]]] = {}
     for problem_id, items in original_concepts_by_problem.items():
-        existing_names = [item["concept_id"] for item in concept_graph.get(problem_id, [])]
+        to_generate[problem_id] = []
         for item in items:
-            prompt = (
-                "You are given a target concept from a math problem.\n"
-                "Generate 1-3 prerequisite concepts that are more foundational.\n"
-                "Return JSON in this format:\n"
-                "{\n"
-                '  "prerequisites": [\n'
-                '    {"concept_id": "Prereq 1", "description": "Short description"},\n'
-                '    {"concept_id": "Prereq 2", "description": "Short description"}\n'
-                "  ]\n"
-                "}\n"
-                "Rules:\n"
-                "- Do not include the target concept itself.\n"
-                "- Keep descriptions short and factual.\n"
-                "- Avoid duplicates with the existing concept list unless truly necessary.\n"
-                f"Target concept: {item['concept_id']}\n"
-                f"Target description: {item['description']}\n"
-                f"Existing concepts: {json.dumps(existing_names, ensure_ascii=False)}"
+            known = kb.get(item["concept_id"], model_name) if kb is not None else None
+            if known is None:
+                to_generate[problem_id].append(item)
+            else:
+                _add_generated(problem_id, item["concept_id"], known["prerequisites"])
+    existing_names_by_problem = {
+        problem_id: [item["concept_id"] for item in concept_graph.get(problem_id, [])]
+        for problem_id in original_concepts_by_problem
+    }
+    gen_contexts: List[List[Dict[str, str]]] = []
+    gen_meta: List[tuple[str, Dict[str, Any]]] = []
+
+    def _queue_single(problem_id: str, item: Dict[str, Any]) -> None:
+        prompt = _prereq_prompt(item, existing_names_by_problem[problem_id])
+        gen_contexts.append([{"role": "user", "content": prompt}])
+        gen_meta.append((problem_id, item))
+
+    if pack_size == 1:
+        for problem_id, items in to_generate.items():
+            for item in items:
+                _queue_single(problem_id, item)
+    else:
+        packed_contexts: List[List[Dict[str, str]]] = []
+        packed_meta: List[tuple[str, List[Dict[str, Any]]]] = []
+        for problem_id, items in to_generate.items():
+            step = pack_size if pack_size > 1 else max(len(items), 1)
+            for start in range(0, len(items), step):
+                chunk = items[start:start + step]
+                prompt = _packed_prereq_prompt(chunk, existing_names_by_problem[problem_id])
+                packed_contexts.append([{"role": "user", "content": prompt}])
+                packed_meta.append((problem_id, chunk))
+
+        if packed_contexts:
+            packed_responses = await model_client.generate_responses(
+                packed_contexts,
+                temperature=0.6,
+                # A packed reply covers several concepts; an overlong one just falls back.
+                max_tokens=max_tokens * max(len(chunk) for _, chunk in packed_meta),
+                show_progress=show_progress,
+                stage="concept_prereqs_packed",
             )
-            gen_contexts.append([{"role": "user", "content": prompt}])
-            gen_meta.append({"problem_id": problem_id, "concept_id": item["concept_id"]})
+            for (problem_id, chunk), response in zip(packed_meta, packed_responses):
+                parsed = parse_json_object(
+                    response[0] if response else "",
+                    accept=lambda obj: isinstance(obj.get("prerequisites"), dict),
+                )
+                record_parse("concept_prereqs_packed", parsed is not None)
+                answered: Dict[str, Any] = {}
+                for key, value in ((parsed or {}).get("prerequisites") or {}).items():
+                    if isinstance(value, list):
+                        answered.setdefault(normalize_concept_name(key), value)
+                for item in chunk:
+                    prereq_items = answered.get(normalize_concept_name(item["concept_id"]))
+                    if prereq_items is None:
+                        _queue_single(problem_id, item)
+                    else:
+                        _add_generated(problem_id, item["concept_id"], prereq_items)
+                        _remember(item, prereq_items)
+
+        unpacked_prompts = [
+            _prereq_prompt(item, existing_names_by_problem[problem_id])
+            for problem_id, items in to_generate.items()
+            for item in items
+        ]
+        record_packing(
+            "concept_prereqs",
+            calls=len(packed_contexts),
+            fallback_calls=len(gen_contexts),
+            unpacked_calls=len(unpacked_prompts),
+            prompt_chars=sum(len(c[0]["content"]) for c in packed_contexts + gen_contexts),
+            unpacked_prompt_chars=sum(len(prompt) for prompt in unpacked_prompts),
+        )
 
     if gen_contexts:
         gen_responses = await model_client.generate_responses(
@@ -157,37 +302,12 @@ async def build_concept_graph_from_extracted(
             temperature=0.6,
             max_tokens=max_tokens,
             show_progress=show_progress,
+            stage="concept_prereqs",
         )
-        for meta, response in zip(gen_meta, gen_responses):
-            problem_id = meta["problem_id"]
-            target_name = meta["concept_id"]
-            parsed = _extract_json_object(response[0] if response else "")
-            prereq_items = parsed.get("prerequisites", []) if isinstance(parsed, dict) else []
-            if not isinstance(prereq_items, list):
-                continue
-            concept_items = concept_graph.get(problem_id, [])
-            item_by_norm = {_normalize(item["concept_id"]): item for item in concept_items}
-            target_item = item_by_norm.get(_normalize(target_name))
-            if not target_item:
-                continue
-            for prereq in prereq_items:
-                if not isinstance(prereq, dict):
-                    continue
-                prereq_name = str(prereq.get("concept_id", "")).strip()
-                if not prereq_name or _normalize(prereq_name) == _normalize(target_name):
-                    continue
-                prereq_desc = str(prereq.get("description", "")).strip()
-                existing_item = item_by_norm.get(_normalize(prereq_name))
-                if existing_item is None:
-                    new_item = {
-                        "concept_id": prereq_name,
-                        "description": prereq_desc,
-                        "prerequisites": [],
-                    }
-                    concept_items.append(new_item)
-                    item_by_norm[_normalize(prereq_name)] = new_item
-                    existing_item = new_item
-                _append_prereq(target_item, existing_item["concept_id"])
+        for (problem_id, item), response in zip(gen_meta, gen_responses):
+            parsed = _parse("concept_prereqs", response)
+            _add_generated(problem_id, item["concept_id"], parsed.get("prerequisites", []))
+            _remember(item, parsed.get("prerequisites", []))
 
     return concept_graph
 
@@ -0,0 +1,113 @@
+"""Persistent cross-problem store of generated concept prerequisites."""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+from .graph import normalize_concept_name
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS concept_prereqs (
+    norm_name TEXT NOT NULL,
+    model TEXT NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    prerequisites TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (norm_name, model)
+)
+"""
+# Earlier stores keyed entries by name alone; their rows still record the model.
+_LEGACY_TABLE = "concepts"
+
+
+class ConceptKB:
+    """
+    SQLite-backed map from (normalized concept name, model) to the prerequisites that
+    model generated, shared by every problem and run. Each entry keeps the concept's
+    description and a list of {"concept_id", "description"} prerequisite items.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(_SCHEMA)
+        self._migrate_legacy()
+        self._conn.commit()
+        self.entries_at_open = len(self)
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def _migrate_legacy(self) -> None:
+        legacy = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (_LEGACY_TABLE,)
+        ).fetchone()
+        if legacy is None:
+            return
+        self._conn.execute(
+            "INSERT OR IGNORE INTO concept_prereqs (norm_name, model, name, description, prerequisites, created) "
+            f"SELECT norm_name, model, name, description, prerequisites, created FROM {_LEGACY_TABLE}"
+        )
+        self._conn.execute(f"DROP TABLE {_LEGACY_TABLE}")
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM concept_prereqs").fetchone()[0]
+
+    def get(self, name: str, model_name: str) -> Optional[Dict[str, Any]]:
+        """Prerequisites `model_name` generated for `name`, or None."""
+        row = self._conn.execute(
+            "SELECT name, description, prerequisites FROM concept_prereqs WHERE norm_name = ? AND model = ?",
+            (normalize_concept_name(name), model_name),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"concept_id": row[0], "description": row[1], "prerequisites": json.loads(row[2])}
+
+    def put(self, name: str, description: str, prerequisites: List[Dict[str, str]], model_name: str) -> None:
+        """Store (or replace) the prerequisites `model_name` generated for `name`."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO concept_prereqs (norm_name, model, name, description, prerequisites, created) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                normalize_concept_name(name),
+                model_name,
+                name,
+                description or "",
+                json.dumps(prerequisites, ensure_ascii=False),
+                time.time(),
+            ),
+        )
+        self._conn.commit()
+        self.stored += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries_at_open": self.entries_at_open,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (
+            f"Concept KB {stats['path']}: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate'] * 100:.1f}% hit rate), {stats['stored']} stored, "
+            f"{stats['entries_at_open']} entries at start"
+        )
+
+    def close(self) -> None:
+        self._conn.close()
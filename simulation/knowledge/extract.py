@@ -3,50 +3,76 @@
 from __future__ import annotations
 
 import json
-import re
-from typing import Any, Dict, List
+from typing import Any, List
 
-from ..core.prompts import load_prompt
+from ..core.jsonparse import parse_json_object
+from ..core.prompts import get_prompt
+from ..core.usage import record_parse
+from .schemas import explained_concepts_schema
 
+PROMPT_FIELDS = ("assistant_message", "candidate_concepts")
 
-def _extract_json_object(text: str) -> Dict[str, Any]:
-    if not text:
-        return {}
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    if not match:
-        return {}
-    try:
-        return json.loads(match.group(0))
-    except json.JSONDecodeError:
-        return {}
 
+def _parse_explained(raw: str, candidate_concepts: List[str]) -> List[str]:
+    parsed = parse_json_object(raw, accept=lambda obj: "explained_concepts" in obj)
+    record_parse("knowledge_extract", parsed is not None)
+    concepts = parsed.get("explained_concepts", []) if parsed else []
+    if not isinstance(concepts, list):
+        return []
+    return [c for c in concepts if c in candidate_concepts]
 
-async def extract_explained_concepts(
+
+async def extract_explained_concepts_batch(
     *,
-    assistant_message: str,
-    candidate_concepts: List[str],
+    assistant_messages: List[str],
+    candidate_concepts: List[List[str]],
     model_client: Any,
     max_tokens: int = 600,
     show_progress: bool = False,
     prompt_path: str = "simulation/prompts/dynamic-knowledge-extract.txt",
-) -> List[str]:
-    template = load_prompt(prompt_path)
-    prompt = template.format(
-        assistant_message=assistant_message,
-        candidate_concepts=json.dumps(candidate_concepts, indent=2),
-    )
+) -> List[List[str]]:
+    """One extraction per (tutor message, candidate list) pair, sent as a single batch."""
+    template = get_prompt(prompt_path)
+    contexts = [
+        [{"role": "system", "content": "You are a professional concept extraction specialist."},
+         {"role": "user", "content": template.render({
+             "assistant_message": message,
+             "candidate_concepts": json.dumps(candidates, indent=2),
+         })}]
+        for message, candidates in zip(assistant_messages, candidate_concepts)
+    ]
+    if not contexts:
+        return []
     responses = await model_client.generate_responses(
-        [[{"role": "system", "content": "You are a professional concept extraction specialist."},
-          {"role": "user", "content": prompt}]],
+        contexts,
         temperature=0.3,
         max_tokens=max_tokens,
         n=1,
         show_progress=show_progress,
+        stage="knowledge_extract",
+        json_schema=[explained_concepts_schema(candidates) for candidates in candidate_concepts],
     )
-    raw = responses[0][0] if responses and responses[0] else ""
-    parsed = _extract_json_object(raw)
-    concepts = parsed.get("explained_concepts", []) if isinstance(parsed, dict) else []
-    if not isinstance(concepts, list):
-        return []
-    return [c for c in concepts if c in candidate_concepts]
+    return [
+        _parse_explained(response[0] if response else "", candidates)
+        for response, candidates in zip(responses, candidate_concepts)
+    ]
 
+
+async def extract_explained_concepts(
+    *,
+    assistant_message: str,
+    candidate_concepts: List[str],
+    model_client: Any,
+    max_tokens: int = 600,
+    show_progress: bool = False,
+    prompt_path: str = "simulation/prompts/dynamic-knowledge-extract.txt",
+) -> List[str]:
+    results = await extract_explained_concepts_batch(
+        assistant_messages=[assistant_message],
+        candidate_concepts=[candidate_concepts],
+        model_client=model_client,
+        max_tokens=max_tokens,
+        show_progress=show_progress,
+        prompt_path=prompt_path,
+    )
+    return results[0]
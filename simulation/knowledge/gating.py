@@ -2,49 +2,38 @@
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Optional
 
+from .graph import ConceptGraph
 from .state import STATE_ORDER
 
 
-def clamp_state_by_prereqs(
-    *,
-    concept_name: str,
-    proposed_state: str,
+LOW_STATES = frozenset({"unknown_unknown", "not_introduced"})
+MAX_STATE_WITH_LOW_PREREQ = "struggling"
+
+
+def clamp_update(
+    graph: Optional[ConceptGraph],
     knowledge_state: Dict[str, Any],
-    concept_graph: Optional[Dict[str, List[Dict[str, Any]]]] = None,
-    problem_id: Optional[str] = None,
-) -> str:
+    proposed: Dict[str, str],
+) -> Dict[str, str]:
     """
-    Hard-gate state upgrades based on prerequisite states.
-    If any prerequisite is unknown_unknown or not_introduced,
-    the target concept cannot exceed "struggling".
+    Hard-gate a whole proposed update ({concept: new_state}) against prerequisite states.
+    If any prerequisite is unknown_unknown or not_introduced (a prerequisite with no
+    state counts as unknown_unknown), the concept cannot exceed "struggling".
+    Concepts are visited prerequisites-first, so a prerequisite raised in the same
+    update already counts for its dependents. Returns the gated states.
     """
-    if not concept_graph or not problem_id or not proposed_state:
-        return proposed_state
-
-    concept_items = concept_graph.get(str(problem_id), []) or []
-    prereqs = []
-    for item in concept_items:
-        if item.get("concept_id") == concept_name:
-            prereqs = item.get("prerequisites", []) or []
-            break
-
-    if not prereqs:
-        return proposed_state
-
-    low_states = {"unknown_unknown", "not_introduced"}
-    prereq_states = [
-        knowledge_state.get(prereq, {}).get("state", "unknown_unknown")
-        for prereq in prereqs
-    ]
-    if any(state in low_states for state in prereq_states):
-        max_allowed = "struggling"
-        try:
-            if STATE_ORDER.index(proposed_state) > STATE_ORDER.index(max_allowed):
-                return max_allowed
-        except ValueError:
-            return proposed_state
-
-    return proposed_state
-
+    if graph is None:
+        return dict(proposed)
+    current = {concept: info.get("state", "unknown_unknown") for concept, info in knowledge_state.items()}
+    ceiling = STATE_ORDER.index(MAX_STATE_WITH_LOW_PREREQ)
+    gated: Dict[str, str] = {}
+    for concept in graph.topological(proposed):
+        state = proposed[concept]
+        if state in STATE_ORDER and STATE_ORDER.index(state) > ceiling:
+            if any(current.get(prereq, "unknown_unknown") in LOW_STATES for prereq in graph.prereq_labels(concept)):
+                state = MAX_STATE_WITH_LOW_PREREQ
+        gated[concept] = state
+        current[concept] = state
+    return gated
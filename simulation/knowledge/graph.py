@@ -0,0 +1,147 @@
+"""Indexed prerequisite graph compiled once per problem."""
+
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+def normalize_concept_name(name: str) -> str:
+    """Case- and whitespace-insensitive form used to match concept names."""
+    return re.sub(r"\s+", " ", (name or "").strip().lower())
+
+
+class ConceptGraph:
+    """
+    Concepts of one problem with integer ids.
+
+    Ids 0..len(items)-1 follow the item list; prerequisite names that have no item of
+    their own get the ids after that, so gating can treat them as (unknown) concepts.
+    `prereqs[i]` / `children[i]` are adjacency tuples, `order` is a topological order
+    (concepts on a cycle come last, in id order), and `closure[i]` is a bitset of all
+    direct and indirect prerequisites of concept i.
+    """
+
+    __slots__ = ("items", "labels", "index", "norm_index", "prereqs", "children", "order", "rank", "closure")
+
+    def __init__(self, items: Sequence[Dict[str, Any]]) -> None:
+        self.items = list(items)
+        self.labels: List[str] = []
+        self.index: Dict[str, int] = {}
+        for item in self.items:
+            self._add(item.get("concept_id", ""))
+        edges: List[Tuple[int, int]] = []
+        for item in self.items:
+            dst = self.index[item.get("concept_id", "")]
+            for prereq in item.get("prerequisites", []) or []:
+                edges.append((self._add(prereq), dst))
+        self._link(edges)
+
+    @classmethod
+    def from_iu_graph(cls, iu_graph: Dict[str, Any]) -> "ConceptGraph":
+        """Graph over IU ids ("IU1", ...) from an extracted IU graph's nodes and edges."""
+        node_ids = [node.get("id", "") for node in iu_graph.get("nodes", [])]
+        prereqs: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+        for e in iu_graph.get("edges", []):
+            src = e.get("from")
+            dst = e.get("to")
+            if src in prereqs and dst in prereqs:
+                prereqs[dst].append(src)
+        return cls([{"concept_id": node_id, "prerequisites": prereqs[node_id]} for node_id in node_ids])
+
+    def _add(self, label: str) -> int:
+        node = self.index.get(label)
+        if node is None:
+            node = len(self.labels)
+            self.index[label] = node
+            self.labels.append(label)
+        return node
+
+    def _link(self, edges: Iterable[Tuple[int, int]]) -> None:
+        n = len(self.labels)
+        prereqs: List[List[int]] = [[] for _ in range(n)]
+        children: List[List[int]] = [[] for _ in range(n)]
+        for src, dst in edges:
+            if src != dst and src not in prereqs[dst]:
+                prereqs[dst].append(src)
+                children[src].append(dst)
+        self.prereqs = [tuple(p) for p in prereqs]
+        self.children = [tuple(c) for c in children]
+        self.norm_index: Dict[str, int] = {}
+        for node, label in enumerate(self.labels):
+            self.norm_index.setdefault(normalize_concept_name(label), node)
+
+        incoming = [len(p) for p in prereqs]
+        queue = deque(node for node in range(n) if incoming[node] == 0)
+        order: List[int] = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for child in children[node]:
+                incoming[child] -= 1
+                if incoming[child] == 0:
+                    queue.append(child)
+        placed = set(order)
+        order.extend(node for node in range(n) if node not in placed)
+        self.order = order
+        self.rank = [0] * n
+        for position, node in enumerate(order):
+            self.rank[node] = position
+
+        # Prerequisites precede their dependents in `order`, so one pass builds the closure
+        # (cycle members only see the part of the cycle already visited).
+        closure = [0] * n
+        for node in order:
+            bits = 0
+            for prereq in prereqs[node]:
+                bits |= closure[prereq] | (1 << prereq)
+            closure[node] = bits
+        self.closure = closure
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @property
+    def concept_names(self) -> List[str]:
+        """Names of the concepts that have items, in item order."""
+        return [item.get("concept_id", "") for item in self.items if item.get("concept_id")]
+
+    def id_of(self, label: str) -> Optional[int]:
+        return self.index.get(label)
+
+    def find(self, name: str) -> Optional[int]:
+        """Id for an exact label, else for a case/whitespace-insensitive match."""
+        node = self.index.get(name)
+        return node if node is not None else self.norm_index.get(normalize_concept_name(name))
+
+    def prereq_labels(self, label: str) -> List[str]:
+        node = self.index.get(label)
+        return [self.labels[p] for p in self.prereqs[node]] if node is not None else []
+
+    def ancestors(self, label: str) -> List[str]:
+        """All direct and indirect prerequisites, in topological order."""
+        node = self.index.get(label)
+        if node is None:
+            return []
+        bits = self.closure[node]
+        return [self.labels[other] for other in self.order if bits >> other & 1]
+
+    def depends_on(self, label: str, prereq: str) -> bool:
+        node, other = self.index.get(label), self.index.get(prereq)
+        return node is not None and other is not None and bool(self.closure[node] >> other & 1)
+
+    def depth(self) -> int:
+        """Number of concepts on the longest prerequisite chain."""
+        levels = [1] * len(self.labels)
+        for node in self.order:
+            for prereq in self.prereqs[node]:
+                if self.rank[prereq] < self.rank[node]:
+                    levels[node] = max(levels[node], levels[prereq] + 1)
+        return max(levels, default=0)
+
+    def topological(self, labels: Iterable[str]) -> List[str]:
+        """`labels` sorted prerequisites-first; unknown labels keep their order at the end."""
+        labels = list(labels)
+        known = sorted((label for label in labels if label in self.index), key=lambda l: self.rank[self.index[l]])
+        return known + [label for label in labels if label not in self.index]
@@ -0,0 +1,154 @@
+"""Compiled IU / concept graph artifact: one indexed file, loaded lazily through mmap."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+from .iu_init import _topological_sort
+
+MAGIC = b"SIMGRPH1"
+_HEADER_SIZE = len(MAGIC) + 8
+
+
+def problem_key(question: str, answer: str) -> str:
+    """Content hash identifying a problem across datasets and row orders."""
+    digest = hashlib.sha256()
+    for part in (question, answer):
+        data = (part or "").encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def template_sha256(prompt_path: str) -> str:
+    """Hash of the extraction template, stored in the artifact to detect a changed prompt."""
+    with open(prompt_path, "r", encoding="utf-8") as f:
+        return hashlib.sha256(f.read().encode("utf-8")).hexdigest()
+
+
+def artifact_mismatches(meta: Dict[str, Any], *, iu_model: str, prompt_sha256: str) -> List[str]:
+    """Ways an artifact's compile settings differ from the current run's."""
+    issues = []
+    if meta.get("iu_model") != iu_model:
+        issues.append(f"compiled with iu_model {meta.get('iu_model')}, this run uses {iu_model}")
+    if meta.get("prompt_sha256") != prompt_sha256:
+        issues.append("compiled with a different iu_graph_extraction.txt")
+    return issues
+
+
+def validate_iu_graph(iu_graph: Dict[str, Any]) -> List[str]:
+    """
+    Structural problems that the samplers would otherwise skip silently: duplicate
+    node ids, edges to or from unknown nodes, self-loops and cycles (nodes that
+    never reach the topological order).
+    """
+    nodes = iu_graph.get("nodes", [])
+    edges = iu_graph.get("edges", [])
+    issues = []
+    node_ids = [node.get("id") for node in nodes]
+    if not node_ids:
+        issues.append("no nodes")
+    seen = set()
+    for node_id in node_ids:
+        if not node_id:
+            issues.append("node without id")
+        elif node_id in seen:
+            issues.append(f"duplicate node {node_id}")
+        seen.add(node_id)
+    for e in edges:
+        src, dst = e.get("from"), e.get("to")
+        if src not in seen or dst not in seen:
+            issues.append(f"dangling edge {src} -> {dst}")
+        elif src == dst:
+            issues.append(f"self-loop on {src}")
+    ordered = set(_topological_sort(nodes, edges))
+    cyclic = [node_id for node_id in node_ids if node_id and node_id not in ordered]
+    if cyclic:
+        issues.append(f"cycle through {', '.join(cyclic)}")
+    return issues
+
+
+def write_graph_artifact(path: str, entries: Dict[str, Dict[str, Any]], meta: Dict[str, Any]) -> int:
+    """
+    Write {problem key: entry} as MAGIC, the index length, a JSON index of
+    {"meta", "entries": {key: [offset, length]}} and the compact JSON entries.
+    The file is written next to `path` and moved into place, so readers never see
+    a partial artifact. Returns the size in bytes.
+    """
+    blobs = []
+    index: Dict[str, List[int]] = {}
+    offset = 0
+    for key, entry in entries.items():
+        blob = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        index[key] = [offset, len(blob)]
+        blobs.append(blob)
+        offset += len(blob)
+    header = json.dumps({"meta": meta, "entries": index}, separators=(",", ":")).encode("utf-8")
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "big"))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return _HEADER_SIZE + len(header) + offset
+
+
+class GraphArtifact:
+    """
+    Read side of a compiled graph artifact. Opening parses only the index; each
+    entry ({"iu_graph", "concept_items", "id_map", "issues"}) is decoded from the
+    memory map the first time it is asked for.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"Not a graph artifact: {path}")
+        header_size = int.from_bytes(self._map[len(MAGIC):_HEADER_SIZE], "big")
+        header = json.loads(self._map[_HEADER_SIZE:_HEADER_SIZE + header_size])
+        self.meta: Dict[str, Any] = header.get("meta", {})
+        self._index: Dict[str, List[int]] = header["entries"]
+        self._base = _HEADER_SIZE + header_size
+        self._decoded: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._decoded.get(key)
+        if entry is None and key in self._index:
+            offset, length = self._index[key]
+            start = self._base + offset
+            entry = json.loads(self._map[start:start + length])
+            self._decoded[key] = entry
+        return entry
+
+    def close(self) -> None:
+        if self._map is not None and not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "GraphArtifact":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
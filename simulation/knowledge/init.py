@@ -5,9 +5,11 @@ from __future__ import annotations
 import json
 from typing import Any, Dict, List
 
-from ..core.prompts import load_prompt
+from ..core.prompts import get_prompt
 from .concept_graph import format_concept_list_with_prerequisites
 
+PROMPT_FIELDS = ("math_problem", "concept_list_with_prerequisites", "education_level", "indicators")
+
 
 def _extract_json_object(text: str) -> Dict[str, Any]:
     if not text:
@@ -34,19 +36,19 @@ async def initialize_dynamic_knowledge_states(
     Ported entry point for K0 initialization.
     Uses the dynamic-knowledge-init prompt and a single model client.
     """
-    template = load_prompt(prompt_path)
+    template = get_prompt(prompt_path)
     contexts = []
     for problem, problem_id, education_level, indicator in zip(
         problems, problem_ids, education_levels, indicators
     ):
         concepts = concept_graph.get(problem_id, [])
         concept_list = format_concept_list_with_prerequisites(concepts)
-        prompt = template.format(
-            math_problem=problem,
-            concept_list_with_prerequisites=concept_list,
-            education_level=education_level,
-            indicators=indicator,
-        )
+        prompt = template.render({
+            "math_problem": problem,
+            "concept_list_with_prerequisites": concept_list,
+            "education_level": education_level,
+            "indicators": indicator,
+        })
         contexts.append(
             [
                 {"role": "system", "content": "You are an expert educational diagnostician."},
@@ -54,7 +56,12 @@ async def initialize_dynamic_knowledge_states(
             ]
         )
     responses = await model_client.generate_responses(
-        contexts, temperature=0.7, max_tokens=max_tokens, n=1, show_progress=show_progress
+        contexts,
+        temperature=0.7,
+        max_tokens=max_tokens,
+        n=1,
+        show_progress=show_progress,
+        stage="knowledge_init",
     )
     parsed_states = []
     for response in responses:
@@ -0,0 +1,88 @@
+"""Persistent IU graph cache keyed by the content that determines an extraction."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS iu_graphs (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    graph TEXT NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+
+def iu_cache_key(question: str, answer: str, template_text: str, model_name: str) -> str:
+    """
+    Content address of one extraction. The template text is part of the key, so
+    editing the prompt invalidates every entry made with the old version.
+    """
+    digest = hashlib.sha256()
+    for part in (question, answer, template_text, model_name):
+        data = (part or "").encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") differ.
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class IUGraphCache:
+    """SQLite-backed store of extracted IU graphs with hit/miss counters."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self.entries_at_open = self._conn.execute("SELECT COUNT(*) FROM iu_graphs").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT graph FROM iu_graphs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, model_name: str, graph: Dict[str, Any]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO iu_graphs (key, model, graph, created) VALUES (?, ?, ?, ?)",
+            (key, model_name, json.dumps(graph, ensure_ascii=False), time.time()),
+        )
+        self._conn.commit()
+        self.stored += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries_at_open": self.entries_at_open,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (
+            f"IU graph cache {stats['path']}: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate'] * 100:.1f}% hit rate), {stats['stored']} stored, "
+            f"{stats['entries_at_open']} entries at start"
+        )
+
+    def close(self) -> None:
+        self._conn.close()
@@ -2,60 +2,126 @@
 
 from __future__ import annotations
 
-import json
-import re
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
-from ..core.prompts import load_prompt
+from tqdm import tqdm
 
+from ..core.jsonparse import parse_json_object
+from ..core.prompts import get_prompt
+from ..core.usage import record_parse
+from .iu_cache import IUGraphCache, iu_cache_key
+from .schemas import IU_GRAPH_SCHEMA
 
-def _extract_json_object(text: str) -> Dict[str, Any]:
-    if not text:
-        return {}
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    if not match:
-        return {}
-    try:
-        return json.loads(match.group(0))
-    except json.JSONDecodeError:
-        return {}
+PROMPT_FIELDS = ("question", "answer")
 
 
-async def extract_iu_graph(
+def _is_iu_graph(obj: Dict[str, Any]) -> bool:
+    return isinstance(obj.get("nodes"), list)
+
+
+RETRY_INSTRUCTION = "\n\nReturn only valid JSON. Do not include any extra text."
+UNPARSABLE_ERROR = "empty or unparsable response"
+
+
+async def extract_iu_graphs(
+    problems: Dict[str, Tuple[str, str]],
     *,
-    question: str,
-    answer: str,
     model_client: Any,
     max_tokens: int = 1200,
     show_progress: bool = False,
     prompt_path: str = "prompts/iu_graph_extraction.txt",
-) -> Dict[str, Any]:
-    template = load_prompt(prompt_path)
-    prompt = template.format(question=question, answer=answer)
+    cache: Optional[IUGraphCache] = None,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """
+    Extract IU graphs for {problem_id: (question, answer)} with all uncached problems
+    in one concurrent batch. Problems whose output does not parse are retried once, as
+    a second batch, with a stricter JSON-only instruction at temperature 0.
+    Returns (graphs by problem id, error message by problem id for the ones that failed).
+    With show_progress a single bar tracks every request, retries included.
+    """
+    template = get_prompt(prompt_path)
+    model_name = getattr(model_client, "model_name", "")
+    graphs: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    keys: Dict[str, str] = {}
+    prompts: Dict[str, str] = {}
+    for problem_id, (question, answer) in problems.items():
+        if cache is not None:
+            keys[problem_id] = iu_cache_key(question, answer, template.text, model_name)
+            cached = cache.get(keys[problem_id])
+            if cached is not None:
+                graphs[problem_id] = cached
+                continue
+        prompts[problem_id] = template.render({"question": question, "answer": answer})
+
+    progress = tqdm(total=len(problems), desc="iu_graph", disable=not show_progress)
+    progress.update(len(graphs))
 
-    async def _call_once(prompt_text: str, temperature: float) -> str:
+    async def run_round(problem_ids: List[str], suffix: str, temperature: float, retry: bool) -> List[str]:
+        """Send one batch; returns the ids that still have no graph and did not fail to send."""
+        request_errors: Dict[int, BaseException] = {}
         responses = await model_client.generate_responses(
             [[{"role": "system", "content": "You are an expert knowledge graph extractor."},
-              {"role": "user", "content": prompt_text}]],
+              {"role": "user", "content": prompts[problem_id] + suffix}]
+             for problem_id in problem_ids],
             temperature=temperature,
             max_tokens=max_tokens,
             n=1,
-            show_progress=show_progress,
+            show_progress=False,
             json_mode=True,
+            json_schema=IU_GRAPH_SCHEMA,
+            stage="iu_graph",
+            on_complete=progress.update,
+            request_errors=request_errors,
         )
-        return responses[0][0] if responses and responses[0] else ""
+        failed = []
+        for i, (problem_id, response) in enumerate(zip(problem_ids, responses)):
+            if i in request_errors:
+                errors[problem_id] = f"request failed: {request_errors[i]}"
+                continue
+            parsed = parse_json_object(response[0] if response else "", accept=_is_iu_graph)
+            record_parse("iu_graph", parsed is not None, retry=retry)
+            if parsed:
+                graphs[problem_id] = parsed
+                if cache is not None:
+                    cache.put(keys[problem_id], model_name, parsed)
+            else:
+                failed.append(problem_id)
+        return failed
 
-    raw = await _call_once(prompt, temperature=0.2)
-    parsed = _extract_json_object(raw)
-    if parsed:
-        return parsed
+    pending = list(prompts)
+    if pending:
+        failed = await run_round(pending, "", temperature=0.2, retry=False)
+        if failed:
+            progress.total += len(failed)
+            progress.refresh()
+            failed = await run_round(failed, RETRY_INSTRUCTION, temperature=0.0, retry=True)
+        for problem_id in failed:
+            errors[problem_id] = UNPARSABLE_ERROR
+    progress.close()
 
-    # Retry once with a stricter JSON-only instruction and lower temperature.
-    retry_prompt = prompt + "\n\nReturn only valid JSON. Do not include any extra text."
-    raw_retry = await _call_once(retry_prompt, temperature=0.0)
-    parsed_retry = _extract_json_object(raw_retry)
-    if parsed_retry:
-        return parsed_retry
+    # Keep the caller's problem order.
+    return {pid: graphs[pid] for pid in problems if pid in graphs}, errors
 
-    raise RuntimeError("IU graph extraction failed: empty or unparsable response.")
 
+async def extract_iu_graph(
+    *,
+    question: str,
+    answer: str,
+    model_client: Any,
+    max_tokens: int = 1200,
+    show_progress: bool = False,
+    prompt_path: str = "prompts/iu_graph_extraction.txt",
+    cache: Optional[IUGraphCache] = None,
+) -> Dict[str, Any]:
+    graphs, errors = await extract_iu_graphs(
+        {"_": (question, answer)},
+        model_client=model_client,
+        max_tokens=max_tokens,
+        show_progress=show_progress,
+        prompt_path=prompt_path,
+        cache=cache,
+    )
+    if "_" in graphs:
+        return graphs["_"]
+    raise RuntimeError(f"IU graph extraction failed: {errors['_']}.")
@@ -3,7 +3,17 @@
 from __future__ import annotations
 
 import random
-from typing import Dict, List
+from collections import deque
+from typing import Dict, List, Tuple
+
+# Per level: (known ratio range, partially-known ratio range).
+LEVEL_RATIOS: Dict[str, Tuple[Tuple[float, float], Tuple[float, float]]] = {
+    "novice": ((0.0, 0.1), (0.05, 0.15)),
+    "intermediate": ((0.2, 0.4), (0.1, 0.2)),
+    "advanced": ((0.5, 0.7), (0.1, 0.2)),
+}
+KNOWN_ACCEPT_PROB = 0.7
+PARTIAL_ACCEPT_PROB = 0.5
 
 
 def _topological_sort(nodes: List[Dict[str, str]], edges: List[Dict[str, str]]) -> List[str]:
@@ -15,10 +25,10 @@ def _topological_sort(nodes: List[Dict[str, str]], edges: List[Dict[str, str]])
         if src in incoming and dst in incoming:
             incoming[dst] += 1
             children[src].append(dst)
-    queue = [n_id for n_id, deg in incoming.items() if deg == 0]
+    queue = deque(n_id for n_id, deg in incoming.items() if deg == 0)
     order = []
     while queue:
-        node = queue.pop(0)
+        node = queue.popleft()
         order.append(node)
         for child in children.get(node, []):
             incoming[child] -= 1
@@ -27,8 +37,12 @@ def _topological_sort(nodes: List[Dict[str, str]], edges: List[Dict[str, str]])
     return order
 
 
-def _get_prereqs(edges: List[Dict[str, str]], node_id: str) -> List[str]:
-    return [e["from"] for e in edges if e.get("to") == node_id]
+def _prereq_map(edges: List[Dict[str, str]]) -> Dict[str, List[str]]:
+    prereqs: Dict[str, List[str]] = {}
+    for e in edges:
+        if e.get("to") is not None:
+            prereqs.setdefault(e["to"], []).append(e.get("from"))
+    return prereqs
 
 
 def initialize_knowledge_state(
@@ -39,49 +53,42 @@ def initialize_knowledge_state(
     nodes = iu_graph.get("nodes", [])
     edges = iu_graph.get("edges", [])
     all_nodes = _topological_sort(nodes, edges)
+    prereqs_by_node = _prereq_map(edges)
     total = len(all_nodes)
 
-    if level == "novice":
-        target_known_ratio = rng.uniform(0.0, 0.1)
-        target_partial_ratio = rng.uniform(0.05, 0.15)
-    elif level == "intermediate":
-        target_known_ratio = rng.uniform(0.2, 0.4)
-        target_partial_ratio = rng.uniform(0.1, 0.2)
-    elif level == "advanced":
-        target_known_ratio = rng.uniform(0.5, 0.7)
-        target_partial_ratio = rng.uniform(0.1, 0.2)
-    else:
+    if level not in LEVEL_RATIOS:
         raise ValueError(f"Unsupported level: {level}")
+    (known_low, known_high), (partial_low, partial_high) = LEVEL_RATIOS[level]
+    target_known_ratio = rng.uniform(known_low, known_high)
+    target_partial_ratio = rng.uniform(partial_low, partial_high)
 
     known = set()
     partially_known = set()
-    unknown = set(all_nodes)
 
     target_known_count = int(target_known_ratio * total)
-    candidates = list(all_nodes)
-
-    while len(known) < target_known_count and candidates:
-        node = candidates.pop(0)
-        prereqs = _get_prereqs(edges, node)
+    for node in all_nodes:
+        if len(known) >= target_known_count:
+            break
+        prereqs = prereqs_by_node.get(node, [])
         if all(p in known for p in prereqs):
-            if rng.random() < 0.7:
+            if rng.random() < KNOWN_ACCEPT_PROB:
                 known.add(node)
-                unknown.discard(node)
 
+    # Visit candidates in topological order (not set order) so a seed gives one result.
     target_partial_count = int(target_partial_ratio * total)
-    for node in list(unknown):
+    for node in all_nodes:
         if len(partially_known) >= target_partial_count:
             break
-        prereqs = _get_prereqs(edges, node)
+        if node in known:
+            continue
+        prereqs = prereqs_by_node.get(node, [])
         known_prereq_ratio = len([p for p in prereqs if p in known]) / max(len(prereqs), 1)
         if known_prereq_ratio > 0:
-            if rng.random() < 0.5:
+            if rng.random() < PARTIAL_ACCEPT_PROB:
                 partially_known.add(node)
-                unknown.discard(node)
 
     return {
-        "known": list(known),
-        "partially_known": list(partially_known),
-        "unknown": list(unknown),
+        "known": [n for n in all_nodes if n in known],
+        "partially_known": [n for n in all_nodes if n in partially_known],
+        "unknown": [n for n in all_nodes if n not in known and n not in partially_known],
     }
-
@@ -0,0 +1,121 @@
+"""Batched IU knowledge-state sampling for whole student populations."""
+
+from __future__ import annotations
+
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+from .iu_init import KNOWN_ACCEPT_PROB, LEVEL_RATIOS, PARTIAL_ACCEPT_PROB, _topological_sort
+
+
+@dataclass
+class CompiledIUGraph:
+    """An IU graph in topological order with prerequisite index arrays."""
+
+    node_ids: List[str]
+    # prereqs[j]: positions (in node_ids) of node j's prerequisites that are nodes.
+    prereqs: List[np.ndarray]
+    # True if node j has a prerequisite that is not a node; it can never become known.
+    blocked: np.ndarray
+
+
+@dataclass
+class PopulationSample:
+    """Known / partially-known flags for `students` sampled students (rows) over the nodes."""
+
+    node_ids: List[str]
+    known: np.ndarray
+    partial: np.ndarray
+
+    def __len__(self) -> int:
+        return self.known.shape[0]
+
+    def state(self, student: int) -> Dict[str, List[str]]:
+        """One student in the format of initialize_knowledge_state, lists in topological order."""
+        known = self.known[student]
+        partial = self.partial[student]
+        return {
+            "known": [n for n, flag in zip(self.node_ids, known) if flag],
+            "partially_known": [n for n, flag in zip(self.node_ids, partial) if flag],
+            "unknown": [n for n, k, p in zip(self.node_ids, known, partial) if not k and not p],
+        }
+
+
+def compile_iu_graph(iu_graph: Dict[str, Any]) -> CompiledIUGraph:
+    nodes = iu_graph.get("nodes", [])
+    edges = iu_graph.get("edges", [])
+    node_ids = _topological_sort(nodes, edges)
+    position = {node_id: j for j, node_id in enumerate(node_ids)}
+    prereqs: List[List[int]] = [[] for _ in node_ids]
+    blocked = np.zeros(len(node_ids), dtype=bool)
+    for e in edges:
+        dst = position.get(e.get("to"))
+        if dst is None:
+            continue
+        src = position.get(e.get("from"))
+        if src is None:
+            blocked[dst] = True
+        else:
+            prereqs[dst].append(src)
+    return CompiledIUGraph(node_ids, [np.array(p, dtype=np.intp) for p in prereqs], blocked)
+
+
+def population_rng(seed: int, problem_id: str) -> np.random.Generator:
+    """Generator for one problem's population, independent of other problems and of run order."""
+    return np.random.default_rng([seed, zlib.crc32(str(problem_id).encode("utf-8"))])
+
+
+def sample_population(
+    graph: Union[CompiledIUGraph, Dict[str, Any]],
+    level: str,
+    students: int,
+    rng: Union[np.random.Generator, int],
+) -> PopulationSample:
+    """
+    Draw `students` knowledge states at once, with the rules of initialize_knowledge_state:
+    per-student known/partial target ratios from the level's ranges; nodes are taken in
+    topological order, known with probability 0.7 once all prerequisites are known, then
+    partially known with probability 0.5 if at least one prerequisite is known, until each
+    student's targets are met. The loop is over nodes; students are vectorized.
+    """
+    if not isinstance(graph, CompiledIUGraph):
+        graph = compile_iu_graph(graph)
+    if level not in LEVEL_RATIOS:
+        raise ValueError(f"Unsupported level: {level}")
+    if not isinstance(rng, np.random.Generator):
+        rng = np.random.default_rng(rng)
+
+    total = len(graph.node_ids)
+    (known_low, known_high), (partial_low, partial_high) = LEVEL_RATIOS[level]
+    known_target = np.floor(rng.uniform(known_low, known_high, students) * total).astype(np.int64)
+    partial_target = np.floor(rng.uniform(partial_low, partial_high, students) * total).astype(np.int64)
+    known_draws = rng.random((students, total))
+    partial_draws = rng.random((students, total))
+
+    known = np.zeros((students, total), dtype=bool)
+    known_count = np.zeros(students, dtype=np.int64)
+    for j in range(total):
+        if graph.blocked[j]:
+            continue
+        eligible = known_count < known_target
+        if graph.prereqs[j].size:
+            eligible &= known[:, graph.prereqs[j]].all(axis=1)
+        accepted = eligible & (known_draws[:, j] < KNOWN_ACCEPT_PROB)
+        known[:, j] = accepted
+        known_count += accepted
+
+    partial = np.zeros((students, total), dtype=bool)
+    partial_count = np.zeros(students, dtype=np.int64)
+    for j in range(total):
+        if not graph.prereqs[j].size:
+            continue
+        eligible = ~known[:, j] & (partial_count < partial_target)
+        eligible &= known[:, graph.prereqs[j]].any(axis=1)
+        accepted = eligible & (partial_draws[:, j] < PARTIAL_ACCEPT_PROB)
+        partial[:, j] = accepted
+        partial_count += accepted
+
+    return PopulationSample(graph.node_ids, known, partial)
@@ -0,0 +1,75 @@
+"""JSON schemas for structured outputs of the knowledge stages."""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+from .state import STATE_ORDER
+
+
+def _strict_object(properties: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+IU_GRAPH_SCHEMA: Dict[str, Any] = {
+    "name": "iu_graph",
+    "strict": True,
+    "schema": _strict_object(
+        {
+            "nodes": {
+                "type": "array",
+                "items": _strict_object(
+                    {
+                        "id": {"type": "string"},
+                        "concept": {"type": "string"},
+                        "description": {"type": "string"},
+                    }
+                ),
+            },
+            "edges": {
+                "type": "array",
+                "items": _strict_object(
+                    {
+                        "from": {"type": "string"},
+                        "to": {"type": "string"},
+                        "reason": {"type": "string"},
+                    }
+                ),
+            },
+        }
+    ),
+}
+
+
+def explained_concepts_schema(candidate_concepts: List[str]) -> Dict[str, Any]:
+    """Only names from the candidate list can be returned."""
+    items: Dict[str, Any] = {"type": "string"}
+    if candidate_concepts:
+        items["enum"] = list(dict.fromkeys(candidate_concepts))
+    return {
+        "name": "explained_concepts",
+        "strict": True,
+        "schema": _strict_object({"explained_concepts": {"type": "array", "items": items}}),
+    }
+
+
+def knowledge_update_schema(concept_names: List[str]) -> Dict[str, Any]:
+    """One required entry per concept under review."""
+    entry = _strict_object(
+        {
+            "previous_state": {"type": "string"},
+            "new_state": {"type": "string", "enum": list(STATE_ORDER)},
+            "evidence": {"type": "string"},
+            "confidence": {"type": "number"},
+        }
+    )
+    return {
+        "name": "knowledge_update",
+        "strict": True,
+        "schema": _strict_object({name: entry for name in dict.fromkeys(concept_names)}),
+    }
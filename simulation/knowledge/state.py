@@ -2,7 +2,8 @@
 
 from __future__ import annotations
 
-from typing import List
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
 
 
 STATE_ORDER: List[str] = [
@@ -18,3 +19,156 @@ def is_higher_state(state_a: str, state_b: str) -> bool:
     """Return True if state_a ranks higher than state_b."""
     return STATE_ORDER.index(state_a) > STATE_ORDER.index(state_b)
 
+
+
+STATE_CODES: Dict[str, int] = {name: code for code, name in enumerate(STATE_ORDER)}
+NO_STATE = -1
+
+
+class KnowledgeTrace:
+    """
+    Knowledge state of one simulated student over a conversation.
+
+    The current state is a small integer array indexed by concept (codes follow
+    STATE_ORDER; labels outside it get codes past the end, NO_STATE marks an
+    entry without a "state" key). Other per-concept fields such as evidence and
+    confidence are kept alongside. Each pushed state is stored only as the diff
+    of the concepts that changed, so the full state at any turn can be rebuilt.
+    """
+
+    __slots__ = ("concepts", "_index", "_labels", "_codes", "_details", "_born", "_initial", "_diffs")
+
+    def __init__(self, initial_state: Dict[str, Dict[str, Any]]) -> None:
+        self.concepts: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._labels: List[str] = list(STATE_ORDER)
+        self._codes = array("b")
+        self._details: List[Dict[str, Any]] = []
+        self._born: List[int] = []
+        for concept, info in initial_state.items():
+            code, details = self._encode(info)
+            self._add_concept(concept, code, details, born=0)
+        self._initial: Tuple[array, List[Dict[str, Any]]] = (array("b", self._codes), list(self._details))
+        self._diffs: List[Dict[int, Tuple[int, Dict[str, Any]]]] = []
+
+    def _add_concept(self, concept: str, code: int, details: Dict[str, Any], born: int) -> int:
+        idx = len(self.concepts)
+        self.concepts.append(concept)
+        self._index[concept] = idx
+        self._codes.append(code)
+        self._details.append(details)
+        self._born.append(born)
+        return idx
+
+    def _encode(self, info: Any) -> Tuple[int, Dict[str, Any]]:
+        info = info if isinstance(info, dict) else {}
+        label = info.get("state")
+        if label is None:
+            code = NO_STATE
+        elif label in STATE_CODES:
+            code = STATE_CODES[label]
+        else:
+            if label not in self._labels:
+                self._labels.append(label)
+            code = self._labels.index(label)
+        details = {key: value for key, value in info.items() if key != "state"}
+        return code, details
+
+    def _decode(self, code: int, details: Dict[str, Any]) -> Dict[str, Any]:
+        info: Dict[str, Any] = {} if code == NO_STATE else {"state": self._labels[code]}
+        info.update(details)
+        return info
+
+    def __len__(self) -> int:
+        """Number of recorded states (the initial one plus one per push)."""
+        return len(self._diffs) + 1
+
+    def state_of(self, concept: str) -> Optional[str]:
+        idx = self._index.get(concept)
+        if idx is None or self._codes[idx] == NO_STATE:
+            return None
+        return self._labels[self._codes[idx]]
+
+    def state_codes(self) -> bytes:
+        """Current state codes, comparable across traces of the same concept list."""
+        return self._codes.tobytes()
+
+    def is_stuck(self) -> bool:
+        """True if the most recent push changed nothing."""
+        return bool(self._diffs) and not self._diffs[-1]
+
+    def push(self, new_state: Dict[str, Dict[str, Any]]) -> Dict[int, Tuple[int, Dict[str, Any]]]:
+        """Record the next state; only concepts whose state or details changed are stored."""
+        turn = len(self._diffs) + 1
+        diff: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+        for concept, info in new_state.items():
+            code, details = self._encode(info)
+            idx = self._index.get(concept)
+            if idx is None:
+                idx = self._add_concept(concept, code, details, born=turn)
+            elif self._codes[idx] == code and self._details[idx] == details:
+                continue
+            self._codes[idx] = code
+            self._details[idx] = details
+            diff[idx] = (code, details)
+        self._diffs.append(diff)
+        return diff
+
+    def current(self) -> Dict[str, Dict[str, Any]]:
+        """The latest state as a fresh dict (safe to mutate)."""
+        return {
+            concept: self._decode(self._codes[idx], self._details[idx])
+            for idx, concept in enumerate(self.concepts)
+        }
+
+    def history(self) -> List[Dict[str, Dict[str, Any]]]:
+        """Full state after every push, starting with the initial state."""
+        initial_codes, initial_details = self._initial
+        codes = list(initial_codes) + [NO_STATE] * (len(self.concepts) - len(initial_codes))
+        details = list(initial_details) + [{}] * (len(self.concepts) - len(initial_details))
+        states = []
+        for turn in range(len(self._diffs) + 1):
+            if turn:
+                for idx, (code, changed) in self._diffs[turn - 1].items():
+                    codes[idx] = code
+                    details[idx] = changed
+            states.append({
+                concept: self._decode(codes[idx], details[idx])
+                for idx, concept in enumerate(self.concepts)
+                if self._born[idx] <= turn
+            })
+        return states
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        """JSON-ready internal state (initial state plus diffs), restored by from_snapshot."""
+        initial_codes, initial_details = self._initial
+        return {
+            "concepts": self.concepts,
+            "labels": self._labels,
+            "born": self._born,
+            "initial": [initial_codes.tolist(), initial_details],
+            "diffs": [[[idx, code, details] for idx, (code, details) in diff.items()] for diff in self._diffs],
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, Any]) -> "KnowledgeTrace":
+        trace = cls({})
+        initial_codes, initial_details = data["initial"]
+        trace._initial = (array("b", initial_codes), list(initial_details))
+        trace._labels = list(data["labels"])
+        trace._born = list(data["born"])
+        trace._diffs = [{idx: (code, details) for idx, code, details in diff} for diff in data["diffs"]]
+        trace._codes = array("b", initial_codes)
+        trace._details = list(initial_details)
+        trace.concepts = []
+        for idx, concept in enumerate(data["concepts"]):
+            trace.concepts.append(concept)
+            trace._index[concept] = idx
+            if idx >= len(initial_codes):
+                trace._codes.append(NO_STATE)
+                trace._details.append({})
+        for diff in trace._diffs:
+            for idx, (code, details) in diff.items():
+                trace._codes[idx] = code
+                trace._details[idx] = details
+        return trace
@@ -5,8 +5,20 @@ from __future__ import annotations
 import json
 from typing import Any, Dict, List, Optional
 
-from ..core.prompts import load_prompt
-from .gating import clamp_state_by_prereqs
+from ..core.jsonparse import parse_json_object
+from ..core.prompts import get_prompt
+from ..core.usage import record_parse
+from .gating import clamp_update
+from .graph import ConceptGraph
+from .schemas import knowledge_update_schema
+
+PROMPT_FIELDS = (
+    "assistant_message",
+    "extracted_concepts",
+    "previous_states",
+    "prerequisite_states",
+    "user_response_analysis",
+)
 
 
 def _format_previous_states(concept_names: List[str], knowledge_state: Dict[str, Any]) -> str:
@@ -22,85 +34,139 @@ def _format_previous_states(concept_names: List[str], knowledge_state: Dict[str,
 def _format_prerequisite_states(
     concept_names: List[str],
     knowledge_state: Dict[str, Any],
-    concept_graph: Optional[Dict[str, List[Dict[str, Any]]]] = None,
-    problem_id: Optional[str] = None,
+    graph: Optional[ConceptGraph] = None,
 ) -> str:
-    if not concept_graph or not problem_id:
+    if graph is None:
         return "{}"
-    concept_items = concept_graph.get(str(problem_id), []) or []
+    wanted = set(concept_names)
     prereq_map = {}
-    for item in concept_items:
-        concept_id = item.get("concept_id")
-        if not concept_id or concept_id not in concept_names:
+    for concept_id in graph.concept_names:
+        if concept_id not in wanted:
             continue
-        prereqs = item.get("prerequisites", []) or []
-        prereq_entries = []
-        for prereq in prereqs:
-            prereq_state = knowledge_state.get(prereq, {}).get("state", "unknown")
-            prereq_entries.append({"concept": prereq, "state": prereq_state})
-        prereq_map[concept_id] = prereq_entries
+        prereq_map[concept_id] = [
+            {"concept": prereq, "state": knowledge_state.get(prereq, {}).get("state", "unknown")}
+            for prereq in graph.ancestors(concept_id)
+        ]
     return json.dumps(prereq_map, indent=2)
 
 
-async def update_dynamic_knowledge_state(
-    *,
+def _update_prompt(
+    template: Any,
     assistant_message: str,
     concept_names: List[str],
     knowledge_state: Dict[str, Any],
     user_response_analysis: str,
-    model_client: Any,
-    concept_graph: Optional[Dict[str, List[Dict[str, Any]]]] = None,
-    problem_id: Optional[str] = None,
-    max_tokens: int = 1200,
-    show_progress: bool = False,
-    prompt_path: str = "simulation/prompts/dynamic-knowledge-update.txt",
-) -> Dict[str, Any]:
-    template = load_prompt(prompt_path)
+    graph: Optional[ConceptGraph],
+) -> str:
     previous_states = _format_previous_states(concept_names, knowledge_state)
-    prerequisite_states = _format_prerequisite_states(
-        concept_names,
-        knowledge_state,
-        concept_graph=concept_graph,
-        problem_id=problem_id,
-    )
+    prerequisite_states = _format_prerequisite_states(concept_names, knowledge_state, graph)
     extracted_concepts = json.dumps(concept_names, indent=2)
-    prompt = template.format(
-        assistant_message=assistant_message,
-        extracted_concepts=extracted_concepts,
-        previous_states=previous_states,
-        prerequisite_states=prerequisite_states,
-        user_response_analysis=user_response_analysis,
-    )
-    responses = await model_client.generate_responses(
-        [[{"role": "system", "content": "You are a professional learning assessment analyst."},
-          {"role": "user", "content": prompt}]],
-        temperature=0.7,
-        max_tokens=max_tokens,
-        n=1,
-        show_progress=show_progress,
-    )
-    raw = responses[0][0] if responses and responses[0] else ""
-    try:
-        parsed = json.loads(raw)
-    except json.JSONDecodeError:
+    return template.render({
+        "assistant_message": assistant_message,
+        "extracted_concepts": extracted_concepts,
+        "previous_states": previous_states,
+        "prerequisite_states": prerequisite_states,
+        "user_response_analysis": user_response_analysis,
+    })
+
+
+def _is_update(obj: Dict[str, Any]) -> bool:
+    """An update maps concept names to objects (this rejects a lone per-concept entry)."""
+    return all(isinstance(value, dict) for value in obj.values())
+
+
+def _apply_update(
+    raw: str,
+    knowledge_state: Dict[str, Any],
+    graph: Optional[ConceptGraph],
+) -> Dict[str, Any]:
+    parsed = parse_json_object(raw, accept=_is_update)
+    record_parse("knowledge_update", parsed is not None)
+    if parsed is None:
         return knowledge_state
 
-    updated_state = dict(knowledge_state)
+    gated = clamp_update(
+        graph,
+        knowledge_state,
+        {
+            concept_name: update_info["new_state"]
+            for concept_name, update_info in parsed.items()
+            if isinstance(update_info, dict) and update_info.get("new_state")
+        },
+    )
+    # Copy the per-concept dicts too so earlier states are never mutated.
+    updated_state = {concept: dict(info) for concept, info in knowledge_state.items()}
     for concept_name, update_info in parsed.items():
         if concept_name not in updated_state:
             updated_state[concept_name] = {}
         if isinstance(update_info, dict):
-            new_state = update_info.get("new_state")
-            if new_state:
-                new_state = clamp_state_by_prereqs(
-                    concept_name=concept_name,
-                    proposed_state=new_state,
-                    knowledge_state=updated_state,
-                    concept_graph=concept_graph,
-                    problem_id=problem_id,
-                )
-                updated_state[concept_name]["state"] = new_state
+            if concept_name in gated:
+                updated_state[concept_name]["state"] = gated[concept_name]
             updated_state[concept_name]["evidence"] = update_info.get("evidence", "")
             updated_state[concept_name]["confidence"] = update_info.get("confidence", None)
     return updated_state
 
+
+async def update_dynamic_knowledge_states_batch(
+    *,
+    assistant_messages: List[str],
+    concept_names: List[List[str]],
+    knowledge_states: List[Dict[str, Any]],
+    user_response_analyses: List[str],
+    model_client: Any,
+    concept_graphs: Optional[List[Optional[ConceptGraph]]] = None,
+    max_tokens: int = 1200,
+    show_progress: bool = False,
+    prompt_path: str = "simulation/prompts/dynamic-knowledge-update.txt",
+) -> List[Dict[str, Any]]:
+    """Update several independent knowledge states (one concept graph each) with one batched call."""
+    template = get_prompt(prompt_path)
+    concept_graphs = concept_graphs or [None] * len(knowledge_states)
+    contexts = [
+        [{"role": "system", "content": "You are a professional learning assessment analyst."},
+         {"role": "user", "content": _update_prompt(template, message, names, state, analysis, graph)}]
+        for message, names, state, analysis, graph in zip(
+            assistant_messages, concept_names, knowledge_states, user_response_analyses, concept_graphs
+        )
+    ]
+    if not contexts:
+        return []
+    responses = await model_client.generate_responses(
+        contexts,
+        temperature=0.7,
+        max_tokens=max_tokens,
+        n=1,
+        show_progress=show_progress,
+        stage="knowledge_update",
+        json_schema=[knowledge_update_schema(names) for names in concept_names],
+    )
+    return [
+        _apply_update(response[0] if response else "", state, graph)
+        for response, state, graph in zip(responses, knowledge_states, concept_graphs)
+    ]
+
+
+async def update_dynamic_knowledge_state(
+    *,
+    assistant_message: str,
+    concept_names: List[str],
+    knowledge_state: Dict[str, Any],
+    user_response_analysis: str,
+    model_client: Any,
+    concept_graph: Optional[ConceptGraph] = None,
+    max_tokens: int = 1200,
+    show_progress: bool = False,
+    prompt_path: str = "simulation/prompts/dynamic-knowledge-update.txt",
+) -> Dict[str, Any]:
+    results = await update_dynamic_knowledge_states_batch(
+        assistant_messages=[assistant_message],
+        concept_names=[concept_names],
+        knowledge_states=[knowledge_state],
+        user_response_analyses=[user_response_analysis],
+        model_client=model_client,
+        concept_graphs=[concept_graph],
+        max_tokens=max_tokens,
+        show_progress=show_progress,
+        prompt_path=prompt_path,
+    )
+    return results[0]
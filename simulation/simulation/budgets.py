@@ -0,0 +1,99 @@
+"""Per-stage generation budgets derived from length control and past logs."""
+
+from __future__ import annotations
+
+import glob
+import math
+import re
+from typing import Dict, List, Optional
+
+from ..core.logging import iter_log_entries, log_base_path
+from ..core.usage import percentile
+
+# Rough English/LaTeX token density for short chat messages.
+TOKENS_PER_WORD = 1.6
+# Allowance for the "Thought:" section and the "Message:" label of user-simulator outputs.
+THOUGHT_TOKENS = 256
+DEFAULT_TARGET_WORDS = 20
+MIN_BUDGET = 128
+# Headroom over the observed p95 output length.
+OBSERVED_MARGIN = 1.25
+# Reasoning tokens count against max_tokens; without observed lengths a reasoning
+# model gets this much on top of the visible reply, by effort.
+REASONING_HEADROOM = {"minimal": 256, "low": 1024, "medium": 2048, "high": 4096}
+
+_RANGE_RE = re.compile(r"between\s+(\d+)\s+and\s+(\d+)\s+words", re.IGNORECASE)
+_AROUND_RE = re.compile(r"around\s+(\d+)\s+words", re.IGNORECASE)
+
+
+def parse_length_control(length_text: Optional[str]) -> Optional[tuple[int, int]]:
+    """Parse "between 10 and 25 words" / "around 20 words" into (min, max) words."""
+    if not length_text:
+        return None
+    match = _RANGE_RE.search(length_text)
+    if match:
+        low, high = int(match.group(1)), int(match.group(2))
+        return min(low, high), max(low, high)
+    match = _AROUND_RE.search(length_text)
+    if match:
+        words = int(match.group(1))
+        return words, words
+    return None
+
+
+def load_observed_output_tokens(log_pattern: str) -> Dict[str, List[int]]:
+    """
+    Collect completion token counts per stage from LLM call logs matching a glob.
+    Each matched log is read with its rotated (possibly gzipped) segments.
+    """
+    observed: Dict[str, List[int]] = {}
+    logs = dict.fromkeys(log_base_path(path) for path in sorted(glob.glob(log_pattern)))
+    for path in logs:
+        for entry in iter_log_entries(path):
+            stage = entry.get("stage")
+            usage = entry.get("usage") or {}
+            tokens = usage.get("completion_tokens")
+            if stage and tokens and usage.get("finish_reason") != "length":
+                observed.setdefault(stage, []).append(int(tokens))
+    return observed
+
+
+def observed_p95(observed: Dict[str, List[int]], stage: str) -> Optional[float]:
+    values = observed.get(stage)
+    return percentile(values, 95) if values else None
+
+
+def user_token_budget(
+    length_text: Optional[str],
+    *,
+    observed_p95: Optional[float] = None,
+    ceiling: int = 3000,
+    include_thought: bool = True,
+    reasoning_effort: Optional[str] = None,
+) -> int:
+    """
+    Budget for one user-simulator turn given the conversation's length-control text.
+    `reasoning_effort` is the resolved effort of the user model (None for models
+    without reasoning); observed output lengths already include reasoning tokens.
+    """
+    bounds = parse_length_control(length_text)
+    max_words = bounds[1] if bounds else DEFAULT_TARGET_WORDS
+    budget = math.ceil(max_words * TOKENS_PER_WORD) + (THOUGHT_TOKENS if include_thought else 0)
+    if observed_p95:
+        budget = max(budget, math.ceil(observed_p95 * OBSERVED_MARGIN))
+    elif reasoning_effort:
+        budget += REASONING_HEADROOM.get(reasoning_effort, max(REASONING_HEADROOM.values()))
+    return max(MIN_BUDGET, min(budget, ceiling))
+
+
+def stage_token_budget(
+    stage: str,
+    observed: Dict[str, List[int]],
+    *,
+    default: int,
+) -> int:
+    """Budget for a stage without a length target: observed p95 plus headroom, else `default`."""
+    p95 = observed_p95(observed, stage)
+    if p95 is None:
+        return default
+    return max(MIN_BUDGET, min(default, math.ceil(p95 * OBSERVED_MARGIN)))
@@ -0,0 +1,126 @@
+"""Append-only JSONL checkpoint of finished conversations, resumable and finalized to legacy JSON."""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from .results import open_result_writer
+
+
+def result_key(result: Dict[str, Any]) -> Tuple[str, Any]:
+    """Identity of one conversation: its problem id and, with several students per problem, the student."""
+    return str(result.get("problem_id")), (result.get("metadata") or {}).get("student")
+
+
+class CheckpointWriter:
+    """
+    Appends one JSON line per finished conversation. Lines are flushed at once and
+    fsynced every `fsync_every` lines or `fsync_interval_s` seconds, whichever comes
+    first, and on close; a crash loses at most that batch, plus a partial last line
+    that load_checkpoint skips.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        append: bool = False,
+        fsync_every: int = 16,
+        fsync_interval_s: float = 5.0,
+    ) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval_s = fsync_interval_s
+        self.count = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._f = open(path, "a" if append else "w", encoding="utf-8")
+        if append and self._f.tell() > 0:
+            self._terminate_partial_line()
+
+    def _terminate_partial_line(self) -> None:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                self._f.write("\n")
+
+    def write(self, result: Dict[str, Any]) -> None:
+        self._f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._f.flush()
+        self.count += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval_s:
+            self.sync()
+
+    def sync(self) -> None:
+        if self._unsynced:
+            os.fsync(self._f.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._f.flush()
+            self.sync()
+            self._f.close()
+
+    def __enter__(self) -> "CheckpointWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def load_checkpoint(path: str) -> List[Dict[str, Any]]:
+    """Results in a checkpoint, in write order; a missing file is empty and a torn line is skipped."""
+    if not os.path.exists(path):
+        return []
+    results = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return results
+
+
+def resume_mask(done: Iterable[Dict[str, Any]], keys: Sequence[Hashable]) -> List[bool]:
+    """True for every key that still has to run."""
+    finished = {result_key(result) for result in done}
+    return [key not in finished for key in keys]
+
+
+def finalize_checkpoint(
+    path: str,
+    output_path: str,
+    order: Optional[Sequence[Hashable]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Write the result file for a checkpoint (legacy JSON array, or compressed JSONL for
+    a `.jsonl.gz` path). With `order` (result keys) results follow it, otherwise the
+    checkpoint order; a conversation written twice keeps its last copy. Returns the
+    results as written.
+    """
+    results: Dict[Hashable, Dict[str, Any]] = {}
+    for result in load_checkpoint(path):
+        key = result_key(result)
+        results.pop(key, None)
+        results[key] = result
+    keys = list(results)
+    if order is not None:
+        position = {key: i for i, key in enumerate(order)}
+        keys.sort(key=lambda key: position.get(key, len(position)))
+    with open_result_writer(output_path) as writer:
+        for key in keys:
+            writer.write(results[key])
+    return [results[key] for key in keys]
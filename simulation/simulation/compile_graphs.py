@@ -0,0 +1,143 @@
+"""Compile IU and concept graphs for a whole dataset into one artifact."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Dict
+
+from ..core.cli import split_list
+from ..core.models import SingleModelClient
+from ..core.reasoning import parse_reasoning_profile
+from ..core.usage import format_usage_summary
+from ..data.csv_index import CsvIndex, select_rows
+from ..data.parquet import ParquetRows
+from ..knowledge.graph_artifact import problem_key, template_sha256, validate_iu_graph, write_graph_artifact
+from ..knowledge.iu_cache import IUGraphCache
+from ..knowledge.iu_extraction import extract_iu_graphs
+from ..knowledge.iu_graph import build_concept_graph_from_iu
+
+
+def cli_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Extract and validate graphs for a dataset ahead of simulation.")
+    parser.add_argument("--input_csv", type=str, default="")
+    parser.add_argument("--input_parquet", type=str, default="")
+    parser.add_argument("--levels", type=str, default="")
+    parser.add_argument("--types", type=str, default="")
+    parser.add_argument("--output", type=str, default="")
+    parser.add_argument("--num_conversations", type=int, default=-1)
+    parser.add_argument("--iu_model", type=str, default="gpt-4o-mini")
+    parser.add_argument("--reasoning_profile", type=str, default="default")
+    parser.add_argument("--prompts_root", type=str, default="simulation/prompts")
+    parser.add_argument("--iu_cache", type=str, default="cache/iu_graphs.sqlite")
+    parser.add_argument("--max_concurrency", type=int, default=200)
+    parser.add_argument("--requests_per_minute", type=int, default=100)
+    parser.add_argument("--drop_invalid", action="store_true")
+    return parser
+
+
+def default_artifact_path(input_path: str) -> str:
+    name = os.path.splitext(os.path.basename(os.path.normpath(input_path)))[0]
+    return os.path.join("cache", f"graphs_{name}.bin")
+
+
+async def compile_graphs(args: argparse.Namespace) -> Dict[str, Any]:
+    levels, types = split_list(args.levels), split_list(args.types)
+    if args.input_parquet:
+        source = ParquetRows(args.input_parquet, levels=levels, types=types)
+        rows = source.rows()
+    elif args.input_csv:
+        # Streams the selected rows through the cached byte-offset index.
+        source = CsvIndex.load_or_build(args.input_csv)
+        where = {name: values for name, values in (("level", levels), ("type", types)) if values}
+        limit = args.num_conversations if args.num_conversations > 0 else -1
+        rows = source.rows(select_rows(source, where=where, limit=limit))
+    else:
+        raise ValueError("Pass --input_csv or --input_parquet")
+    # Identical problems (same question and solution) are compiled once.
+    problems: Dict[str, tuple[str, str]] = {}
+    row_count = 0
+    for _, row in rows:
+        if 0 < args.num_conversations <= row_count:
+            break
+        row_count += 1
+        question, answer = row.get("problem", ""), row.get("solution", "")
+        problems.setdefault(problem_key(question, answer), (question, answer))
+
+    model_client = SingleModelClient(
+        args.iu_model,
+        parse_reasoning_profile(args.reasoning_profile),
+        max_concurrency=args.max_concurrency,
+        requests_per_minute=args.requests_per_minute,
+    )
+    iu_cache = IUGraphCache(args.iu_cache) if args.iu_cache else None
+    prompt_path = os.path.join(args.prompts_root, "iu_graph_extraction.txt")
+    iu_graphs, errors = await extract_iu_graphs(
+        problems,
+        model_client=model_client,
+        max_tokens=1200,
+        show_progress=True,
+        prompt_path=prompt_path,
+        cache=iu_cache,
+    )
+    if iu_cache is not None:
+        print(iu_cache.format_stats())
+        iu_cache.close()
+    for key, error in errors.items():
+        print(f"IU graph extraction failed for {key[:12]}: {error}")
+
+    concept_items, id_maps = build_concept_graph_from_iu(iu_graphs)
+    entries: Dict[str, Dict[str, Any]] = {}
+    invalid = 0
+    for key, iu_graph in iu_graphs.items():
+        issues = validate_iu_graph(iu_graph)
+        if issues:
+            invalid += 1
+            print(f"Graph {key[:12]}: {'; '.join(issues)}")
+            if args.drop_invalid:
+                continue
+        entries[key] = {
+            "iu_graph": iu_graph,
+            "concept_items": concept_items.get(key, []),
+            "id_map": id_maps.get(key, {}),
+            "issues": issues,
+        }
+
+    meta = {
+        "input_csv": args.input_csv,
+        "input_parquet": args.input_parquet,
+        "levels": levels,
+        "types": types,
+        "iu_model": args.iu_model,
+        "prompt_sha256": template_sha256(prompt_path),
+        "created": time.time(),
+    }
+    out_path = args.output or default_artifact_path(args.input_parquet or args.input_csv)
+    size = write_graph_artifact(out_path, entries, meta)
+    return {
+        "output": out_path,
+        "rows": row_count,
+        "problems": len(problems),
+        "failed": len(errors),
+        "invalid": invalid,
+        "written": len(entries),
+        "bytes": size,
+    }
+
+
+async def main() -> None:
+    args = cli_parser().parse_args()
+    summary = await compile_graphs(args)
+    print(
+        f"Compiled {summary['written']} graphs for {summary['problems']} problems ({summary['rows']} rows): "
+        f"{summary['failed']} failed, {summary['invalid']} with issues"
+        f"{' (dropped)' if args.drop_invalid else ''}."
+    )
+    print(f"Saved graph artifact to: {summary['output']} ({summary['bytes']} bytes)")
+    print(format_usage_summary())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
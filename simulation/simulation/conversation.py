@@ -2,8 +2,42 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
-from typing import Any, Dict, List, Optional
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from ..core.prompts import CompiledPrompt, split_template_for_caching
+from ..knowledge.graph import ConceptGraph
+from ..knowledge.state import KnowledgeTrace
+from .record import ConversationRecord
+from .snapshot import SimulationInterrupted, read_snapshot, remove_snapshot, rng_state, set_rng_state, write_snapshot
+
+# Placeholders whose values change from turn to turn. In the "cache" prompt layout
+# the sections using them are moved behind the static, per-conversation prefix.
+VOLATILE_PROMPT_FIELDS = (
+    "conversation_history",
+    "knowledge_state_formatted",
+    "askable_concepts",
+    "unknown_unknown_concepts",
+    "assistant_message",
+    "misguided_attempt_hint",
+)
+
+# Placeholder values supplied to the user-simulator templates ("length_control" is
+# added when length control is on). Checked against the templates at startup.
+INITIAL_PROMPT_FIELDS = (
+    "user_profile",
+    "message_style",
+    "math_problem",
+    "conversation_history",
+    "knowledge_state_formatted",
+    "askable_concepts",
+    "unknown_unknown_concepts",
+    "assistant_message",
+)
+TURN_PROMPT_FIELDS = INITIAL_PROMPT_FIELDS + ("misguided_attempt_hint",)
 
 
 def _format_knowledge_state(knowledge_state: Optional[Dict[str, Any]]) -> str:
@@ -34,35 +68,126 @@ def _get_askable_concepts(knowledge_state: Optional[Dict[str, Any]]) -> List[str
     ]
 
 
-def _get_last_assistant_message(assistant_messages: List[Dict[str, str]]) -> str:
-    for message in reversed(assistant_messages):
-        if message.get("role") == "assistant":
-            return message.get("content", "")
-    return ""
-
-
-def _is_stuck(knowledge_state_history: List[Dict[str, Any]]) -> bool:
-    if not knowledge_state_history or len(knowledge_state_history) < 2:
-        return False
-    last_state = knowledge_state_history[-1] or {}
-    prev_state = knowledge_state_history[-2] or {}
-    return json.dumps(last_state, sort_keys=True) == json.dumps(prev_state, sort_keys=True)
+def _is_stuck(knowledge: Optional[KnowledgeTrace]) -> bool:
+    return knowledge is not None and knowledge.is_stuck()
 
 
 def _get_misguided_attempt_hint(
-    knowledge_state: Optional[Dict[str, Any]],
-    knowledge_state_history: List[Dict[str, Any]],
+    unknown_unknowns: List[str],
+    knowledge: Optional[KnowledgeTrace],
 ) -> str:
-    if not knowledge_state:
-        return ""
-    unknown_unknowns = _get_unknown_unknown_concepts(knowledge_state)
     if not unknown_unknowns:
         return ""
-    if _is_stuck(knowledge_state_history):
+    if _is_stuck(knowledge):
         return "If you are stuck, attempt a misguided approach without naming the missing concept."
     return ""
 
 
+def _extract_user_query(user_query_text: str) -> Optional[str]:
+    """
+    Return the message to send to the tutor from a user-simulator output.
+    Outputs with a "Thought:" section keep only the labelled message; response-only
+    outputs are used as-is apart from a stray leading label. None if unparsable.
+    """
+    if "Thought:" in user_query_text:
+        for label in ("Response:", "Query:", "Message:"):
+            if label in user_query_text:
+                return user_query_text.split(label)[1].strip()
+        return None
+    stripped = user_query_text.strip()
+    for label in ("Response:", "Query:", "Message:"):
+        if stripped.startswith(label):
+            return stripped[len(label):].strip()
+    return user_query_text
+
+
+def _prepare_templates(
+    templates: Sequence[Union[str, CompiledPrompt]],
+    prompt_layout: str,
+) -> List[Tuple[CompiledPrompt, ...]]:
+    compiled = [t if isinstance(t, CompiledPrompt) else CompiledPrompt(t) for t in templates]
+    if prompt_layout == "inline":
+        return [(template,) for template in compiled]
+    if prompt_layout == "cache":
+        prepared = []
+        for template in compiled:
+            static_text, volatile_text = split_template_for_caching(template.text, VOLATILE_PROMPT_FIELDS)
+            prepared.append(
+                (CompiledPrompt(static_text, f"{template.name}:static"),
+                 CompiledPrompt(volatile_text, f"{template.name}:volatile"))
+            )
+        return prepared
+    raise ValueError(f"Unsupported prompt_layout: {prompt_layout}")
+
+
+def _knowledge_segments(record: ConversationRecord) -> Dict[str, Any]:
+    """Knowledge-state prompt block, re-rendered only when a concept's state changed."""
+    key = record.knowledge.state_codes() if record.knowledge is not None else b""
+    cached = record.prompt_segments.get("knowledge")
+    if cached is None or cached[0] != key:
+        knowledge_state = record.knowledge_state
+        cached = (key, {
+            "knowledge_state_formatted": _format_knowledge_state(knowledge_state),
+            "askable_concepts": _get_askable_concepts(knowledge_state),
+            "unknown_unknown_concepts": _get_unknown_unknown_concepts(knowledge_state),
+        })
+        record.prompt_segments["knowledge"] = cached
+    return cached[1]
+
+
+def _render_user_messages(
+    template: Tuple[CompiledPrompt, ...],
+    values: Dict[str, Any],
+    record: Optional[ConversationRecord] = None,
+) -> List[Dict[str, str]]:
+    """
+    Render the user-simulator prompt. A split template yields a stable system
+    prefix followed by the volatile turn state, so providers can cache the prefix.
+    The prefix only depends on per-conversation values and is rendered once.
+    """
+    if len(template) == 1:
+        return [{"role": "user", "content": template[0].render(values)}]
+    static_template, volatile_template = template
+    prefix = record.prompt_segments.get(static_template) if record is not None else None
+    if prefix is None:
+        prefix = static_template.render(values)
+        if record is not None:
+            record.prompt_segments[static_template] = prefix
+    return [
+        {"role": "system", "content": prefix},
+        {"role": "user", "content": volatile_template.render(values)},
+    ]
+
+
+def _apply_user_outputs(records: List[ConversationRecord], user_queries: List[List[str]]) -> None:
+    for record, user_query in zip(records, user_queries):
+        user_query_text = user_query[0] if user_query else ""
+        if user_query_text.strip().lower() == "terminate: true":
+            record.finished = True
+            continue
+        query = _extract_user_query(user_query_text)
+        if query is None or not user_query_text:
+            record.add_user_turn(user_query_text, None)
+            record.finished = True
+            continue
+        record.add_user_turn(user_query_text, query)
+
+
+def _apply_assistant_outputs(
+    records: List[ConversationRecord],
+    assistant_responses: List[List[str]],
+    max_turns: int,
+) -> None:
+    for record, assistant_response in zip(records, assistant_responses):
+        assistant_text = assistant_response[0] if assistant_response else ""
+        record.add_assistant_turn(assistant_text)
+        record.turns += 1
+        if not assistant_text:
+            record.finished = True
+        if record.turns >= max_turns:
+            record.over_max = True
+
+
 async def run_conversation_batch(
     *,
     problems: List[str],
@@ -77,74 +202,51 @@ async def run_conversation_batch(
     max_turns: int = 15,
     length_control_bool: bool = False,
     length_control_list: Optional[List[str]] = None,
+    prompt_layout: str = "inline",
+    user_token_budgets: Optional[List[int]] = None,
+    assistant_max_tokens: Optional[int] = None,
+    truncation_retry_max_tokens: Optional[int] = None,
 ) -> List[Dict[str, Any]]:
     """
     Ported from utils.simulate_conversation_in_batch_math_tutoring (no refinement/user profile).
     """
     length_control_list = length_control_list or []
-
-    conversations_data = []
-    for i, problem in enumerate(problems):
-        length_control = length_control_list[i] if length_control_bool else None
-        data = {
-            "problem": problem,
-            "conversation": [],
-            "conversation_history": "",
-            "length_control": length_control,
-            "assistant_messages": [],
-            "first_query": True,
-            "turns": 0,
-            "finished": False,
-            "over_max": False,
-        }
-        assistant_system_prompt = {
-            "role": "system",
-            "content": (
-                "You are a skilled math tutor. Your goal is to help students understand and "
-                "solve problems independently. Provide guidance based on their questions or "
-                "mistakes. Ask questions to encourage their thinking and let students do most "
-                "of the work themselves. Never give out the solution directly to students."
-            ),
-        }
-        data["assistant_messages"].append(assistant_system_prompt)
-        conversations_data.append(data)
+    initial_template, turn_template = _prepare_templates(
+        (prompt_initial_query_template, prompt_template), prompt_layout
+    )
+
+    records = [
+        ConversationRecord(
+            problem,
+            length_control=length_control_list[i] if length_control_bool else None,
+            user_token_budget=user_token_budgets[i] if user_token_budgets else None,
+            with_profile=False,
+        )
+        for i, problem in enumerate(problems)
+    ]
 
     for turn in range(max_turns):
         user_full_contexts = []
         active_conversations = []
-        for data in conversations_data:
-            if data["finished"] or data["over_max"]:
+        for record in records:
+            if not record.active:
                 continue
-            if data["first_query"]:
-                if length_control_bool:
-                    user_message_content = prompt_initial_query_template.format(
-                        math_problem=data["problem"],
-                        conversation_history=data["conversation_history"].strip(),
-                        length_control=data["length_control"],
-                    )
-                else:
-                    user_message_content = prompt_initial_query_template.format(
-                        math_problem=data["problem"],
-                        conversation_history=data["conversation_history"].strip(),
-                    )
-                data["first_query"] = False
+            values = {
+                "math_problem": record.problem,
+                "conversation_history": record.history_text().strip(),
+            }
+            if length_control_bool:
+                values["length_control"] = record.length_control
+            if record.first_query:
+                template = initial_template
+                record.first_query = False
             else:
-                if length_control_bool:
-                    user_message_content = prompt_template.format(
-                        math_problem=data["problem"],
-                        conversation_history=data["conversation_history"].strip(),
-                        length_control=data["length_control"],
-                    )
-                else:
-                    user_message_content = prompt_template.format(
-                        math_problem=data["problem"],
-                        conversation_history=data["conversation_history"].strip(),
-                    )
-
-            user_messages = [{"role": "user", "content": user_message_content}]
-            data["user_messages"] = user_messages
+                template = turn_template
+
+            user_messages = _render_user_messages(template, values, record)
+            record.user_messages = user_messages
             user_full_contexts.append(user_messages)
-            active_conversations.append(data)
+            active_conversations.append(record)
 
         if not active_conversations:
             break
@@ -152,73 +254,165 @@ async def run_conversation_batch(
         user_queries = await user_model_client.generate_responses(
             user_full_contexts,
             temperature=user_temperature,
-            max_tokens=max_tokens,
+            max_tokens=[record.user_token_budget or max_tokens for record in active_conversations],
             show_progress=show_progress,
+            stage="user",
+            retry_truncated_max_tokens=truncation_retry_max_tokens,
         )
+        _apply_user_outputs(active_conversations, user_queries)
 
-        for data, user_query in zip(active_conversations, user_queries):
-            user_query_text = user_query[0] if user_query else ""
-            if user_query_text.strip().lower() == "terminate: true":
-                data["finished"] = True
-                continue
-            data["conversation"].append(("user", user_query_text))
-
-            if "Thought:" in user_query_text:
-                try:
-                    if "Response:" in user_query_text:
-                        query = user_query_text.split("Response:")[1].strip()
-                    elif "Query:" in user_query_text:
-                        query = user_query_text.split("Query:")[1].strip()
-                    else:
-                        query = user_query_text.split("Message:")[1].strip()
-                except Exception:
-                    data["finished"] = True
-                    continue
-            else:
-                query = user_query_text
-
-            if not user_query_text:
-                data["finished"] = True
-                continue
-
-            if len(data["assistant_messages"]) == 1:
-                first_turn_user_query = (
-                    f"Here is the problem that you will tutor me on:\n"
-                    f"{data['problem'].strip()}\n\n{query}"
-                )
-                data["assistant_messages"].append({"role": "user", "content": first_turn_user_query})
-                data["first_query_content"] = query
-            else:
-                data["assistant_messages"].append({"role": "user", "content": query})
-
-        active_conversations = [data for data in active_conversations if not data["finished"]]
+        active_conversations = [record for record in active_conversations if not record.finished]
         if not active_conversations:
             break
 
-        assistant_full_contexts = [data["assistant_messages"] for data in active_conversations]
         assistant_responses = await assistant_model_client.generate_responses(
-            assistant_full_contexts,
+            [record.tutor_messages() for record in active_conversations],
             temperature=assistant_temperature,
-            max_tokens=max_tokens,
+            max_tokens=assistant_max_tokens or max_tokens,
             show_progress=show_progress,
+            stage="assistant",
+            retry_truncated_max_tokens=truncation_retry_max_tokens,
         )
+        _apply_assistant_outputs(active_conversations, assistant_responses, max_turns)
+
+    return [record.to_dict() for record in records]
 
-        for data, assistant_response in zip(active_conversations, assistant_responses):
-            assistant_text = assistant_response[0] if assistant_response else ""
-            data["conversation"].append(("assistant", assistant_text))
-            last_user_message = data["assistant_messages"][-1]["content"]
-            if len(data["assistant_messages"]) == 2:
-                last_user_message = data["first_query_content"]
-            data["conversation_history"] += f"- You: {last_user_message}\n- AI Tutor: {assistant_text}\n"
-            data["assistant_messages"].append({"role": "assistant", "content": assistant_text})
 
-            data["turns"] += 1
-            if not assistant_text:
-                data["finished"] = True
-            if data["turns"] >= max_turns:
-                data["over_max"] = True
+@dataclass
+class TurnSettings:
+    """Everything a profile-conversation turn needs besides the records themselves."""
 
-    return conversations_data
+    user_model_client: Any
+    assistant_model_client: Any
+    initial_template: Tuple[CompiledPrompt, ...]
+    turn_template: Tuple[CompiledPrompt, ...]
+    user_temperature: float = 0.7
+    assistant_temperature: float = 0.0
+    max_tokens: int = 3000
+    max_turns: int = 15
+    length_control_bool: bool = False
+    assistant_max_tokens: Optional[int] = None
+    truncation_retry_max_tokens: Optional[int] = None
+    show_progress: bool = True
+    prompts_root: str = "simulation/prompts"
+
+
+def build_turn_settings(
+    *,
+    prompt_initial_query_template: Union[str, CompiledPrompt],
+    prompt_template: Union[str, CompiledPrompt],
+    prompt_layout: str = "inline",
+    **kwargs: Any,
+) -> TurnSettings:
+    initial_template, turn_template = _prepare_templates(
+        (prompt_initial_query_template, prompt_template), prompt_layout
+    )
+    return TurnSettings(initial_template=initial_template, turn_template=turn_template, **kwargs)
+
+
+async def _update_record_knowledge(record: ConversationRecord, model_client: Any, prompts_root: str) -> None:
+    if record.knowledge is None or record.concept_graph is None or not record.problem_id:
+        return
+    from ..knowledge.extract import extract_explained_concepts
+    from ..knowledge.update import update_dynamic_knowledge_state
+
+    concept_names = record.concept_graph.concept_names
+    if not concept_names:
+        return
+    assistant_text = record.last_assistant_message
+    explained_concepts = await extract_explained_concepts(
+        assistant_message=assistant_text,
+        candidate_concepts=concept_names,
+        model_client=model_client,
+        max_tokens=600,
+        show_progress=False,
+        prompt_path=os.path.join(prompts_root, "dynamic-knowledge-extract.txt"),
+    )
+    if record.explained_concepts_history is None:
+        record.explained_concepts_history = []
+    record.explained_concepts_history.append(explained_concepts)
+    updated_state = await update_dynamic_knowledge_state(
+        assistant_message=assistant_text,
+        concept_names=explained_concepts or concept_names,
+        knowledge_state=record.knowledge_state,
+        user_response_analysis=record.last_user_query,
+        model_client=model_client,
+        max_tokens=1200,
+        show_progress=False,
+        concept_graph=record.concept_graph,
+        prompt_path=os.path.join(prompts_root, "dynamic-knowledge-update.txt"),
+    )
+    record.knowledge.push(updated_state)
+
+
+async def run_profile_turn(records: List[ConversationRecord], settings: TurnSettings) -> None:
+    """One user -> tutor -> knowledge-update round for every active record."""
+    user_full_contexts = []
+    active_conversations = []
+    for record in records:
+        if not record.active:
+            continue
+        values = {
+            "user_profile": record.user_profile,
+            "message_style": record.user_profile,
+            "math_problem": record.problem,
+            "conversation_history": record.history_text().strip(),
+            "assistant_message": record.last_assistant_message,
+            **_knowledge_segments(record),
+        }
+        if settings.length_control_bool:
+            values["length_control"] = record.length_control
+        if record.first_query:
+            template = settings.initial_template
+            record.first_query = False
+        else:
+            template = settings.turn_template
+            values["misguided_attempt_hint"] = _get_misguided_attempt_hint(
+                values["unknown_unknown_concepts"], record.knowledge
+            )
+
+        user_messages = _render_user_messages(template, values, record)
+        record.user_messages = user_messages
+        user_full_contexts.append(user_messages)
+        active_conversations.append(record)
+
+    if not active_conversations:
+        return
+
+    user_queries = await settings.user_model_client.generate_responses(
+        user_full_contexts,
+        temperature=settings.user_temperature,
+        max_tokens=[record.user_token_budget or settings.max_tokens for record in active_conversations],
+        show_progress=settings.show_progress,
+        stage="user",
+        retry_truncated_max_tokens=settings.truncation_retry_max_tokens,
+    )
+    _apply_user_outputs(active_conversations, user_queries)
+
+    active_conversations = [record for record in active_conversations if not record.finished]
+    if not active_conversations:
+        return
+
+    assistant_responses = await settings.assistant_model_client.generate_responses(
+        [record.tutor_messages() for record in active_conversations],
+        temperature=settings.assistant_temperature,
+        max_tokens=settings.assistant_max_tokens or settings.max_tokens,
+        show_progress=settings.show_progress,
+        stage="assistant",
+        retry_truncated_max_tokens=settings.truncation_retry_max_tokens,
+    )
+    _apply_assistant_outputs(active_conversations, assistant_responses, settings.max_turns)
+
+    await asyncio.gather(
+        *(_update_record_knowledge(record, settings.user_model_client, settings.prompts_root) for record in active_conversations)
+    )
+
+
+async def simulate_conversation(record: ConversationRecord, settings: TurnSettings) -> ConversationRecord:
+    """Run one conversation to completion on its own (used by the pooled pipeline)."""
+    while record.active:
+        await run_profile_turn([record], settings)
+    return record
 
 
 async def run_conversation_with_interaction_profile(
@@ -228,9 +422,9 @@ async def run_conversation_with_interaction_profile(
     user_profiles: List[str],
     user_model_client: Any,
     assistant_model_client: Any,
-    prompt_initial_query_template: str,
-    prompt_template: str,
-    concept_graph: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    prompt_initial_query_template: Union[str, CompiledPrompt],
+    prompt_template: Union[str, CompiledPrompt],
+    concept_graph: Optional[Dict[str, Union[List[Dict[str, Any]], ConceptGraph]]] = None,
     knowledge_states: Optional[List[Dict[str, Any]]] = None,
     user_temperature: float = 0.7,
     assistant_temperature: float = 0.0,
@@ -239,213 +433,112 @@ async def run_conversation_with_interaction_profile(
     length_control_bool: bool = False,
     length_control_list: Optional[List[str]] = None,
     show_progress: bool = True,
+    prompt_layout: str = "inline",
+    user_token_budgets: Optional[List[int]] = None,
+    assistant_max_tokens: Optional[int] = None,
+    truncation_retry_max_tokens: Optional[int] = None,
+    metadata: Optional[List[Dict[str, Any]]] = None,
+    on_finished: Optional[Callable[[Dict[str, Any]], None]] = None,
+    snapshot_path: Optional[str] = None,
+    snapshot_every: int = 1,
+    restore: bool = False,
+    stop: Optional[asyncio.Event] = None,
+    prompts_root: str = "simulation/prompts",
 ) -> List[Dict[str, Any]]:
     """
     Ported from utils.simulate_conversation_with_user_profile_in_batch_math_tutoring,
     simplified to interaction-style profiles only.
+    prompt_layout="cache" sends the static prompt sections as a stable prefix.
+    user_token_budgets gives one user-turn max_tokens per conversation; max_tokens
+    is used where no budget is given. `metadata` is attached to each output as-is.
+    `on_finished` gets each output dict as soon as its conversation ends.
+    The knowledge extract/update templates are read from `prompts_root`.
+
+    With `snapshot_path` the full state of every conversation is saved there after
+    every `snapshot_every` turns and removed when the run completes. `restore`
+    continues from a saved snapshot instead of the given inputs (concept graphs are
+    re-attached from `concept_graph`); conversations that had already finished were
+    reported before the snapshot was written and are not reported again. Once `stop`
+    is set, the current turn completes, a snapshot is written (if there is a path)
+    and SimulationInterrupted is raised.
     """
     length_control_list = length_control_list or []
-
-    conversations_data = []
+    settings = build_turn_settings(
+        prompt_initial_query_template=prompt_initial_query_template,
+        prompt_template=prompt_template,
+        prompt_layout=prompt_layout,
+        user_model_client=user_model_client,
+        assistant_model_client=assistant_model_client,
+        user_temperature=user_temperature,
+        assistant_temperature=assistant_temperature,
+        max_tokens=max_tokens,
+        max_turns=max_turns,
+        length_control_bool=length_control_bool,
+        assistant_max_tokens=assistant_max_tokens,
+        truncation_retry_max_tokens=truncation_retry_max_tokens,
+        show_progress=show_progress,
+        prompts_root=prompts_root,
+    )
+
+    records = []
     for i, problem in enumerate(problems):
-        length_control = length_control_list[i] if length_control_bool else None
-        knowledge_state = knowledge_states[i] if knowledge_states else None
         problem_id = problem_ids[i] if problem_ids else None
-        data = {
-            "problem": problem,
-            "problem_id": problem_id,
-            "user_profile": user_profiles[i],
-            "length_control": length_control,
-            "knowledge_state": knowledge_state,
-            "knowledge_state_history": [knowledge_state] if knowledge_state else [],
-            "conversation": [],
-            "conversation_history": "",
-            "assistant_messages": [],
-            "first_query": True,
-            "turns": 0,
-            "finished": False,
-            "over_max": False,
-        }
-        assistant_system_prompt = {
-            "role": "system",
-            "content": (
-                "You are a skilled math tutor. Your goal is to help students understand and "
-                "solve problems independently. Provide guidance based on their questions or "
-                "mistakes. Ask questions to encourage their thinking and let students do most "
-                "of the work themselves. Never give out the solution directly to students."
-            ),
-        }
-        data["assistant_messages"].append(assistant_system_prompt)
-        conversations_data.append(data)
-
-    for turn in range(max_turns):
-        user_full_contexts = []
-        active_conversations = []
-        for data in conversations_data:
-            if data["finished"] or data["over_max"]:
-                continue
-            if data["first_query"]:
-                if length_control_bool:
-                    user_message_content = prompt_initial_query_template.format(
-                        user_profile=data["user_profile"],
-                        message_style=data["user_profile"],
-                        math_problem=data["problem"],
-                        conversation_history=data["conversation_history"].strip(),
-                        length_control=data["length_control"],
-                        knowledge_state_formatted=_format_knowledge_state(data.get("knowledge_state")),
-                        askable_concepts=_get_askable_concepts(data.get("knowledge_state")),
-                        unknown_unknown_concepts=_get_unknown_unknown_concepts(data.get("knowledge_state")),
-                        assistant_message=_get_last_assistant_message(data.get("assistant_messages", [])),
-                    )
-                else:
-                    user_message_content = prompt_initial_query_template.format(
-                        user_profile=data["user_profile"],
-                        message_style=data["user_profile"],
-                        math_problem=data["problem"],
-                        conversation_history=data["conversation_history"].strip(),
-                        knowledge_state_formatted=_format_knowledge_state(data.get("knowledge_state")),
-                        askable_concepts=_get_askable_concepts(data.get("knowledge_state")),
-                        unknown_unknown_concepts=_get_unknown_unknown_concepts(data.get("knowledge_state")),
-                        assistant_message=_get_last_assistant_message(data.get("assistant_messages", [])),
-                    )
-                data["first_query"] = False
-            else:
-                if length_control_bool:
-                    user_message_content = prompt_template.format(
-                        user_profile=data["user_profile"],
-                        message_style=data["user_profile"],
-                        math_problem=data["problem"],
-                        conversation_history=data["conversation_history"].strip(),
-                        length_control=data["length_control"],
-                        knowledge_state_formatted=_format_knowledge_state(data.get("knowledge_state")),
-                        askable_concepts=_get_askable_concepts(data.get("knowledge_state")),
-                        unknown_unknown_concepts=_get_unknown_unknown_concepts(data.get("knowledge_state")),
-                        assistant_message=_get_last_assistant_message(data.get("assistant_messages", [])),
-                        misguided_attempt_hint=_get_misguided_attempt_hint(
-                            data.get("knowledge_state"),
-                            data.get("knowledge_state_history", []),
-                        ),
-                    )
-                else:
-                    user_message_content = prompt_template.format(
-                        user_profile=data["user_profile"],
-                        message_style=data["user_profile"],
-                        math_problem=data["problem"],
-                        conversation_history=data["conversation_history"].strip(),
-                        knowledge_state_formatted=_format_knowledge_state(data.get("knowledge_state")),
-                        askable_concepts=_get_askable_concepts(data.get("knowledge_state")),
-                        unknown_unknown_concepts=_get_unknown_unknown_concepts(data.get("knowledge_state")),
-                        assistant_message=_get_last_assistant_message(data.get("assistant_messages", [])),
-                        misguided_attempt_hint=_get_misguided_attempt_hint(
-                            data.get("knowledge_state"),
-                            data.get("knowledge_state_history", []),
-                        ),
-                    )
-
-            user_messages = [{"role": "user", "content": user_message_content}]
-            data["user_messages"] = user_messages
-            user_full_contexts.append(user_messages)
-            active_conversations.append(data)
-
-        if not active_conversations:
-            break
-
-        user_queries = await user_model_client.generate_responses(
-            user_full_contexts,
-            temperature=user_temperature,
-            max_tokens=max_tokens,
-            show_progress=show_progress,
+        record = ConversationRecord(
+            problem,
+            problem_id=problem_id,
+            user_profile=user_profiles[i],
+            length_control=length_control_list[i] if length_control_bool else None,
+            knowledge_state=knowledge_states[i] if knowledge_states else None,
+            user_token_budget=user_token_budgets[i] if user_token_budgets else None,
+        )
+        if concept_graph is not None and problem_id:
+            graph = concept_graph.get(str(problem_id), [])
+            record.concept_graph = graph if isinstance(graph, ConceptGraph) else ConceptGraph(graph)
+        if metadata:
+            record.metadata = metadata[i]
+        records.append(record)
+
+    start_turn = 0
+    saved = read_snapshot(snapshot_path) if restore and snapshot_path else None
+    if saved is not None:
+        set_rng_state(saved["rng"])
+        start_turn = saved["turn"]
+        records = []
+        for data in saved["records"]:
+            graph = concept_graph.get(str(data["problem_id"]), []) if concept_graph is not None else None
+            if graph is not None and not isinstance(graph, ConceptGraph):
+                graph = ConceptGraph(graph)
+            records.append(ConversationRecord.from_snapshot(data, graph))
+
+    def save(turn: int) -> None:
+        write_snapshot(
+            snapshot_path,
+            {"turn": turn, "records": [record.to_snapshot() for record in records], "rng": rng_state()},
         )
 
-        for data, user_query in zip(active_conversations, user_queries):
-            user_query_text = user_query[0] if user_query else ""
-            if user_query_text.strip().lower() == "terminate: true":
-                data["finished"] = True
-                continue
-            data["conversation"].append(("user", user_query_text))
-            if "Thought:" in user_query_text:
-                try:
-                    if "Response:" in user_query_text:
-                        query = user_query_text.split("Response:")[1].strip()
-                    elif "Query:" in user_query_text:
-                        query = user_query_text.split("Query:")[1].strip()
-                    else:
-                        query = user_query_text.split("Message:")[1].strip()
-                except Exception:
-                    data["finished"] = True
-                    continue
-            else:
-                query = user_query_text
-
-            if not user_query_text:
-                data["finished"] = True
-                continue
+    # report() runs before every save, so finished records in a snapshot are already out.
+    reported = [not record.active for record in records] if saved is not None else [False] * len(records)
 
-            if len(data["assistant_messages"]) == 1:
-                first_turn_user_query = (
-                    f"Here is the problem that you will tutor me on:\n"
-                    f"{data['problem'].strip()}\n\n{query}"
-                )
-                data["assistant_messages"].append({"role": "user", "content": first_turn_user_query})
-                data["first_query_content"] = query
-            else:
-                data["assistant_messages"].append({"role": "user", "content": query})
+    def report(final: bool) -> None:
+        if on_finished is None:
+            return
+        for i, record in enumerate(records):
+            if not reported[i] and (final or not record.active):
+                reported[i] = True
+                on_finished(record.to_dict())
 
-        active_conversations = [data for data in active_conversations if not data["finished"]]
-        if not active_conversations:
+    for turn in range(start_turn, max_turns):
+        if not any(record.active for record in records):
             break
-
-        assistant_full_contexts = [data["assistant_messages"] for data in active_conversations]
-        assistant_responses = await assistant_model_client.generate_responses(
-            assistant_full_contexts,
-            temperature=assistant_temperature,
-            max_tokens=max_tokens,
-            show_progress=show_progress,
-        )
-
-        for data, assistant_response in zip(active_conversations, assistant_responses):
-            assistant_text = assistant_response[0] if assistant_response else ""
-            data["conversation"].append(("assistant", assistant_text))
-            last_user_message = data["assistant_messages"][-1]["content"]
-            if len(data["assistant_messages"]) == 2:
-                last_user_message = data["first_query_content"]
-            data["conversation_history"] += f"- You: {last_user_message}\n- AI Tutor: {assistant_text}\n"
-            data["assistant_messages"].append({"role": "assistant", "content": assistant_text})
-            data["turns"] += 1
-            if not assistant_text:
-                data["finished"] = True
-            if data["turns"] >= max_turns:
-                data["over_max"] = True
-
-            if data.get("knowledge_state") is not None and concept_graph is not None and data.get("problem_id"):
-                from ..knowledge.extract import extract_explained_concepts
-                from ..knowledge.update import update_dynamic_knowledge_state
-
-                concept_items = concept_graph.get(str(data["problem_id"]), [])
-                concept_names = [item.get("concept_id", "") for item in concept_items if item.get("concept_id")]
-                if concept_names:
-                    explained_concepts = await extract_explained_concepts(
-                        assistant_message=assistant_text,
-                        candidate_concepts=concept_names,
-                        model_client=user_model_client,
-                        max_tokens=600,
-                        show_progress=False,
-                    )
-                    data["explained_concepts_history"] = data.get("explained_concepts_history", [])
-                    data["explained_concepts_history"].append(explained_concepts)
-                    updated_state = await update_dynamic_knowledge_state(
-                        assistant_message=assistant_text,
-                        concept_names=explained_concepts or concept_names,
-                        knowledge_state=data["knowledge_state"],
-                        user_response_analysis=last_user_message,
-                        model_client=user_model_client,
-                        max_tokens=1200,
-                        show_progress=False,
-                        concept_graph=concept_graph,
-                        problem_id=str(data.get("problem_id")) if data.get("problem_id") else None,
-                    )
-                    data["knowledge_state"] = updated_state
-                    data["knowledge_state_history"].append(updated_state)
-
-    return conversations_data
-
+        await run_profile_turn(records, settings)
+        report(final=False)
+        stopping = stop is not None and stop.is_set()
+        if snapshot_path and (stopping or (turn + 1) % max(1, snapshot_every) == 0):
+            save(turn + 1)
+        if stopping:
+            raise SimulationInterrupted(snapshot_path, turn + 1)
+
+    report(final=True)
+    if snapshot_path:
+        remove_snapshot(snapshot_path)
+    return [record.to_dict() for record in records]
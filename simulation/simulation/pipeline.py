@@ -0,0 +1,146 @@
+"""Streaming run mode: problems flow through graph preparation, a fixed-size
+conversation pool and an incremental writer, joined by bounded queues."""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import textwrap
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Sequence
+
+from .conversation import TurnSettings, simulate_conversation
+from .record import ConversationRecord
+
+_DONE = object()
+
+
+class JsonArrayWriter:
+    """
+    Writes a JSON array one element at a time, laid out exactly like
+    json.dump(items, f, indent=2), so finished conversations need not be kept.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.count = 0
+        self._f = open(path, "w", encoding="utf-8")
+        self._f.write("[")
+
+    def write(self, item: Dict[str, Any]) -> None:
+        text = textwrap.indent(json.dumps(item, indent=2), "  ")
+        self._f.write(("\n" if self.count == 0 else ",\n") + text)
+        self._f.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        self._f.write("\n]" if self.count else "]")
+        self._f.close()
+
+    def __enter__(self) -> "JsonArrayWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+async def run_streaming_pipeline(
+    annotations: Iterable[Dict[str, Any]],
+    prepare: Callable[[Dict[str, Any]], Awaitable[Sequence[ConversationRecord]]],
+    settings: TurnSettings,
+    on_result: Callable[[Dict[str, Any]], None],
+    *,
+    pool_size: int = 32,
+    extract_workers: int = 8,
+    queue_size: int = 64,
+    priority: Optional[Callable[[ConversationRecord], float]] = None,
+) -> int:
+    """
+    Run conversations as their problems become ready.
+
+    `annotations` is consumed lazily. `extract_workers` tasks turn each one into
+    ConversationRecords via `prepare` (IU extraction, knowledge init, ...; an empty
+    list skips the annotation, several records simulate several students); a record
+    joins the pool of `pool_size` running conversations as soon as a slot frees,
+    and each finished conversation is handed to `on_result` as its output dict.
+    Every queue holds at most `queue_size` items, so a slow stage holds back the
+    ones before it. Results arrive in completion order, not input order.
+    With `priority`, a free slot takes the ready record with the highest priority
+    instead of the oldest one, and records carrying metadata get their admission
+    index stored as metadata["admitted"].
+    Returns the number of conversations written.
+    """
+    pending: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    ready: asyncio.Queue = (
+        asyncio.PriorityQueue(maxsize=queue_size) if priority else asyncio.Queue(maxsize=queue_size)
+    )
+    admitted = itertools.count()
+    sequence = itertools.count()
+
+    def ready_item(record: Any) -> Any:
+        if not priority:
+            return record
+        # Sentinels sort after every record; the sequence number breaks ties.
+        rank = float("inf") if record is _DONE else -priority(record)
+        return rank, next(sequence), record
+    finished: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def feed() -> None:
+        for ann in annotations:
+            await pending.put(ann)
+        for _ in range(extract_workers):
+            await pending.put(_DONE)
+
+    async def prepare_worker() -> None:
+        while True:
+            ann = await pending.get()
+            if ann is _DONE:
+                return
+            for record in await prepare(ann):
+                await ready.put(ready_item(record))
+
+    async def close_ready(workers: list) -> None:
+        await asyncio.gather(*workers)
+        for _ in range(pool_size):
+            await ready.put(ready_item(_DONE))
+
+    async def pool_worker() -> None:
+        while True:
+            record = await ready.get()
+            if priority:
+                record = record[2]
+            if record is _DONE:
+                return
+            if record.metadata is not None:
+                record.metadata["admitted"] = next(admitted)
+            await simulate_conversation(record, settings)
+            await finished.put(record.to_dict())
+
+    async def close_finished(workers: list) -> None:
+        await asyncio.gather(*workers)
+        await finished.put(_DONE)
+
+    async def write() -> int:
+        written = 0
+        while True:
+            result = await finished.get()
+            if result is _DONE:
+                return written
+            on_result(result)
+            written += 1
+
+    preparers = [asyncio.create_task(prepare_worker()) for _ in range(extract_workers)]
+    runners = [asyncio.create_task(pool_worker()) for _ in range(pool_size)]
+    tasks = [
+        asyncio.create_task(write()),
+        asyncio.create_task(feed()),
+        asyncio.create_task(close_ready(preparers)),
+        asyncio.create_task(close_finished(runners)),
+    ]
+    # gather re-raises the first failure from any stage instead of leaving the rest waiting.
+    try:
+        results = await asyncio.gather(*tasks, *preparers, *runners)
+    finally:
+        for task in tasks + preparers + runners:
+            task.cancel()
+    return results[0]
@@ -0,0 +1,232 @@
+"""Compact per-conversation state with a single append-only turn store."""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..knowledge.graph import ConceptGraph
+from ..knowledge.state import KnowledgeTrace
+
+TUTOR_SYSTEM_PROMPT = (
+    "You are a skilled math tutor. Your goal is to help students understand and "
+    "solve problems independently. Provide guidance based on their questions or "
+    "mistakes. Ask questions to encourage their thinking and let students do most "
+    "of the work themselves. Never give out the solution directly to students."
+)
+
+# (role, raw text, text forwarded to the tutor or None). For user turns without a
+# Thought section the forwarded text is the raw string itself, so nothing is copied.
+Turn = Tuple[str, str, Optional[str]]
+
+
+class ConversationRecord:
+    """
+    One simulated conversation. Turns are stored once; the tutor message list,
+    the history text and the legacy output dict are built from them on demand.
+    """
+
+    __slots__ = (
+        "problem",
+        "problem_id",
+        "user_profile",
+        "length_control",
+        "knowledge",
+        "concept_graph",
+        "explained_concepts_history",
+        "user_token_budget",
+        "user_messages",
+        "first_query",
+        "turns",
+        "finished",
+        "over_max",
+        "with_profile",
+        "prompt_segments",
+        "metadata",
+        "_turns",
+    )
+
+    def __init__(
+        self,
+        problem: str,
+        *,
+        problem_id: Optional[str] = None,
+        user_profile: Optional[str] = None,
+        length_control: Optional[str] = None,
+        knowledge_state: Optional[Dict[str, Any]] = None,
+        user_token_budget: Optional[int] = None,
+        with_profile: bool = True,
+    ) -> None:
+        self.problem = problem
+        self.problem_id = problem_id
+        self.user_profile = user_profile
+        self.length_control = length_control
+        self.knowledge: Optional[KnowledgeTrace] = (
+            KnowledgeTrace(knowledge_state) if knowledge_state is not None else None
+        )
+        # This problem's compiled concept graph; None when knowledge updates are off.
+        self.concept_graph: Optional[ConceptGraph] = None
+        self.explained_concepts_history: Optional[List[List[str]]] = None
+        self.user_token_budget = user_token_budget
+        self.user_messages: Optional[List[Dict[str, str]]] = None
+        self.first_query = True
+        self.turns = 0
+        self.finished = False
+        self.over_max = False
+        self.with_profile = with_profile
+        # Rendered prompt pieces reused across turns while their inputs are unchanged.
+        self.prompt_segments: Dict[Any, Any] = {}
+        # Scheduling features and predictions (see scheduling.py), saved with the output.
+        self.metadata: Optional[Dict[str, Any]] = None
+        self._turns: List[Turn] = []
+
+    @property
+    def knowledge_state(self) -> Optional[Dict[str, Any]]:
+        """Current knowledge state as a fresh dict, or None without a knowledge model."""
+        return self.knowledge.current() if self.knowledge is not None else None
+
+    @property
+    def active(self) -> bool:
+        return not (self.finished or self.over_max)
+
+    def add_user_turn(self, raw_text: str, query: Optional[str]) -> None:
+        """Record a user-simulator output; `query` is None if it is not sent to the tutor."""
+        self._turns.append(("user", raw_text, query))
+
+    def add_assistant_turn(self, text: str) -> None:
+        self._turns.append(("assistant", text, text))
+
+    def _exchanges(self) -> List[Tuple[str, str]]:
+        """(user query, tutor reply) pairs seen by the tutor, in order."""
+        pairs = []
+        pending: Optional[str] = None
+        for role, _, tutor_text in self._turns:
+            if tutor_text is None:
+                continue
+            if role == "user":
+                pending = tutor_text
+            elif pending is not None:
+                pairs.append((pending, tutor_text))
+                pending = None
+        return pairs
+
+    @property
+    def first_query_content(self) -> Optional[str]:
+        for role, _, tutor_text in self._turns:
+            if role == "user" and tutor_text is not None:
+                return tutor_text
+        return None
+
+    @property
+    def last_user_query(self) -> str:
+        for role, _, tutor_text in reversed(self._turns):
+            if role == "user" and tutor_text is not None:
+                return tutor_text
+        return ""
+
+    @property
+    def last_assistant_message(self) -> str:
+        for role, text, _ in reversed(self._turns):
+            if role == "assistant":
+                return text
+        return ""
+
+    @property
+    def conversation(self) -> List[Tuple[str, str]]:
+        return [(role, text) for role, text, _ in self._turns]
+
+    def tutor_messages(self) -> List[Dict[str, str]]:
+        """The tutor's chat context: system prompt, then the forwarded turns."""
+        messages = [{"role": "system", "content": TUTOR_SYSTEM_PROMPT}]
+        first = True
+        for role, _, tutor_text in self._turns:
+            if tutor_text is None:
+                continue
+            if role == "user" and first:
+                tutor_text = (
+                    f"Here is the problem that you will tutor me on:\n"
+                    f"{self.problem.strip()}\n\n{tutor_text}"
+                )
+                first = False
+            messages.append({"role": role, "content": tutor_text})
+        return messages
+
+    def history_text(self) -> str:
+        return "".join(f"- You: {query}\n- AI Tutor: {reply}\n" for query, reply in self._exchanges())
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        """
+        Everything needed to continue this conversation from its last completed
+        turn. The concept graph is left out; it is re-attached from the problem id.
+        """
+        return {
+            "problem": self.problem,
+            "problem_id": self.problem_id,
+            "user_profile": self.user_profile,
+            "length_control": self.length_control,
+            "knowledge": self.knowledge.to_snapshot() if self.knowledge is not None else None,
+            "explained_concepts_history": self.explained_concepts_history,
+            "user_token_budget": self.user_token_budget,
+            "user_messages": self.user_messages,
+            "first_query": self.first_query,
+            "turns": self.turns,
+            "finished": self.finished,
+            "over_max": self.over_max,
+            "with_profile": self.with_profile,
+            "metadata": self.metadata,
+            "log": [list(turn) for turn in self._turns],
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, Any], concept_graph: Optional[ConceptGraph] = None) -> "ConversationRecord":
+        record = cls(
+            data["problem"],
+            problem_id=data["problem_id"],
+            user_profile=data["user_profile"],
+            length_control=data["length_control"],
+            user_token_budget=data["user_token_budget"],
+            with_profile=data["with_profile"],
+        )
+        if data["knowledge"] is not None:
+            record.knowledge = KnowledgeTrace.from_snapshot(data["knowledge"])
+        record.concept_graph = concept_graph
+        record.explained_concepts_history = data["explained_concepts_history"]
+        record.user_messages = data["user_messages"]
+        record.first_query = data["first_query"]
+        record.turns = data["turns"]
+        record.finished = data["finished"]
+        record.over_max = data["over_max"]
+        record.metadata = data["metadata"]
+        record._turns = [tuple(turn) for turn in data["log"]]
+        return record
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Legacy output dict (same keys as the former per-conversation dicts)."""
+        data: Dict[str, Any] = {"problem": self.problem}
+        if self.with_profile:
+            data["problem_id"] = self.problem_id
+            data["user_profile"] = self.user_profile
+        data["length_control"] = self.length_control
+        if self.with_profile:
+            data["knowledge_state"] = self.knowledge_state
+            data["knowledge_state_history"] = self.knowledge.history() if self.knowledge is not None else []
+        data["conversation"] = self.conversation
+        data["conversation_history"] = self.history_text()
+        data["assistant_messages"] = self.tutor_messages()
+        data["first_query"] = self.first_query
+        data["turns"] = self.turns
+        data["finished"] = self.finished
+        data["over_max"] = self.over_max
+        if self.user_token_budget is not None:
+            data["user_token_budget"] = self.user_token_budget
+        if self.user_messages is not None:
+            data["user_messages"] = self.user_messages
+        first_query_content = self.first_query_content
+        if first_query_content is not None:
+            data["first_query_content"] = first_query_content
+        if self.explained_concepts_history is not None:
+            data["explained_concepts_history"] = self.explained_concepts_history
+        if self.concept_graph is not None:
+            data["concept_graph"] = self.concept_graph.items
+        if self.metadata is not None:
+            data["metadata"] = self.metadata
+        return data
@@ -0,0 +1,189 @@
+"""Result files: legacy JSON arrays and gzip-compressed JSONL with a problem id index."""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .pipeline import JsonArrayWriter
+
+COMPRESSED_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 1
+RESULT_FORMATS = {"json": ".json", "jsonl.gz": COMPRESSED_SUFFIX}
+
+
+def result_suffix(path: str) -> str:
+    for suffix in (COMPRESSED_SUFFIX, ".jsonl", ".json"):
+        if path.endswith(suffix):
+            return suffix
+    return os.path.splitext(path)[1]
+
+
+def result_stem(path: str) -> str:
+    """`path` without its result suffix, e.g. for naming derived files."""
+    suffix = result_suffix(path)
+    return path[: len(path) - len(suffix)] if suffix else path
+
+
+def _index_key(problem_id: Any, student: Any = None) -> str:
+    return str(problem_id) if student is None else f"{problem_id}#{student}"
+
+
+class CompressedResultWriter:
+    """
+    Writes one JSON line per result, each compressed as its own gzip member, so the
+    file is ordinary gzip JSONL (zcat, gzip.open) and any result can be decompressed
+    alone. On close a sidecar index `<path>.idx.json` maps problem ids (with the
+    student when there are several per problem) to byte ranges.
+    """
+
+    def __init__(self, path: str, compresslevel: int = 6) -> None:
+        self.path = path
+        self.compresslevel = compresslevel
+        self.count = 0
+        self._offset = 0
+        self._index: Dict[str, List[int]] = {}
+        self._f = open(path, "wb")
+
+    def write(self, item: Dict[str, Any]) -> None:
+        line = json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n"
+        member = gzip.compress(line.encode("utf-8"), compresslevel=self.compresslevel, mtime=0)
+        self._f.write(member)
+        key = _index_key(item.get("problem_id"), (item.get("metadata") or {}).get("student"))
+        self._index[key] = [self._offset, len(member)]
+        self._offset += len(member)
+        self.count += 1
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        self._f.close()
+        index_path = self.path + INDEX_SUFFIX
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": INDEX_VERSION, "size": self._offset, "entries": self._index},
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, index_path)
+
+    def __enter__(self) -> "CompressedResultWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def open_result_writer(path: str) -> Any:
+    """A JsonArrayWriter or CompressedResultWriter, chosen by the suffix of `path`."""
+    if path.endswith(COMPRESSED_SUFFIX):
+        return CompressedResultWriter(path)
+    return JsonArrayWriter(path)
+
+
+def _iter_json_array(f: Any, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Elements of a top-level JSON array, decoded one at a time from a text stream."""
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size)
+    pos = len(buf) - len(buf.lstrip())
+    if buf[pos:pos + 1] != "[":
+        raise ValueError("Result file is not a JSON array")
+    buf = buf[pos + 1:]
+    eof = False
+    while True:
+        stripped = buf.lstrip().lstrip(",").lstrip()
+        if stripped.startswith("]"):
+            return
+        if not stripped and eof:
+            raise ValueError("Unterminated JSON array")
+        try:
+            item, end = decoder.raw_decode(stripped)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more = f.read(max(chunk_size, len(buf)))
+            eof = not more
+            buf = stripped + more
+            continue
+        yield item
+        buf = stripped[end:]
+
+
+class ResultReader:
+    """
+    Reads a result file without loading it whole: a legacy JSON array, a plain JSONL
+    checkpoint or a compressed JSONL file. Iteration streams results in file order;
+    `get` fetches one conversation, through the index when the file has one.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.suffix = result_suffix(path)
+        self._index: Optional[Dict[str, List[int]]] = None
+        if self.suffix == COMPRESSED_SUFFIX and os.path.exists(path + INDEX_SUFFIX):
+            with open(path + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            # An index from an older write of the same path would point at the wrong bytes.
+            if index.get("version") == INDEX_VERSION and index.get("size") == os.path.getsize(path):
+                self._index = index["entries"]
+
+    @property
+    def indexed(self) -> bool:
+        return self._index is not None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if self.suffix == COMPRESSED_SUFFIX:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                yield from self._iter_lines(f)
+        elif self.suffix == ".jsonl":
+            with open(self.path, "r", encoding="utf-8") as f:
+                yield from self._iter_lines(f)
+        else:
+            with open(self.path, "r", encoding="utf-8") as f:
+                yield from _iter_json_array(f)
+
+    @staticmethod
+    def _iter_lines(f: Any) -> Iterator[Dict[str, Any]]:
+        # A torn last line (a checkpoint still being written) is skipped, as in load_checkpoint.
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+    def __len__(self) -> int:
+        if self._index is not None:
+            return len(self._index)
+        return sum(1 for _ in self)
+
+    def keys(self) -> List[Tuple[str, Optional[str]]]:
+        """(problem id, student) of every result; students are None with one per problem."""
+        if self._index is not None:
+            return [tuple(key.split("#", 1)) if "#" in key else (key, None) for key in self._index]
+        keys = []
+        for result in self:
+            student = (result.get("metadata") or {}).get("student")
+            keys.append((str(result.get("problem_id")), None if student is None else str(student)))
+        return keys
+
+    def get(self, problem_id: Any, student: Any = None) -> Optional[Dict[str, Any]]:
+        """The result for `problem_id` (and `student`), or None when the file has none."""
+        key = _index_key(problem_id, student)
+        if self._index is not None:
+            if key not in self._index:
+                return None
+            offset, length = self._index[key]
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                member = f.read(length)
+            return json.loads(gzip.decompress(member).decode("utf-8"))
+        for result in self:
+            if _index_key(result.get("problem_id"), (result.get("metadata") or {}).get("student")) == key:
+                return result
+        return None
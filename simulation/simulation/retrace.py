@@ -0,0 +1,153 @@
+"""Re-run only the knowledge stages over saved transcripts."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..core.models import SingleModelClient
+from ..core.reasoning import parse_reasoning_profile
+from ..core.usage import format_usage_summary
+from ..knowledge.extract import extract_explained_concepts_batch
+from ..knowledge.graph import ConceptGraph
+from ..knowledge.state import KnowledgeTrace
+from ..knowledge.update import update_dynamic_knowledge_states_batch
+from .results import COMPRESSED_SUFFIX, ResultReader, open_result_writer, result_stem
+
+
+def cli_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Replay knowledge extraction and updates over saved conversations.")
+    parser.add_argument("--input", type=str, required=True)
+    parser.add_argument("--output", type=str, default="")
+    parser.add_argument("--model", type=str, default="gpt-5-mini")
+    parser.add_argument("--reasoning_profile", type=str, default="default")
+    parser.add_argument("--prompts_root", type=str, default="simulation/prompts")
+    parser.add_argument("--extract_prompt", type=str, default="")
+    parser.add_argument("--update_prompt", type=str, default="")
+    return parser
+
+
+def tutor_exchanges(result: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(user query, tutor reply) pairs as the knowledge update saw them during simulation."""
+    messages = [m for m in result.get("assistant_messages", []) if m.get("role") != "system"]
+    pairs = []
+    pending: Optional[str] = None
+    for message in messages:
+        if message.get("role") == "user":
+            pending = message.get("content", "")
+        elif pending is not None:
+            pairs.append((pending, message.get("content", "")))
+            pending = None
+    # The tutor saw the first query behind a problem preamble; the update saw it bare.
+    if pairs and result.get("first_query_content") is not None:
+        pairs[0] = (result["first_query_content"], pairs[0][1])
+    return pairs
+
+
+class _Retrace:
+    __slots__ = ("result", "concept_graph", "exchanges", "knowledge", "explained")
+
+    def __init__(self, result: Dict[str, Any]) -> None:
+        self.result = result
+        self.concept_graph = ConceptGraph(result["concept_graph"])
+        self.exchanges = tutor_exchanges(result)
+        self.knowledge = KnowledgeTrace(result["knowledge_state_history"][0])
+        self.explained: List[List[str]] = []
+
+    @property
+    def concept_names(self) -> List[str]:
+        return self.concept_graph.concept_names
+
+
+async def retrace_results(
+    results: List[Dict[str, Any]],
+    *,
+    model_client: Any,
+    extract_prompt_path: str,
+    update_prompt_path: str,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Rebuild knowledge_state_history (and explained_concepts_history) for every saved
+    conversation that has a concept graph and a starting state. Turn t of every
+    conversation only depends on turn t-1 of the same conversation, so each turn
+    depth is sent as one extraction batch and one update batch.
+    Returns the new results and the number of conversations re-traced.
+    """
+    traces = [
+        _Retrace(result)
+        for result in results
+        if result.get("concept_graph") and result.get("knowledge_state_history")
+    ]
+    traces = [trace for trace in traces if trace.concept_names]
+    depth = max((len(trace.exchanges) for trace in traces), default=0)
+
+    for turn in range(depth):
+        active = [trace for trace in traces if turn < len(trace.exchanges)]
+        explained = await extract_explained_concepts_batch(
+            assistant_messages=[trace.exchanges[turn][1] for trace in active],
+            candidate_concepts=[trace.concept_names for trace in active],
+            model_client=model_client,
+            max_tokens=600,
+            prompt_path=extract_prompt_path,
+        )
+        states = await update_dynamic_knowledge_states_batch(
+            assistant_messages=[trace.exchanges[turn][1] for trace in active],
+            concept_names=[found or trace.concept_names for found, trace in zip(explained, active)],
+            knowledge_states=[trace.knowledge.current() for trace in active],
+            user_response_analyses=[trace.exchanges[turn][0] for trace in active],
+            model_client=model_client,
+            concept_graphs=[trace.concept_graph for trace in active],
+            max_tokens=1200,
+            prompt_path=update_prompt_path,
+        )
+        for trace, found, state in zip(active, explained, states):
+            trace.explained.append(found)
+            trace.knowledge.push(state)
+
+    retraced = {id(trace.result): trace for trace in traces}
+    output = []
+    for result in results:
+        trace = retraced.get(id(result))
+        if trace is None:
+            output.append(result)
+            continue
+        result = dict(result)
+        result["knowledge_state"] = trace.knowledge.current()
+        result["knowledge_state_history"] = trace.knowledge.history()
+        result["explained_concepts_history"] = trace.explained
+        output.append(result)
+    return output, len(traces)
+
+
+async def main() -> None:
+    args = cli_parser().parse_args()
+    extract_prompt = args.extract_prompt or os.path.join(args.prompts_root, "dynamic-knowledge-extract.txt")
+    update_prompt = args.update_prompt or os.path.join(args.prompts_root, "dynamic-knowledge-update.txt")
+
+    results = list(ResultReader(args.input))
+    model_client = SingleModelClient(args.model, parse_reasoning_profile(args.reasoning_profile))
+    output, count = await retrace_results(
+        results,
+        model_client=model_client,
+        extract_prompt_path=extract_prompt,
+        update_prompt_path=update_prompt,
+    )
+
+    out_path = args.output
+    if not out_path:
+        ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        suffix = COMPRESSED_SUFFIX if args.input.endswith(COMPRESSED_SUFFIX) else ".json"
+        out_path = f"{result_stem(args.input)}_retrace_{ts}{suffix}"
+    with open_result_writer(out_path) as writer:
+        for result in output:
+            writer.write(result)
+    print(f"Re-traced {count} of {len(results)} conversations (others lack a saved concept graph).")
+    print(f"Saved results to: {out_path}")
+    print(format_usage_summary())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,22 +3,50 @@
 from __future__ import annotations
 
 import argparse
-import json
+import asyncio
+import itertools
 import os
 import random
+import signal
+import time
 from datetime import datetime
-from typing import List, Dict
+from typing import Any, Callable, Iterator, List, Dict, Optional
 
+from tqdm import tqdm
+
+from ..core.cli import split_list
 from ..core.models import SingleModelClient
-from ..core.prompts import load_prompt
-from ..data.loaders import load_annotations, load_json, load_csv_rows
-from ..knowledge.init import initialize_dynamic_knowledge_states
-from ..knowledge.iu_extraction import extract_iu_graph
+from ..core.prompts import CompiledPrompt, PromptRegistry
+from ..core.reasoning import parse_reasoning_profile, resolve_reasoning_effort
+from ..core.usage import format_usage_summary
+from ..data.csv_index import CsvIndex, describe_selection, select_rows
+from ..data.loaders import iter_csv_rows
+from ..data.parquet import ParquetRows
+from ..knowledge import extract as knowledge_extract
+from ..knowledge import init as knowledge_init
+from ..knowledge import iu_extraction
+from ..knowledge import update as knowledge_update
+from ..knowledge.graph import ConceptGraph
+from ..knowledge.graph_artifact import GraphArtifact, artifact_mismatches, problem_key, template_sha256
+from ..knowledge.iu_cache import IUGraphCache
+from ..knowledge.iu_extraction import extract_iu_graph, extract_iu_graphs
 from ..knowledge.iu_graph import build_concept_graph_from_iu
 from ..knowledge.iu_init import initialize_knowledge_state
 from ..profiles.interaction import format_interaction_profile
-from .conversation import run_conversation_with_interaction_profile
+from .checkpoint import CheckpointWriter, finalize_checkpoint, load_checkpoint, result_key, resume_mask
+from .budgets import load_observed_output_tokens, observed_p95, stage_token_budget, user_token_budget
+from .conversation import (
+    INITIAL_PROMPT_FIELDS,
+    TURN_PROMPT_FIELDS,
+    build_turn_settings,
+    run_conversation_with_interaction_profile,
+)
 from .length_control import count_words, round_down_to_nearest_5, round_up_to_nearest_5
+from .pipeline import run_streaming_pipeline
+from .record import ConversationRecord
+from .results import RESULT_FORMATS
+from .snapshot import SimulationInterrupted
+from .scheduling import TurnModel, calibrate_turn_model, conversation_features, makespan_report
 
 
 
@@ -27,6 +55,11 @@ def cli_parser() -> argparse.ArgumentParser:
     parser.add_argument("--version", type=str, required=True)
     parser.add_argument("--annotation_id", type=str, default="math_tutoring_annotations")
     parser.add_argument("--num_conversations", type=int, default=-1)
+    parser.add_argument("--shard", type=str, default="")
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=-1)
+    parser.add_argument("--sample", type=int, default=0)
+    parser.add_argument("--stratify", type=str, default="level,type")
     parser.add_argument("--user_model", type=str, default="gpt-5-mini")
     parser.add_argument("--assistant_model", type=str, default="")
     parser.add_argument("--iu_model", type=str, default="gpt-4o-mini")
@@ -36,15 +69,61 @@ def cli_parser() -> argparse.ArgumentParser:
     parser.add_argument("--data_root", type=str, default=r"D:\MySimAre\Data")
     parser.add_argument("--prompts_root", type=str, default="simulation/prompts")
     parser.add_argument("--input_csv", type=str, default=r"D:\MySimAre\Data\competition_math\data\train_fixed_level_4_5.csv")
+    parser.add_argument("--input_parquet", type=str, default="")
+    parser.add_argument("--levels", type=str, default="")
+    parser.add_argument("--types", type=str, default="")
     parser.add_argument("--knowledge_level", type=str, default="intermediate", choices=["novice", "intermediate", "advanced"])
     parser.add_argument("--seed", type=int, default=2)
+    parser.add_argument("--students_per_problem", type=int, default=1)
+    parser.add_argument("--prompt_layout", type=str, default="inline", choices=["inline", "cache"])
+    parser.add_argument("--token_budgets", action="store_true")
+    parser.add_argument("--budget_logs", type=str, default="")
+    parser.add_argument("--max_tokens", type=int, default=3000)
+    parser.add_argument("--reasoning_profile", type=str, default="default")
+    parser.add_argument("--user_response_only", action="store_true")
+    parser.add_argument("--pipeline", type=str, default="lockstep", choices=["lockstep", "streaming"])
+    parser.add_argument("--pool_size", type=int, default=32)
+    parser.add_argument("--extract_workers", type=int, default=8)
+    parser.add_argument("--queue_size", type=int, default=64)
+    parser.add_argument("--schedule", type=str, default="fifo", choices=["fifo", "longest_first"])
+    parser.add_argument("--schedule_calibration", type=str, default="")
+    parser.add_argument("--iu_cache", type=str, default="cache/iu_graphs.sqlite")
+    parser.add_argument("--graph_artifact", type=str, default="")
+    parser.add_argument("--allow_stale_artifact", action="store_true")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--fsync_every", type=int, default=16)
+    parser.add_argument("--snapshot_every", type=int, default=1)
+    parser.add_argument("--output_format", type=str, default="json", choices=sorted(RESULT_FORMATS))
     return parser
 
 
-def _load_prompt_pair(prompts_root: str, version: str) -> tuple[str, str]:
-    prompt_path = os.path.join(prompts_root, f"{version}.txt")
-    initial_path = os.path.join(prompts_root, f"{version}-initial-query.txt")
-    return load_prompt(prompt_path), load_prompt(initial_path)
+def _prompt_pair_names(version: str, response_only: bool = False) -> tuple[str, str]:
+    suffix = "-response-only" if response_only else ""
+    return f"{version}{suffix}", f"{version}-initial-query{suffix}"
+
+
+def _load_prompt_pair(
+    registry: PromptRegistry,
+    version: str,
+    response_only: bool = False,
+    length_control: bool = False,
+) -> tuple[CompiledPrompt, CompiledPrompt]:
+    """Fetch the user-simulator templates after checking every template's placeholders."""
+    prompt_name, initial_name = _prompt_pair_names(version, response_only)
+    extra = ("length_control",) if length_control else ()
+    problems = registry.validate(
+        {
+            prompt_name: TURN_PROMPT_FIELDS + extra,
+            initial_name: INITIAL_PROMPT_FIELDS + extra,
+            "dynamic-knowledge-extract": knowledge_extract.PROMPT_FIELDS,
+            "dynamic-knowledge-update": knowledge_update.PROMPT_FIELDS,
+            "dynamic-knowledge-init": knowledge_init.PROMPT_FIELDS,
+            "iu_graph_extraction": iu_extraction.PROMPT_FIELDS,
+        }
+    )
+    if problems:
+        raise ValueError("Prompt template check failed:\n" + "\n".join(problems))
+    return registry.get(prompt_name), registry.get(initial_name)
 
 
 def _build_length_control_list(
@@ -70,137 +149,622 @@ def _build_length_control_list(
     return length_control_list
 
 
-async def main() -> None:
-    parser = cli_parser()
-    args = parser.parse_args()
-
-    prompt_template, prompt_initial_query_template = _load_prompt_pair(args.prompts_root, args.version)
-
-    # Load problems from CSV (question + reference answer)
-    rows = load_csv_rows(args.input_csv)
+def _annotation_from_row(idx: int, row: Dict[str, str], model: str) -> Dict[str, str]:
+    return {
+        "problem_id": str(idx),
+        "question": row.get("problem", ""),
+        "solution": row.get("solution", ""),
+        "level": row.get("level", ""),
+        "type": row.get("type", ""),
+        "user_id": "csv_user",
+        "model": model,
+    }
+
+
+def _selected_rows(args: argparse.Namespace) -> Iterator[tuple[int, Dict[str, str]]]:
+    """
+    (row index, row) for the input rows to simulate, from --input_parquet if given,
+    else from --input_csv. Parquet input gets --levels/--types pushed down to the
+    reader and row indices count the rows that pass them. For CSV input, --levels,
+    --types, --sample, --shard, --offset and --limit pick rows through the cached
+    byte-offset index, so only those rows are parsed. --num_conversations caps
+    the result either way.
+    """
+    levels, types = split_list(args.levels), split_list(args.types)
+    selecting = args.sample > 0 or args.shard or args.offset or args.limit >= 0
+    if args.input_parquet:
+        source = ParquetRows(args.input_parquet, levels=levels, types=types)
+        where = None
+        if not selecting:
+            rows = source.rows()
+            if args.num_conversations > 0:
+                rows = itertools.islice(rows, args.num_conversations)
+            return rows
+    elif not (selecting or levels or types):
+        rows = enumerate(iter_csv_rows(args.input_csv))
+        if args.num_conversations > 0:
+            rows = itertools.islice(rows, args.num_conversations)
+        return rows
+    else:
+        source = CsvIndex.load_or_build(args.input_csv)
+        where = {name: values for name, values in (("level", levels), ("type", types)) if values}
+    stratify = split_list(args.stratify)
+    indices = select_rows(
+        source,
+        where=where,
+        shard=args.shard or None,
+        offset=args.offset,
+        limit=args.limit,
+        sample=args.sample,
+        stratify=stratify,
+        seed=args.seed,
+    )
     if args.num_conversations > 0:
-        rows = rows[:args.num_conversations]
-
-    annotations: List[Dict[str, str]] = []
-    for idx, row in enumerate(rows):
-        annotations.append(
-            {
-                "problem_id": str(idx),
-                "question": row.get("problem", ""),
-                "solution": row.get("solution", ""),
-                "level": row.get("level", ""),
-                "type": row.get("type", ""),
-                "user_id": "csv_user",
-                "model": args.assistant_model or args.user_model,
-            }
+        indices = indices[:args.num_conversations]
+    print(describe_selection(source, indices, stratify))
+    return source.rows(indices)
+
+
+def _map_initial_knowledge_state(
+    iu_graph: Dict,
+    id_map: Dict[str, str],
+    knowledge_level: str,
+    rng: random.Random,
+) -> Dict[str, Dict[str, str]]:
+    """Sample an IU-level starting state and map it onto concept-graph labels."""
+    state = initialize_knowledge_state(iu_graph, knowledge_level, rng)
+    return _map_iu_state(state, _iu_prereqs(iu_graph), id_map)
+
+
+def _iu_prereqs(iu_graph: Dict) -> Dict[str, List[str]]:
+    """
+    Prerequisite IU ids per IU straight from the graph's edges, including edges from ids
+    without a node, so they count in the partially-known ratio.
+    """
+    prereqs_by_id: Dict[str, List[str]] = {}
+    for e in iu_graph.get("edges", []):
+        src = e.get("from")
+        dst = e.get("to")
+        if not src or not dst:
+            continue
+        prereqs_by_id.setdefault(dst, []).append(src)
+    return prereqs_by_id
+
+
+def _map_iu_state(
+    state: Dict[str, List[str]],
+    prereqs_by_id: Dict[str, List[str]],
+    id_map: Dict[str, str],
+) -> Dict[str, Dict[str, str]]:
+    """Map known / partially_known / unknown IU ids onto concept-graph labels and states."""
+    known_ids = set(state.get("known", []))
+
+    mapped: Dict[str, Dict[str, str]] = {}
+    for iu_id in state.get("known", []):
+        mapped[id_map.get(iu_id, iu_id)] = {"state": "knows_well"}
+
+    for iu_id in state.get("partially_known", []):
+        prereqs = prereqs_by_id.get(iu_id, [])
+        known_ratio = (
+            len([p for p in prereqs if p in known_ids]) / max(len(prereqs), 1)
         )
-
-    if args.num_conversations > 0:
-        annotations = annotations[:args.num_conversations]
-
-    user_model_client = SingleModelClient(args.user_model)
-    iu_model_client = SingleModelClient(args.iu_model)
-    assistant_model_name = args.assistant_model or args.user_model
-    assistant_model_client = SingleModelClient(assistant_model_name)
-
-    # Build IU graphs from question + answer, then convert to concept graph
+        state_label = "partial_understanding" if known_ratio >= 0.5 else "struggling"
+        mapped[id_map.get(iu_id, iu_id)] = {"state": state_label}
+
+    for iu_id in state.get("unknown", []):
+        prereqs = prereqs_by_id.get(iu_id, [])
+        has_known_prereq = any(p in known_ids for p in prereqs)
+        state_label = "not_introduced" if has_known_prereq else "unknown_unknown"
+        mapped[id_map.get(iu_id, iu_id)] = {"state": state_label}
+
+    return mapped
+
+
+async def _extract_iu_graphs(
+    args: argparse.Namespace,
+    annotations: List[Dict[str, str]],
+    iu_model_client: SingleModelClient,
+    iu_cache: Optional[IUGraphCache] = None,
+) -> tuple[Dict[str, Dict], List[Dict[str, str]]]:
+    """IU graphs for all problems in one batch; problems that fail are reported and dropped."""
+    iu_graphs, errors = await extract_iu_graphs(
+        {str(ann["problem_id"]): (ann["question"], ann["solution"]) for ann in annotations},
+        model_client=iu_model_client,
+        max_tokens=1200,
+        show_progress=True,
+        prompt_path=os.path.join(args.prompts_root, "iu_graph_extraction.txt"),
+        cache=iu_cache,
+    )
+    for problem_id, error in errors.items():
+        print(f"IU graph extraction failed for problem {problem_id}: {error}")
+    return iu_graphs, [ann for ann in annotations if str(ann["problem_id"]) in iu_graphs]
+
+
+def _open_graph_artifact(args: argparse.Namespace) -> Optional[GraphArtifact]:
+    """
+    The --graph_artifact file, or None. An artifact compiled with another --iu_model
+    or extraction prompt is refused unless --allow_stale_artifact is given.
+    """
+    if not args.graph_artifact:
+        return None
+    artifact = GraphArtifact(args.graph_artifact)
+    issues = artifact_mismatches(
+        artifact.meta,
+        iu_model=args.iu_model,
+        prompt_sha256=template_sha256(os.path.join(args.prompts_root, "iu_graph_extraction.txt")),
+    )
+    if issues:
+        message = f"Graph artifact {args.graph_artifact} is stale: {'; '.join(issues)}"
+        if not args.allow_stale_artifact:
+            artifact.close()
+            raise ValueError(f"{message}. Recompile it or pass --allow_stale_artifact.")
+        print(f"Warning: {message}; using it anyway (--allow_stale_artifact).")
+    return artifact
+
+
+async def _problem_graphs(
+    args: argparse.Namespace,
+    annotations: List[Dict[str, str]],
+    iu_model_client: SingleModelClient,
+    iu_cache: Optional[IUGraphCache] = None,
+) -> tuple[Dict[str, Dict], Dict[str, List[Dict]], Dict[str, Dict[str, str]], List[Dict[str, str]]]:
+    """
+    (IU graphs, concept items, id maps, kept annotations), keyed by problem id.
+    Problems found in --graph_artifact are taken from it as compiled; the rest are
+    extracted and converted here.
+    """
     iu_graphs: Dict[str, Dict] = {}
-    for ann in annotations:
-        iu_graph = await extract_iu_graph(
-            question=ann["question"],
-            answer=ann["solution"],
-            model_client=iu_model_client,
-            max_tokens=1200,
-            show_progress=False,
-            prompt_path=os.path.join(args.prompts_root, "iu_graph_extraction.txt"),
-        )
-        iu_graphs[str(ann["problem_id"])] = iu_graph
-
-    concept_graph, id_maps = build_concept_graph_from_iu(iu_graphs)
-
-    problems = [ann["question"] for ann in annotations]
-    problem_ids = [str(ann["problem_id"]) for ann in annotations]
-
+    concept_items: Dict[str, List[Dict]] = {}
+    id_maps: Dict[str, Dict[str, str]] = {}
+    missing = annotations
+    if args.graph_artifact:
+        missing = []
+        with _open_graph_artifact(args) as artifact:
+            for ann in annotations:
+                entry = artifact.get(problem_key(ann["question"], ann["solution"]))
+                if entry is None:
+                    missing.append(ann)
+                    continue
+                pid = str(ann["problem_id"])
+                iu_graphs[pid] = entry["iu_graph"]
+                concept_items[pid] = entry["concept_items"]
+                id_maps[pid] = entry["id_map"]
+        print(f"Graph artifact {args.graph_artifact}: {len(iu_graphs)} of {len(annotations)} problems compiled")
+    if missing:
+        extracted, _ = await _extract_iu_graphs(args, missing, iu_model_client, iu_cache)
+        extracted_items, extracted_maps = build_concept_graph_from_iu(extracted)
+        iu_graphs.update(extracted)
+        concept_items.update(extracted_items)
+        id_maps.update(extracted_maps)
+    return iu_graphs, concept_items, id_maps, [ann for ann in annotations if str(ann["problem_id"]) in iu_graphs]
+
+
+def _user_profiles(
+    args: argparse.Namespace,
+    annotations: List[Dict[str, str]],
+) -> tuple[List[str], List[str], List[str]]:
+    """(length-control texts, interaction profiles, length texts used in the profiles)."""
     length_control_list = []
     if args.length_control:
         length_control_list = _build_length_control_list(annotations, args.length_control_setting)
 
     # Build interaction-only user profiles (fallback if no profile file is available)
     user_profiles = []
+    profile_length_texts = []
     for ann, length_text in zip(annotations, length_control_list or ["" for _ in annotations]):
-        user_profiles.append(format_interaction_profile([], length_text or "around 20 words"))
+        profile_length_texts.append(length_text or "around 20 words")
+        user_profiles.append(format_interaction_profile([], profile_length_texts[-1]))
+    return length_control_list, user_profiles, profile_length_texts
+
+
+def _initial_knowledge_states(
+    iu_graphs: Dict[str, Dict],
+    id_maps: Dict[str, Dict[str, str]],
+    problem_ids: List[str],
+    knowledge_level: str,
+    seed: int,
+    students_per_problem: int = 1,
+) -> List[Dict[str, Dict[str, str]]]:
+    """
+    Starting states in problem order. With several students per problem the whole
+    population of each problem is drawn at once by the NumPy sampler (seeded from
+    `seed` and the problem id), giving `students_per_problem` consecutive states per problem.
+    """
+    if students_per_problem > 1:
+        return [
+            state
+            for pid in problem_ids
+            for state in _population_states(
+                iu_graphs.get(str(pid), {}),
+                id_maps.get(str(pid), {}),
+                knowledge_level,
+                students_per_problem,
+                seed,
+                str(pid),
+            )
+        ]
+    rng = random.Random(seed)
+    return [
+        _map_initial_knowledge_state(
+            iu_graphs.get(str(pid), {}), id_maps.get(str(pid), {}), knowledge_level, rng
+        )
+        for pid in problem_ids
+    ]
 
-    knowledge_states = None
-    if args.dynamic_knowledge_state_init:
-        rng = random.Random(args.seed)
-        knowledge_states = []
-        for pid in problem_ids:
-            iu_graph = iu_graphs.get(str(pid), {})
-            id_map = id_maps.get(str(pid), {})
-            edges = iu_graph.get("edges", [])
-            prereqs_by_id: Dict[str, List[str]] = {}
-            for e in edges:
-                src = e.get("from")
-                dst = e.get("to")
-                if not src or not dst:
-                    continue
-                prereqs_by_id.setdefault(dst, []).append(src)
 
-            state = initialize_knowledge_state(iu_graph, args.knowledge_level, rng)
-            known_ids = set(state.get("known", []))
-            partially_ids = set(state.get("partially_known", []))
-            unknown_ids = set(state.get("unknown", []))
+def _population_states(
+    iu_graph: Dict,
+    id_map: Dict[str, str],
+    knowledge_level: str,
+    students: int,
+    seed: int,
+    problem_id: str,
+) -> List[Dict[str, Dict[str, str]]]:
+    from ..knowledge.iu_population import population_rng, sample_population
 
-            mapped: Dict[str, Dict[str, str]] = {}
-            for iu_id in known_ids:
-                mapped[id_map.get(iu_id, iu_id)] = {"state": "knows_well"}
+    prereqs_by_id = _iu_prereqs(iu_graph)
+    population = sample_population(iu_graph, knowledge_level, students, population_rng(seed, problem_id))
+    return [_map_iu_state(population.state(k), prereqs_by_id, id_map) for k in range(students)]
 
-            for iu_id in partially_ids:
-                prereqs = prereqs_by_id.get(iu_id, [])
-                known_ratio = (
-                    len([p for p in prereqs if p in known_ids]) / max(len(prereqs), 1)
-                )
-                state_label = "partial_understanding" if known_ratio >= 0.5 else "struggling"
-                mapped[id_map.get(iu_id, iu_id)] = {"state": state_label}
 
-            for iu_id in unknown_ids:
-                prereqs = prereqs_by_id.get(iu_id, [])
-                has_known_prereq = any(p in known_ids for p in prereqs)
-                state_label = "not_introduced" if has_known_prereq else "unknown_unknown"
-                mapped[id_map.get(iu_id, iu_id)] = {"state": state_label}
+def _expand_students(annotations: List[Dict[str, str]], students_per_problem: int) -> List[Dict[str, Any]]:
+    """Each annotation `students_per_problem` times in a row, tagged with its student index."""
+    if students_per_problem <= 1:
+        return annotations
+    return [dict(ann, student=k) for ann in annotations for k in range(students_per_problem)]
 
-            knowledge_states.append(mapped)
 
-    results = await run_conversation_with_interaction_profile(
-        problems=problems,
-        problem_ids=problem_ids,
-        user_profiles=user_profiles,
-        user_model_client=user_model_client,
-        assistant_model_client=assistant_model_client,
+def _student_metadata(metadata: Dict[str, Any], ann: Dict[str, Any]) -> Dict[str, Any]:
+    if "student" in ann:
+        metadata["student"] = ann["student"]
+    return metadata
+
+
+def _open_iu_cache(args: argparse.Namespace) -> Optional[IUGraphCache]:
+    """The persistent IU graph cache, or None when --iu_cache is empty."""
+    return IUGraphCache(args.iu_cache) if args.iu_cache else None
+
+
+def _output_path(assistant_model_name: str, version: str, output_format: str = "json") -> str:
+    output_dir = os.path.join("output", "competition_math", assistant_model_name)
+    os.makedirs(output_dir, exist_ok=True)
+    ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(output_dir, f"{version}_{ts}{RESULT_FORMATS[output_format]}")
+
+
+def _checkpoint_path(assistant_model_name: str, version: str) -> str:
+    """JSONL of finished conversations; untimestamped so --resume finds it again."""
+    output_dir = os.path.join("output", "competition_math", assistant_model_name)
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, f"{version}.checkpoint.jsonl")
+
+
+def _snapshot_path(assistant_model_name: str, version: str) -> str:
+    return os.path.join("output", "competition_math", assistant_model_name, f"{version}.snapshot.json.gz")
+
+
+def _stop_on_sigterm() -> asyncio.Event:
+    """An event set by SIGTERM, so the lockstep loop can snapshot and exit between turns."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+    except (NotImplementedError, RuntimeError):
+        # Event loops without signal support (Windows): set it from the signal handler thread-safely.
+        signal.signal(signal.SIGTERM, lambda *_: loop.call_soon_threadsafe(stop.set))
+    return stop
+
+
+def _pending_mask(args: argparse.Namespace, checkpoint: str, keys: List[tuple]) -> List[bool]:
+    """Which conversations still have to run: all of them, or with --resume those not in the checkpoint."""
+    if not args.resume:
+        return [True] * len(keys)
+    todo = resume_mask(load_checkpoint(checkpoint), keys)
+    print(f"Resuming {checkpoint}: {todo.count(False)} of {len(keys)} conversations already finished")
+    return todo
+
+
+def _pending(items: Optional[List[Any]], todo: List[bool]) -> Optional[List[Any]]:
+    return [item for item, keep in zip(items, todo) if keep] if items else items
+
+
+def _token_budget_settings(args: argparse.Namespace) -> tuple[Optional[Callable[[str], int]], Optional[int], Optional[int]]:
+    """(per-conversation user budget function, assistant max_tokens, retry cap), all None when off."""
+    if not args.token_budgets:
+        return None, None, None
+    observed = load_observed_output_tokens(args.budget_logs) if args.budget_logs else {}
+    user_p95 = observed_p95(observed, "user")
+    user_effort = resolve_reasoning_effort(args.user_model, "user", parse_reasoning_profile(args.reasoning_profile))
+
+    def budget_for(length_text: str) -> int:
+        return user_token_budget(
+            length_text,
+            observed_p95=user_p95,
+            ceiling=args.max_tokens,
+            include_thought=not args.user_response_only,
+            reasoning_effort=user_effort,
+        )
+
+    return budget_for, stage_token_budget("assistant", observed, default=args.max_tokens), args.max_tokens
+
+
+def _turn_model(args: argparse.Namespace) -> TurnModel:
+    """Turn/token predictor calibrated on --schedule_calibration outputs and --budget_logs."""
+    observed = load_observed_output_tokens(args.budget_logs) if args.budget_logs else None
+    return calibrate_turn_model(args.schedule_calibration, observed, max_turns=15)
+
+
+async def run_streaming(
+    args: argparse.Namespace,
+    prompt_template: CompiledPrompt,
+    prompt_initial_query_template: CompiledPrompt,
+) -> str:
+    """
+    --pipeline streaming: rows are read lazily, each problem is prepared (IU graph,
+    concept graph, starting knowledge state) by a worker pool and simulated as soon
+    as a conversation slot frees; results are written as they finish.
+    Knowledge states use one RNG per problem (seeded from --seed and the problem id)
+    so they do not depend on completion order. With --schedule longest_first a free
+    slot takes the ready conversation with the most expected tokens.
+    """
+    reasoning_profile = parse_reasoning_profile(args.reasoning_profile)
+    user_model_client = SingleModelClient(args.user_model, reasoning_profile)
+    iu_model_client = SingleModelClient(args.iu_model, reasoning_profile)
+    assistant_model_name = args.assistant_model or args.user_model
+    assistant_model_client = SingleModelClient(assistant_model_name, reasoning_profile)
+    budget_for, assistant_max_tokens, truncation_retry_max_tokens = _token_budget_settings(args)
+    turn_model = _turn_model(args)
+    iu_cache = _open_iu_cache(args)
+    artifact = _open_graph_artifact(args)
+
+    settings = build_turn_settings(
         prompt_initial_query_template=prompt_initial_query_template,
         prompt_template=prompt_template,
-        concept_graph=concept_graph,
-        knowledge_states=knowledge_states,
+        prompt_layout=args.prompt_layout,
+        user_model_client=user_model_client,
+        assistant_model_client=assistant_model_client,
         user_temperature=0.7,
         assistant_temperature=0.0,
-        max_tokens=3000,
+        max_tokens=args.max_tokens,
         max_turns=15,
         length_control_bool=args.length_control,
-        length_control_list=length_control_list,
-        show_progress=True,
+        assistant_max_tokens=assistant_max_tokens,
+        truncation_retry_max_tokens=truncation_retry_max_tokens,
+        show_progress=False,
+        prompts_root=args.prompts_root,
     )
 
-    output_dir = os.path.join("output", "competition_math", assistant_model_name)
-    os.makedirs(output_dir, exist_ok=True)
-    ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    out_path = os.path.join(output_dir, f"{args.version}_{ts}.json")
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
+    annotations = (
+        _annotation_from_row(idx, row, assistant_model_name) for idx, row in _selected_rows(args)
+    )
+
+    async def prepare(ann: Dict[str, str]) -> List[ConversationRecord]:
+        pid = str(ann["problem_id"])
+        entry = artifact.get(problem_key(ann["question"], ann["solution"])) if artifact is not None else None
+        if entry is not None:
+            iu_graph = entry["iu_graph"]
+            concept_graph, id_maps = {pid: entry["concept_items"]}, {pid: entry["id_map"]}
+        else:
+            try:
+                iu_graph = await extract_iu_graph(
+                    question=ann["question"],
+                    answer=ann["solution"],
+                    model_client=iu_model_client,
+                    max_tokens=1200,
+                    show_progress=False,
+                    prompt_path=os.path.join(args.prompts_root, "iu_graph_extraction.txt"),
+                    cache=iu_cache,
+                )
+            except RuntimeError as e:
+                print(f"Skipping problem {pid}: {e}")
+                return []
+            concept_graph, id_maps = build_concept_graph_from_iu({pid: iu_graph})
+
+        length_text = ""
+        if args.length_control:
+            length_text = _build_length_control_list([ann], args.length_control_setting)[0]
+        profile_length_text = length_text or "around 20 words"
+
+        students = _expand_students([ann], args.students_per_problem)
+        knowledge_states: List[Optional[Dict[str, Dict[str, str]]]] = [None] * len(students)
+        if args.dynamic_knowledge_state_init and len(students) > 1:
+            knowledge_states = _population_states(
+                iu_graph, id_maps.get(pid, {}), args.knowledge_level, len(students), args.seed, pid
+            )
+        elif args.dynamic_knowledge_state_init:
+            rng = random.Random(f"{args.seed}:{pid}")
+            knowledge_states = [
+                _map_initial_knowledge_state(iu_graph, id_maps.get(pid, {}), args.knowledge_level, rng)
+            ]
+
+        graph = ConceptGraph(concept_graph.get(pid, []))
+        features = conversation_features(iu_graph, args.knowledge_level, ann["level"])
+        records = []
+        for student, knowledge_state in zip(students, knowledge_states):
+            record = ConversationRecord(
+                ann["question"],
+                problem_id=pid,
+                user_profile=format_interaction_profile([], profile_length_text),
+                length_control=length_text if args.length_control else None,
+                knowledge_state=knowledge_state,
+                user_token_budget=budget_for(profile_length_text) if budget_for else None,
+            )
+            record.concept_graph = graph
+            record.metadata = _student_metadata(turn_model.annotate(features), student)
+            records.append(record)
+        return records
+
+    def expected_tokens(record: ConversationRecord) -> float:
+        return record.metadata["expected_tokens"]
+
+    checkpoint = _checkpoint_path(assistant_model_name, args.version)
+    finished = {result_key(result) for result in load_checkpoint(checkpoint)} if args.resume else set()
+    if args.resume:
+        print(f"Resuming {checkpoint}: {len(finished)} conversations already finished")
+
+    async def prepare_pending(ann: Dict[str, str]) -> List[ConversationRecord]:
+        records = await prepare(ann)
+        return [
+            record
+            for record in records
+            if (record.problem_id, (record.metadata or {}).get("student")) not in finished
+        ]
+
+    timings: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    with CheckpointWriter(checkpoint, append=args.resume, fsync_every=args.fsync_every) as writer:
+        with tqdm(desc="conversations", unit="conv") as progress:
+
+            def on_result(result: Dict[str, Any]) -> None:
+                writer.write(result)
+                timings.append({"turns": result["turns"], "metadata": result["metadata"]})
+                progress.update(1)
+
+            await run_streaming_pipeline(
+                annotations,
+                prepare_pending,
+                settings,
+                on_result,
+                pool_size=args.pool_size,
+                extract_workers=args.extract_workers,
+                queue_size=args.queue_size,
+                priority=expected_tokens if args.schedule == "longest_first" else None,
+            )
+    print(makespan_report(timings, args.pool_size, time.perf_counter() - started))
+    out_path = _output_path(assistant_model_name, args.version, args.output_format)
+    finalize_checkpoint(checkpoint, out_path)
+    if iu_cache is not None:
+        print(iu_cache.format_stats())
+        iu_cache.close()
+    if artifact is not None:
+        artifact.close()
+    return out_path
+
+
+async def main() -> None:
+    parser = cli_parser()
+    args = parser.parse_args()
+
+    registry = PromptRegistry(args.prompts_root)
+    prompt_template, prompt_initial_query_template = _load_prompt_pair(
+        registry, args.version, args.user_response_only, args.length_control
+    )
+
+    if args.pipeline == "streaming":
+        out_path = await run_streaming(args, prompt_template, prompt_initial_query_template)
+        print(f"Saved results to: {out_path}")
+        print(format_usage_summary())
+        return
+
+    # Load problems from CSV (question + reference answer)
+    annotations: List[Dict[str, str]] = [
+        _annotation_from_row(idx, row, args.assistant_model or args.user_model)
+        for idx, row in _selected_rows(args)
+    ]
+
+    reasoning_profile = parse_reasoning_profile(args.reasoning_profile)
+    user_model_client = SingleModelClient(args.user_model, reasoning_profile)
+    iu_model_client = SingleModelClient(args.iu_model, reasoning_profile)
+    assistant_model_name = args.assistant_model or args.user_model
+    assistant_model_client = SingleModelClient(assistant_model_name, reasoning_profile)
+
+    # Build IU graphs from question + answer, then convert to concept graph
+    iu_cache = _open_iu_cache(args)
+    iu_graphs, concept_items, id_maps, annotations = await _problem_graphs(
+        args, annotations, iu_model_client, iu_cache
+    )
+    if iu_cache is not None:
+        print(iu_cache.format_stats())
+        iu_cache.close()
+    concept_graph = {pid: ConceptGraph(items) for pid, items in concept_items.items()}
+
+    knowledge_states = None
+    if args.dynamic_knowledge_state_init:
+        knowledge_states = _initial_knowledge_states(
+            iu_graphs,
+            id_maps,
+            [str(ann["problem_id"]) for ann in annotations],
+            args.knowledge_level,
+            args.seed,
+            args.students_per_problem,
+        )
+
+    # One conversation per (problem, student); students of a problem are adjacent.
+    annotations = _expand_students(annotations, args.students_per_problem)
+    problems = [ann["question"] for ann in annotations]
+    problem_ids = [str(ann["problem_id"]) for ann in annotations]
+
+    length_control_list, user_profiles, profile_length_texts = _user_profiles(args, annotations)
+
+    # Length-aware budgets: user turns from the length target, the tutor from past logs.
+    budget_for, assistant_max_tokens, truncation_retry_max_tokens = _token_budget_settings(args)
+    user_token_budgets = [budget_for(text) for text in profile_length_texts] if budget_for else None
+
+    # Every lockstep conversation starts at once, so the schedule only matters for the pool;
+    # the predictions are still saved for calibration and the makespan report.
+    turn_model = _turn_model(args)
+    metadata = [
+        _student_metadata(
+            turn_model.annotate(
+                conversation_features(iu_graphs.get(pid, {}), args.knowledge_level, ann["level"])
+            ),
+            ann,
+        )
+        for pid, ann in zip(problem_ids, annotations)
+    ]
+
+    # Finished conversations are appended to a checkpoint as they end; --resume skips them.
+    checkpoint = _checkpoint_path(assistant_model_name, args.version)
+    keys = [(str(ann["problem_id"]), ann.get("student")) for ann in annotations]
+    todo = _pending_mask(args, checkpoint, keys)
+
+    # In-flight state is snapshotted every --snapshot_every turns and on SIGTERM;
+    # --resume continues from the snapshot when one is left.
+    snapshot = _snapshot_path(assistant_model_name, args.version) if args.snapshot_every > 0 else None
+
+    started = time.perf_counter()
+    with CheckpointWriter(checkpoint, append=args.resume, fsync_every=args.fsync_every) as writer:
+        try:
+            results = await run_conversation_with_interaction_profile(
+                problems=_pending(problems, todo),
+                problem_ids=_pending(problem_ids, todo),
+                user_profiles=_pending(user_profiles, todo),
+                user_model_client=user_model_client,
+                assistant_model_client=assistant_model_client,
+                prompt_initial_query_template=prompt_initial_query_template,
+                prompt_template=prompt_template,
+                concept_graph=concept_graph,
+                knowledge_states=_pending(knowledge_states, todo),
+                user_temperature=0.7,
+                assistant_temperature=0.0,
+                max_tokens=args.max_tokens,
+                max_turns=15,
+                length_control_bool=args.length_control,
+                length_control_list=_pending(length_control_list, todo),
+                show_progress=True,
+                prompt_layout=args.prompt_layout,
+                user_token_budgets=_pending(user_token_budgets, todo),
+                assistant_max_tokens=assistant_max_tokens,
+                truncation_retry_max_tokens=truncation_retry_max_tokens,
+                metadata=_pending(metadata, todo),
+                on_finished=writer.write,
+                snapshot_path=snapshot,
+                snapshot_every=args.snapshot_every,
+                restore=args.resume,
+                stop=_stop_on_sigterm(),
+                prompts_root=args.prompts_root,
+            )
+        except SimulationInterrupted as e:
+            print(f"{e}. Rerun with --resume to continue.")
+            return
+    print(makespan_report(results, len(results), time.perf_counter() - started))
+
+    out_path = _output_path(assistant_model_name, args.version, args.output_format)
+    finalize_checkpoint(checkpoint, out_path, order=keys)
     print(f"Saved results to: {out_path}")
+    print(format_usage_summary())
 
 
 if __name__ == "__main__":
-    import asyncio
-
     asyncio.run(main())
 
@@ -0,0 +1,167 @@
+"""Turn-count estimates and longest-expected-first admission of conversations."""
+
+from __future__ import annotations
+
+import glob
+import heapq
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from ..knowledge.graph import ConceptGraph
+from .results import INDEX_SUFFIX, ResultReader
+
+KNOWLEDGE_LEVELS = {"novice": 0, "intermediate": 1, "advanced": 2}
+FEATURES = ("iu_nodes", "iu_edges", "iu_depth", "knowledge_level", "level")
+
+# Rough prior used until past outputs are available for calibration:
+# bigger and deeper graphs, weaker students and harder problems talk longer.
+DEFAULT_INTERCEPT = 2.0
+DEFAULT_WEIGHTS = {"iu_nodes": 0.3, "iu_edges": 0.1, "iu_depth": 0.5, "knowledge_level": -1.0, "level": 0.5}
+# Output tokens of one turn (user + tutor + knowledge update) when no logs are given.
+DEFAULT_TOKENS_PER_TURN = 600.0
+TURN_STAGES = ("user", "assistant", "knowledge_extract", "knowledge_update")
+RIDGE = 1.0
+
+_LEVEL_RE = re.compile(r"(\d+)")
+
+
+def conversation_features(iu_graph: Dict[str, Any], knowledge_level: str, level: str) -> Dict[str, Any]:
+    """Features known before simulation; stored in the record's `metadata`."""
+    match = _LEVEL_RE.search(level or "")
+    return {
+        "iu_nodes": len(iu_graph.get("nodes", [])),
+        "iu_edges": len(iu_graph.get("edges", [])),
+        "iu_depth": ConceptGraph.from_iu_graph(iu_graph).depth(),
+        "knowledge_level": KNOWLEDGE_LEVELS.get(knowledge_level, 1),
+        "level": int(match.group(1)) if match else 0,
+    }
+
+
+def _solve(matrix: List[List[float]], rhs: List[float]) -> List[float]:
+    """Gaussian elimination with partial pivoting for the small normal equations."""
+    n = len(rhs)
+    a = [row[:] + [b] for row, b in zip(matrix, rhs)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        if abs(a[col][col]) < 1e-12:
+            continue
+        for r in range(n):
+            if r != col:
+                factor = a[r][col] / a[col][col]
+                for c in range(col, n + 1):
+                    a[r][c] -= factor * a[col][c]
+    return [a[i][n] / a[i][i] if abs(a[i][i]) >= 1e-12 else 0.0 for i in range(n)]
+
+
+@dataclass
+class TurnModel:
+    """Linear turn-count model over FEATURES."""
+
+    intercept: float = DEFAULT_INTERCEPT
+    weights: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_WEIGHTS))
+    tokens_per_turn: float = DEFAULT_TOKENS_PER_TURN
+    max_turns: int = 15
+    samples: int = 0
+
+    def expected_turns(self, features: Dict[str, Any]) -> float:
+        turns = self.intercept + sum(w * float(features.get(name, 0)) for name, w in self.weights.items())
+        return max(1.0, min(float(self.max_turns), turns))
+
+    def expected_tokens(self, features: Dict[str, Any]) -> float:
+        return self.expected_turns(features) * self.tokens_per_turn
+
+    def annotate(self, features: Dict[str, Any]) -> Dict[str, Any]:
+        """Features plus the predictions, ready to store as record metadata."""
+        metadata = dict(features)
+        metadata["expected_turns"] = round(self.expected_turns(features), 3)
+        metadata["expected_tokens"] = round(self.expected_tokens(features), 1)
+        return metadata
+
+    def fit(self, samples: Sequence[tuple[Dict[str, Any], int]]) -> None:
+        """Ridge least squares on (features, actual turns); the intercept is not penalized."""
+        if not samples:
+            return
+        dim = len(FEATURES) + 1
+        xtx = [[0.0] * dim for _ in range(dim)]
+        xty = [0.0] * dim
+        for features, turns in samples:
+            x = [1.0] + [float(features.get(name, 0)) for name in FEATURES]
+            for i in range(dim):
+                xty[i] += x[i] * turns
+                for j in range(dim):
+                    xtx[i][j] += x[i] * x[j]
+        for i in range(1, dim):
+            xtx[i][i] += RIDGE
+        solution = _solve(xtx, xty)
+        self.intercept = solution[0]
+        self.weights = dict(zip(FEATURES, solution[1:]))
+        self.samples = len(samples)
+
+
+def load_turn_samples(output_pattern: str) -> List[tuple[Dict[str, Any], int]]:
+    """
+    (features, turns) for finished conversations in earlier output files matching a
+    glob: JSON arrays, compressed JSONL results or checkpoints. Unreadable files are skipped.
+    """
+    samples = []
+    for path in sorted(glob.glob(output_pattern)):
+        if path.endswith(INDEX_SUFFIX):
+            continue
+        try:
+            results = list(ResultReader(path))
+        except (OSError, ValueError):
+            continue
+        for result in results:
+            metadata = result.get("metadata") or {}
+            if all(name in metadata for name in FEATURES) and result.get("finished"):
+                samples.append((metadata, int(result.get("turns", 0))))
+    return samples
+
+
+def calibrate_turn_model(
+    output_pattern: str = "",
+    observed_tokens: Optional[Dict[str, List[int]]] = None,
+    max_turns: int = 15,
+) -> TurnModel:
+    """Fit turns on past outputs and tokens per turn on past call logs, where available."""
+    model = TurnModel(max_turns=max_turns)
+    if output_pattern:
+        model.fit(load_turn_samples(output_pattern))
+    if observed_tokens:
+        means = [
+            sum(observed_tokens[stage]) / len(observed_tokens[stage])
+            for stage in TURN_STAGES
+            if observed_tokens.get(stage)
+        ]
+        if means:
+            model.tokens_per_turn = sum(means)
+    return model
+
+
+def pool_makespan(durations: Sequence[float], pool_size: int) -> float:
+    """Makespan of running `durations` in the given order on `pool_size` slots."""
+    if not durations:
+        return 0.0
+    slots = [0.0] * max(1, min(pool_size, len(durations)))
+    for duration in durations:
+        heapq.heapreplace(slots, slots[0] + duration)
+    return max(slots)
+
+
+def makespan_report(results: Sequence[Dict[str, Any]], pool_size: int, wall_s: Optional[float] = None) -> str:
+    """
+    Predicted against actual makespan (in turns) for the admission order of `results`
+    (run order for the pool, input order for lockstep, where every conversation starts at once).
+    """
+    timed = [r for r in results if (r.get("metadata") or {}).get("expected_turns") is not None]
+    timed.sort(key=lambda r: r["metadata"].get("admitted", 0))
+    if not timed:
+        return "makespan: no scheduling metadata"
+    predicted = pool_makespan([r["metadata"]["expected_turns"] for r in timed], pool_size)
+    actual = pool_makespan([float(r.get("turns", 0)) for r in timed], pool_size)
+    line = f"makespan (turns, pool of {pool_size}): predicted {predicted:.1f}, actual {actual:.1f}"
+    if wall_s is not None:
+        line += f", wall {wall_s:.1f}s"
+    return line
@@ -0,0 +1,61 @@
+"""Turn-level snapshots of a lockstep run, so a preempted run continues where it stopped."""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import random
+from typing import Any, Dict, Optional
+
+SNAPSHOT_VERSION = 1
+
+
+class SimulationInterrupted(Exception):
+    """Raised after a stop request once the in-flight turn is done (and snapshotted, if enabled)."""
+
+    def __init__(self, snapshot_path: Optional[str], turn: int) -> None:
+        saved = f"state saved to {snapshot_path}" if snapshot_path else "no snapshot (unfinished conversations restart)"
+        super().__init__(f"Stopped after turn {turn}; {saved}")
+        self.snapshot_path = snapshot_path
+        self.turn = turn
+
+
+def rng_state() -> list:
+    version, internal, gauss_next = random.getstate()
+    return [version, list(internal), gauss_next]
+
+
+def set_rng_state(state: list) -> None:
+    version, internal, gauss_next = state
+    random.setstate((version, tuple(internal), gauss_next))
+
+
+def write_snapshot(path: str, payload: Dict[str, Any]) -> None:
+    """gzip-compressed JSON, written to a temp file and moved into place."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    data = json.dumps({"version": SNAPSHOT_VERSION, **payload}, ensure_ascii=False, separators=(",", ":"))
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+            f.write(data.encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        payload = json.load(f)
+    if payload.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version in {path}: {payload.get('version')}")
+    return payload
+
+
+def remove_snapshot(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,226 @@
+"""Sweep entry point: several tutors, knowledge levels and seeds over one preprocessing pass."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict
+
+from ..core.cli import split_list
+from ..core.models import SingleModelClient
+from ..core.prompts import PromptRegistry
+from ..core.reasoning import parse_reasoning_profile
+from ..core.usage import format_usage_summary, usage_summary
+from ..knowledge.graph import ConceptGraph
+from .checkpoint import CheckpointWriter, finalize_checkpoint
+from .conversation import run_conversation_with_interaction_profile
+from .runner import (
+    _annotation_from_row,
+    _checkpoint_path,
+    _expand_students,
+    _initial_knowledge_states,
+    _load_prompt_pair,
+    _open_iu_cache,
+    _output_path,
+    _pending,
+    _pending_mask,
+    _problem_graphs,
+    _selected_rows,
+    _student_metadata,
+    _token_budget_settings,
+    _turn_model,
+    _user_profiles,
+    cli_parser,
+)
+from .scheduling import conversation_features
+
+DEFAULT_MODEL_CONCURRENCY = 100
+# Runner flags the sweep inherits but does not implement: it always runs lockstep,
+# without turn snapshots, with tutors from --assistant_models.
+UNSUPPORTED_FLAGS = (
+    "assistant_model",
+    "pipeline",
+    "pool_size",
+    "extract_workers",
+    "queue_size",
+    "schedule",
+    "snapshot_every",
+)
+
+
+def sweep_parser() -> argparse.ArgumentParser:
+    parser = cli_parser()
+    parser.description = "Run several tutor models, knowledge levels and seeds on shared preprocessing."
+    parser.add_argument("--assistant_models", type=str, required=True)
+    parser.add_argument("--knowledge_levels", type=str, default="")
+    parser.add_argument("--seeds", type=str, default="")
+    parser.add_argument("--model_limits", type=str, default="")
+    return parser
+
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    """Parse "gpt-5=16,gpt-4o=64" into per-model request concurrency limits."""
+    limits: Dict[str, int] = {}
+    for part in split_list(spec):
+        if "=" not in part:
+            raise ValueError(f"Invalid model limit: {part}")
+        model, limit = part.split("=", 1)
+        limits[model.strip()] = int(limit)
+    return limits
+
+
+async def main() -> None:
+    parser = sweep_parser()
+    args = parser.parse_args()
+    for name in UNSUPPORTED_FLAGS:
+        if getattr(args, name) != parser.get_default(name):
+            parser.error(f"--{name} is not supported by the sweep")
+
+    assistant_models = split_list(args.assistant_models)
+    # Levels and seeds only change the sampled starting knowledge states.
+    if args.dynamic_knowledge_state_init:
+        knowledge_levels = split_list(args.knowledge_levels) or [args.knowledge_level]
+        seeds = [int(seed) for seed in split_list(args.seeds)] or [args.seed]
+    else:
+        knowledge_levels = [args.knowledge_level]
+        seeds = [args.seed]
+
+    registry = PromptRegistry(args.prompts_root)
+    prompt_template, prompt_initial_query_template = _load_prompt_pair(
+        registry, args.version, args.user_response_only, args.length_control
+    )
+
+    annotations = [_annotation_from_row(idx, row, "sweep") for idx, row in _selected_rows(args)]
+
+    # One client per model name, so a model's limit holds across all configurations using it.
+    reasoning_profile = parse_reasoning_profile(args.reasoning_profile)
+    limits = parse_model_limits(args.model_limits)
+    clients: Dict[str, SingleModelClient] = {}
+
+    def client_for(model_name: str) -> SingleModelClient:
+        if model_name not in clients:
+            clients[model_name] = SingleModelClient(
+                model_name,
+                reasoning_profile,
+                max_concurrency=limits.get(model_name, DEFAULT_MODEL_CONCURRENCY),
+            )
+        return clients[model_name]
+
+    # Shared preprocessing: IU graphs, concept graph, profiles and budgets.
+    iu_cache = _open_iu_cache(args)
+    iu_graphs, concept_items, id_maps, annotations = await _problem_graphs(
+        args, annotations, client_for(args.iu_model), iu_cache
+    )
+    iu_cache_stats = None
+    if iu_cache is not None:
+        iu_cache_stats = iu_cache.stats()
+        print(iu_cache.format_stats())
+        iu_cache.close()
+    concept_graph = {pid: ConceptGraph(items) for pid, items in concept_items.items()}
+    unique_problem_ids = [str(ann["problem_id"]) for ann in annotations]
+    annotations = _expand_students(annotations, args.students_per_problem)
+    problems = [ann["question"] for ann in annotations]
+    problem_ids = [str(ann["problem_id"]) for ann in annotations]
+    length_control_list, user_profiles, profile_length_texts = _user_profiles(args, annotations)
+    budget_for, assistant_max_tokens, truncation_retry_max_tokens = _token_budget_settings(args)
+    user_token_budgets = [budget_for(text) for text in profile_length_texts] if budget_for else None
+    turn_model = _turn_model(args)
+
+    # Starting states are sampled once per (level, seed) and reused by every tutor.
+    knowledge_states: Dict[tuple[str, int], Any] = {}
+    for level, seed in itertools.product(knowledge_levels, seeds):
+        knowledge_states[(level, seed)] = (
+            _initial_knowledge_states(
+                iu_graphs, id_maps, unique_problem_ids, level, seed, args.students_per_problem
+            )
+            if args.dynamic_knowledge_state_init
+            else None
+        )
+
+    keys = [(str(ann["problem_id"]), ann.get("student")) for ann in annotations]
+    configs = list(itertools.product(assistant_models, knowledge_levels, seeds))
+
+    async def run_config(model_name: str, level: str, seed: int) -> Dict[str, Any]:
+        metadata = [
+            _student_metadata(
+                turn_model.annotate(conversation_features(iu_graphs.get(pid, {}), level, ann["level"])),
+                ann,
+            )
+            for pid, ann in zip(problem_ids, annotations)
+        ]
+        version = f"{args.version}_{level}_seed{seed}"
+        checkpoint = _checkpoint_path(model_name, version)
+        todo = _pending_mask(args, checkpoint, keys)
+        with CheckpointWriter(checkpoint, append=args.resume, fsync_every=args.fsync_every) as writer:
+            await run_conversation_with_interaction_profile(
+                problems=_pending(problems, todo),
+                problem_ids=_pending(problem_ids, todo),
+                user_profiles=_pending(user_profiles, todo),
+                user_model_client=client_for(args.user_model),
+                assistant_model_client=client_for(model_name),
+                prompt_initial_query_template=prompt_initial_query_template,
+                prompt_template=prompt_template,
+                concept_graph=concept_graph,
+                knowledge_states=_pending(knowledge_states[(level, seed)], todo),
+                user_temperature=0.7,
+                assistant_temperature=0.0,
+                max_tokens=args.max_tokens,
+                max_turns=15,
+                length_control_bool=args.length_control,
+                length_control_list=_pending(length_control_list, todo),
+                show_progress=False,
+                prompt_layout=args.prompt_layout,
+                user_token_budgets=_pending(user_token_budgets, todo),
+                assistant_max_tokens=assistant_max_tokens,
+                truncation_retry_max_tokens=truncation_retry_max_tokens,
+                metadata=_pending(metadata, todo),
+                on_finished=writer.write,
+                prompts_root=args.prompts_root,
+            )
+        out_path = _output_path(model_name, version, args.output_format)
+        results = finalize_checkpoint(checkpoint, out_path, order=keys)
+        print(f"Saved results to: {out_path}")
+        return {
+            "assistant_model": model_name,
+            "knowledge_level": level,
+            "seed": seed,
+            "output": out_path,
+            "checkpoint": checkpoint,
+            "resumed": todo.count(False),
+            "conversations": len(results),
+            "finished": sum(1 for r in results if r.get("finished")),
+            "mean_turns": round(sum(r.get("turns", 0) for r in results) / len(results), 3) if results else 0.0,
+        }
+
+    runs = await asyncio.gather(*(run_config(*config) for config in configs))
+
+    manifest = {
+        "version": args.version,
+        "input_csv": args.input_csv,
+        "input_parquet": args.input_parquet,
+        "num_conversations": len(annotations),
+        "students_per_problem": args.students_per_problem,
+        "user_model": args.user_model,
+        "iu_model": args.iu_model,
+        "dynamic_knowledge_state_init": args.dynamic_knowledge_state_init,
+        "iu_cache": iu_cache_stats,
+        "model_limits": {name: client.max_concurrency for name, client in clients.items()},
+        "runs": runs,
+        "usage": usage_summary(),
+    }
+    output_dir = os.path.join("output", "competition_math")
+    os.makedirs(output_dir, exist_ok=True)
+    ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    manifest_path = os.path.join(output_dir, f"sweep_{args.version}_{ts}.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Saved sweep manifest to: {manifest_path}")
+    print(format_usage_summary())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,10 @@
-import json
 import html
+import sys
 from pathlib import Path
 from typing import Any, Dict, List
 
+from ..simulation.results import ResultReader, result_stem
+
 
 HTML_TEMPLATE = """<!doctype html>
 <html>
@@ -61,11 +63,8 @@ def render_conversation_block(item: Dict[str, Any], idx: int) -> str:
 
 
 def visualize(input_path: Path, output_path: Path) -> None:
-    with input_path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-
     blocks = []
-    for idx, item in enumerate(data):
+    for idx, item in enumerate(ResultReader(str(input_path))):
         blocks.append(render_conversation_block(item, idx))
 
     html_out = HTML_TEMPLATE.format(body="".join(blocks))
@@ -75,7 +74,9 @@ def visualize(input_path: Path, output_path: Path) -> None:
 
 def main() -> None:
     input_path = Path(r"D:\MySimAre\output\competition_math\gpt-5-mini\dynamic-knowledge-state_20260212_224342.json")
-    output_path = Path(r"D:\MySimAre\output\competition_math\gpt-5-mini\dynamic-knowledge-state_20260212_224342.html")
+    if len(sys.argv) > 1:
+        input_path = Path(sys.argv[1])
+    output_path = Path(sys.argv[2] if len(sys.argv) > 2 else result_stem(str(input_path)) + ".html")
     visualize(input_path, output_path)
 
 
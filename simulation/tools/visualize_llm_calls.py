@@ -1,8 +1,10 @@
-import json
 import html
+import sys
 from pathlib import Path
 from typing import Dict
 
+from ..core.logging import iter_log_entries
+
 
 HTML_TEMPLATE = """<!doctype html>
 <html>
@@ -45,6 +47,7 @@ def render_call(entry: Dict, idx: int) -> str:
     meta = (
         f"<div class='meta'>#{idx + 1} | {html.escape(entry.get('timestamp', ''))} "
         f"| model: {html.escape(entry.get('model_name', ''))} "
+        f"{'| metadata only ' if entry.get('metadata_only') else ''}"
         f"| temp: {entry.get('temperature')} | max_tokens: {entry.get('max_tokens')} | n: {entry.get('n')}</div>"
     )
     system_prompt = html.escape(_normalize_latex(entry.get("system_prompt", "")))
@@ -70,15 +73,7 @@ def render_call(entry: Dict, idx: int) -> str:
 
 
 def visualize(input_path: Path, output_path: Path) -> None:
-    entries = []
-    with input_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            entries.append(json.loads(line))
-
-    body = "".join(render_call(entry, idx) for idx, entry in enumerate(entries))
+    body = "".join(render_call(entry, idx) for idx, entry in enumerate(iter_log_entries(str(input_path))))
     html_out = HTML_TEMPLATE.format(body=body)
     output_path.write_text(html_out, encoding="utf-8")
     print(f"Wrote: {output_path}")
@@ -86,7 +81,9 @@ def visualize(input_path: Path, output_path: Path) -> None:
 
 def main() -> None:
     input_path = Path(r"D:\MySimAre\logs\llm_calls_20260212_224251.jsonl")
-    output_path = Path(r"D:\MySimAre\logs\llm_calls_20260212_224251.html")
+    if len(sys.argv) > 1:
+        input_path = Path(sys.argv[1])
+    output_path = Path(sys.argv[2] if len(sys.argv) > 2 else input_path.with_suffix(".html"))
     visualize(input_path, output_path)
 
 
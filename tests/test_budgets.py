@@ -0,0 +1,64 @@
+import json
+
+from simulation.simulation.budgets import (
+    DEFAULT_TARGET_WORDS,
+    MIN_BUDGET,
+    REASONING_HEADROOM,
+    THOUGHT_TOKENS,
+    TOKENS_PER_WORD,
+    load_observed_output_tokens,
+    observed_p95,
+    parse_length_control,
+    stage_token_budget,
+    user_token_budget,
+)
+
+
+def test_parse_length_control():
+    assert parse_length_control("Reply in between 10 and 25 words.") == (10, 25)
+    assert parse_length_control("between 30 and 5 words") == (5, 30)
+    assert parse_length_control("Keep it around 20 words") == (20, 20)
+    assert parse_length_control("short") is None
+    assert parse_length_control(None) is None
+
+
+def test_user_budget_from_length_text():
+    assert user_token_budget("between 10 and 50 words") == 80 + THOUGHT_TOKENS
+    assert user_token_budget("between 10 and 50 words", include_thought=False) == MIN_BUDGET
+    assert user_token_budget(None) == round(DEFAULT_TARGET_WORDS * TOKENS_PER_WORD) + THOUGHT_TOKENS
+
+
+def test_user_budget_uses_observed_p95_and_ceiling():
+    assert user_token_budget(None, observed_p95=800) == 1000
+    assert user_token_budget(None, observed_p95=800, ceiling=900) == 900
+
+
+def test_user_budget_adds_reasoning_headroom_without_observations():
+    base = user_token_budget(None)
+    assert user_token_budget(None, reasoning_effort="minimal") == base + REASONING_HEADROOM["minimal"]
+    assert user_token_budget(None, reasoning_effort="medium") == base + REASONING_HEADROOM["medium"]
+    assert user_token_budget(None, reasoning_effort="medium", ceiling=1000) == 1000
+    # Observed lengths already include reasoning tokens.
+    assert user_token_budget(None, observed_p95=800, reasoning_effort="medium") == 1000
+
+
+def test_stage_budget():
+    assert stage_token_budget("assistant", {}, default=3000) == 3000
+    assert stage_token_budget("assistant", {"assistant": [100, 400]}, default=3000) == 500
+    assert stage_token_budget("assistant", {"assistant": [10]}, default=3000) == MIN_BUDGET
+    assert stage_token_budget("assistant", {"assistant": [5000]}, default=3000) == 3000
+
+
+def test_load_observed_output_tokens_skips_truncated_calls(tmp_path):
+    log = tmp_path / "llm_calls_1.jsonl"
+    entries = [
+        {"stage": "user", "usage": {"completion_tokens": 120}},
+        {"stage": "user", "usage": {"completion_tokens": 300, "finish_reason": "length"}},
+        {"stage": "assistant", "usage": {"completion_tokens": 900}},
+        {"usage": {"completion_tokens": 50}},
+    ]
+    log.write_text("".join(json.dumps(e) + "\n" for e in entries), encoding="utf-8")
+    observed = load_observed_output_tokens(str(tmp_path / "llm_calls_*.jsonl"))
+    assert observed == {"user": [120], "assistant": [900]}
+    assert observed_p95(observed, "user") == 120
+    assert observed_p95(observed, "knowledge_update") is None
@@ -0,0 +1,61 @@
+import json
+
+from simulation.simulation.checkpoint import (
+    CheckpointWriter,
+    finalize_checkpoint,
+    load_checkpoint,
+    result_key,
+    resume_mask,
+)
+from simulation.simulation.results import ResultReader
+
+
+def _result(problem_id, student=None, turns=1):
+    metadata = {"student": student} if student is not None else {}
+    return {"problem_id": problem_id, "metadata": metadata, "turns": turns}
+
+
+def test_torn_last_line_is_skipped_and_append_starts_a_new_line(tmp_path):
+    path = str(tmp_path / "run" / "checkpoint.jsonl")
+    with CheckpointWriter(path, fsync_every=1) as writer:
+        writer.write(_result(1))
+        writer.write(_result(2))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"problem_id": 3, "tur')
+    assert [r["problem_id"] for r in load_checkpoint(path)] == [1, 2]
+
+    with CheckpointWriter(path, append=True) as writer:
+        writer.write(_result(4))
+    assert [r["problem_id"] for r in load_checkpoint(path)] == [1, 2, 4]
+    assert load_checkpoint(str(tmp_path / "missing.jsonl")) == []
+
+
+def test_resume_mask_matches_problem_and_student():
+    done = [_result(1, "a"), _result(2)]
+    keys = [("1", "a"), ("1", "b"), ("2", None)]
+    assert resume_mask(done, keys) == [False, True, False]
+    assert result_key(_result(7, "x")) == ("7", "x")
+
+
+def test_finalize_keeps_the_last_copy_in_the_given_order(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    with CheckpointWriter(path) as writer:
+        writer.write(_result(2, turns=1))
+        writer.write(_result(1, turns=1))
+        writer.write(_result(2, turns=5))
+        writer.write(_result(9))
+    output = str(tmp_path / "results.json")
+    written = finalize_checkpoint(path, output, order=[("1", None), ("2", None)])
+    assert [(r["problem_id"], r["turns"]) for r in written] == [(1, 1), (2, 5), (9, 1)]
+    with open(output, "r", encoding="utf-8") as f:
+        assert json.load(f) == written
+
+
+def test_finalize_without_order_follows_the_last_write(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    with CheckpointWriter(path) as writer:
+        for problem_id in (1, 2, 1):
+            writer.write(_result(problem_id))
+    output = str(tmp_path / "results.jsonl.gz")
+    finalize_checkpoint(path, output)
+    assert [r["problem_id"] for r in ResultReader(output)] == [2, 1]
@@ -0,0 +1,63 @@
+import asyncio
+import sqlite3
+
+from simulation.knowledge.concept_graph import build_concept_graph_from_extracted
+from simulation.knowledge.concept_kb import ConceptKB
+
+PREREQS = [{"concept_id": "Division", "description": "Splitting into equal parts"}]
+
+
+class OnePrereqClient:
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.requests = 0
+
+    async def generate_responses(self, contexts, **kwargs):
+        self.requests += len(contexts)
+        return [['{"prerequisites": [{"concept_id": "Basics", "description": "d"}]}'] for _ in contexts]
+
+
+def test_entries_are_keyed_by_normalized_name_and_model(tmp_path):
+    kb = ConceptKB(str(tmp_path / "kb.sqlite"))
+    kb.put("Fractions", "Parts of a whole", PREREQS, "gpt-5")
+    assert kb.get("  fractions ", "gpt-5") == {
+        "concept_id": "Fractions", "description": "Parts of a whole", "prerequisites": PREREQS,
+    }
+    assert kb.get("Fractions", "gpt-4o") is None
+    kb.put("Fractions", "Parts", [], "gpt-4o")
+    assert len(kb) == 2
+    assert kb.stats()["hits"] == 1 and kb.stats()["misses"] == 1
+    kb.close()
+
+
+def test_legacy_store_is_migrated(tmp_path):
+    path = str(tmp_path / "kb.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE concepts (norm_name TEXT PRIMARY KEY, name TEXT NOT NULL, description TEXT NOT NULL, "
+        "prerequisites TEXT NOT NULL, model TEXT NOT NULL, created REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO concepts VALUES ('fractions', 'Fractions', 'd', '[]', 'gpt-5', 0)")
+    conn.commit()
+    conn.close()
+
+    kb = ConceptKB(path)
+    assert kb.entries_at_open == 1
+    assert kb.get("Fractions", "gpt-5")["concept_id"] == "Fractions"
+    kb.close()
+
+
+def test_graph_builder_reuses_entries_of_the_same_model(tmp_path):
+    extracted = {"1": {"extracted_concepts": [{"Concept Name": "Fractions", "Concept Explanation": "x"}]}}
+    kb = ConceptKB(str(tmp_path / "kb.sqlite"))
+
+    first = OnePrereqClient("gpt-5")
+    asyncio.run(build_concept_graph_from_extracted(extracted, model_client=first, kb=kb))
+    again = OnePrereqClient("gpt-5")
+    graph = asyncio.run(build_concept_graph_from_extracted(extracted, model_client=again, kb=kb))
+    other = OnePrereqClient("gpt-4o")
+    asyncio.run(build_concept_graph_from_extracted(extracted, model_client=other, kb=kb))
+
+    assert (first.requests, again.requests, other.requests) == (1, 0, 1)
+    assert graph["1"][0]["prerequisites"] == ["Basics"]
+    kb.close()
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import re
+
+import pytest
+
+from simulation.core.usage import packing_summary, reset_usage
+from simulation.knowledge.concept_graph import build_concept_graph_from_extracted
+
+EXTRACTED = {
+    str(p): {"extracted_concepts": [{"Concept Name": f"C{p}-{i}", "Concept Explanation": "x"} for i in range(4)]}
+    for p in range(2)
+}
+
+
+class PrereqClient:
+    """Generates "base of <concept>"; packed replies upper-case one key and leave out `skip`."""
+
+    model_name = "m"
+
+    def __init__(self, skip=None):
+        self.skip = skip
+        self.stages = []
+
+    async def generate_responses(self, contexts, **kwargs):
+        self.stages += [kwargs["stage"]] * len(contexts)
+        outputs = []
+        for ctx in contexts:
+            prompt = ctx[0]["content"]
+            if "Target concepts:" in prompt:
+                targets = json.loads(prompt.split("Target concepts:\n")[1].split("\nExisting concepts:")[0])
+                answered = {
+                    (t["concept_id"].upper() if i == 0 else t["concept_id"]): [{"concept_id": f"base of {t['concept_id']}", "description": "d"}]
+                    for i, t in enumerate(targets)
+                    if t["concept_id"] != self.skip
+                }
+                outputs.append(["```json\n" + json.dumps({"prerequisites": answered}) + "\n```"])
+            elif "Target concept:" in prompt:
+                target = re.search(r"Target concept: (.*)", prompt).group(1)
+                outputs.append([json.dumps({"prerequisites": [{"concept_id": f"base of {target}", "description": "d"}]})])
+            else:
+                outputs.append(['{"prerequisites": {}}'])
+        return outputs
+
+
+def _graph(pack_size, client):
+    graph = asyncio.run(build_concept_graph_from_extracted(EXTRACTED, model_client=client, pack_size=pack_size))
+    return {pid: sorted((item["concept_id"], tuple(item["prerequisites"])) for item in items) for pid, items in graph.items()}
+
+
+@pytest.fixture(autouse=True)
+def _clean_usage():
+    reset_usage()
+    yield
+    reset_usage()
+
+
+@pytest.mark.parametrize("pack_size, packed_calls", [(0, 2), (2, 4)])
+def test_packed_requests_build_the_same_graph(pack_size, packed_calls):
+    unpacked = PrereqClient()
+    expected = _graph(1, unpacked)
+    assert unpacked.stages.count("concept_prereqs") == 8
+
+    packed = PrereqClient()
+    assert _graph(pack_size, packed) == expected
+    assert packed.stages.count("concept_prereqs_packed") == packed_calls
+    assert "concept_prereqs" not in packed.stages
+    summary = packing_summary()["concept_prereqs"]
+    assert summary["unpacked_calls"] == 8 and summary["fallback_calls"] == 0
+
+
+def test_concepts_missing_from_a_packed_reply_are_asked_alone():
+    client = PrereqClient(skip="C0-2")
+    graph = _graph(0, client)
+    assert client.stages.count("concept_prereqs") == 1
+    assert ("C0-2", ("base of C0-2",)) in graph["0"]
+    assert packing_summary()["concept_prereqs"]["fallback_calls"] == 1
@@ -0,0 +1,75 @@
+import io
+import threading
+
+import pytest
+
+from simulation.core.logging import ConsoleTracer, _truncate, format_call_compact, format_call_full
+
+ENTRY = {
+    "timestamp": "2024-05-01T12:34:56.789Z",
+    "model_name": "gpt-4o-mini",
+    "stage": "user",
+    "system_prompt": "sys",
+    "user_prompt": "Solve\n  this   problem " + "x" * 100,
+    "output": ["a", "b"],
+    "usage": {"prompt_tokens": 120, "cached_tokens": 64, "completion_tokens": 7, "latency_s": 1.234, "finish_reason": "stop"},
+}
+
+
+def test_truncate():
+    assert _truncate("abcdef", 3) == "abc... [3 more chars]"
+    assert _truncate("abc", 0) == "abc"
+    assert _truncate(["a", "b"], 0) == "a\n---\nb"
+    assert _truncate(None, 5) == ""
+
+
+def test_compact_format_is_one_line():
+    line = format_call_compact(ENTRY, max_chars=20)
+    assert line == (
+        "[12:34:56] user gpt-4o-mini 1.23s in=120 (cached 64) out=7 finish=stop | "
+        "Solve this probl... [103 more chars]"
+    )
+    assert format_call_compact({}) == "[] unlabeled None 0.00s in=0 out=0 finish=None | "
+
+
+def test_full_format_shows_every_section():
+    text = format_call_full(ENTRY, max_chars=0)
+    assert "--- output ---\na\n---\nb" in text
+    assert text.startswith("\n=== LLM CALL ===\nmodel: gpt-4o-mini")
+
+
+def test_stage_filter_and_unknown_mode():
+    stream = io.StringIO()
+    tracer = ConsoleTracer(mode="compact", stages=("assistant",), stream=stream)
+    tracer.submit([ENTRY, dict(ENTRY, stage="assistant")])
+    tracer.close()
+    assert tracer.printed == 1
+    assert " assistant " in stream.getvalue()
+    with pytest.raises(ValueError):
+        ConsoleTracer(mode="verbose")
+
+
+class _BlockingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.writing.set()
+        self.release.wait()
+        return super().write(text)
+
+
+def test_full_queue_drops_batches_and_reports_them():
+    stream = _BlockingStream()
+    tracer = ConsoleTracer(mode="compact", queue_size=1, stream=stream)
+    tracer.submit([ENTRY])
+    assert stream.writing.wait(5)
+    tracer.submit([ENTRY])
+    tracer.submit([ENTRY, ENTRY])
+    assert tracer.dropped == 2
+    stream.release.set()
+    tracer.close()
+    assert tracer.printed == 2
+    assert stream.getvalue().endswith("[llm trace] 2 calls not printed (console queue full)\n")
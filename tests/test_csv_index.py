@@ -0,0 +1,92 @@
+import csv
+
+import pytest
+
+from simulation.data.csv_index import (
+    CsvIndex,
+    describe_selection,
+    parse_shard,
+    select_rows,
+    shard_indices,
+    stratified_sample,
+)
+from simulation.data.loaders import load_csv_rows
+
+
+def _write_csv(path, rows, newline="\n"):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["problem", "level", "type"], lineterminator=newline)
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_build_handles_quoted_fields_spanning_lines(tmp_path):
+    rows = [
+        {"problem": "plain", "level": "Level 1", "type": "Algebra"},
+        {"problem": 'two\nlines with "quotes"', "level": "Level 2", "type": "Geometry"},
+        {"problem": "three\r\nlines\nhere", "level": "Level 1", "type": "Algebra"},
+        {"problem": "last", "level": "Level 3", "type": "Algebra"},
+    ]
+    path = _write_csv(tmp_path / "data.csv", rows, newline="\r\n")
+    index = CsvIndex.build(path)
+    assert len(index) == 4
+    assert [index.row(i) for i in range(4)] == load_csv_rows(path)
+    assert index.row(3)["problem"] == "last"
+    assert index.stratum(1, ("level", "type")) == ("Level 2", "Geometry")
+    index.close()
+
+
+def test_load_or_build_reuses_the_cache_until_the_file_changes(tmp_path):
+    path = _write_csv(tmp_path / "data.csv", [{"problem": "a", "level": "1", "type": "x"}])
+    cache_dir = str(tmp_path / "cache")
+    first = CsvIndex.load_or_build(path, cache_dir=cache_dir)
+    cached = CsvIndex.load_or_build(path, cache_dir=cache_dir)
+    assert list(cached.offsets) == list(first.offsets) and cached.strata.keys() == first.strata.keys()
+
+    _write_csv(tmp_path / "data.csv", [{"problem": "a", "level": "1", "type": "x"}, {"problem": "bb", "level": "2", "type": "y"}])
+    assert len(CsvIndex.load_or_build(path, cache_dir=cache_dir)) == 2
+
+
+class _Strata:
+    def __init__(self, labels):
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.labels)
+
+    def stratum(self, i, by):
+        return (self.labels[i],) if by else ()
+
+
+def test_stratified_sample_is_proportional_seeded_and_in_file_order():
+    strata = _Strata(["a"] * 60 + ["b"] * 30 + ["c"] * 10)
+    chosen = stratified_sample(strata, range(100), 10, ("level",), seed=3)
+    assert chosen == sorted(chosen)
+    assert [strata.labels[i] for i in chosen].count("a") == 6
+    assert [strata.labels[i] for i in chosen].count("b") == 3
+    assert [strata.labels[i] for i in chosen].count("c") == 1
+    assert chosen == stratified_sample(strata, range(100), 10, ("level",), seed=3)
+    assert stratified_sample(strata, range(5), 10, ("level",), seed=3) == [0, 1, 2, 3, 4]
+
+
+def test_largest_remainder_keeps_the_sample_size():
+    strata = _Strata(["a", "b", "c"] * 3)
+    assert len(stratified_sample(strata, range(9), 4, ("level",), seed=0)) == 4
+
+
+def test_shards_cover_every_index_once():
+    shards = [shard_indices(range(10), (k, 3)) for k in (1, 2, 3)]
+    assert sum(shards, []) == list(range(10))
+    assert parse_shard("2/3") == (2, 3)
+    for spec in ("0/3", "4/3", "x"):
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_select_rows_filters_then_shards_then_slices():
+    strata = _Strata(["a", "b"] * 5)
+    assert select_rows(strata, where={"level": ["a"]}) == [0, 2, 4, 6, 8]
+    assert select_rows(strata, where={"level": ["a"]}, shard="2/2") == [4, 6, 8]
+    assert select_rows(strata, where={"level": ["a"]}, shard="2/2", offset=1, limit=1) == [6]
+    assert "Selected 2 of 10 rows (a: 1, b: 1)" == describe_selection(strata, [0, 1], ("level",))
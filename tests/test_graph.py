@@ -0,0 +1,96 @@
+import json
+
+from simulation.knowledge.gating import clamp_update
+from simulation.knowledge.graph import ConceptGraph, normalize_concept_name
+from simulation.knowledge.update import _format_prerequisite_states
+
+ITEMS = [
+    {"concept_id": "Fractions", "prerequisites": ["Division"]},
+    {"concept_id": "Ratios", "prerequisites": ["Fractions"]},
+    {"concept_id": "Proportions", "prerequisites": ["Ratios", "Fractions"]},
+]
+
+
+def test_ids_adjacency_and_order():
+    graph = ConceptGraph(ITEMS)
+    assert graph.labels == ["Fractions", "Ratios", "Proportions", "Division"]
+    assert graph.concept_names == ["Fractions", "Ratios", "Proportions"]
+    assert graph.prereq_labels("Proportions") == ["Ratios", "Fractions"]
+    assert [graph.labels[node] for node in graph.order] == ["Division", "Fractions", "Ratios", "Proportions"]
+    assert graph.depth() == 4
+    assert graph.find("  proportions ") == graph.id_of("Proportions")
+    assert normalize_concept_name(" Two  Words ") == "two words"
+
+
+def test_closure_covers_indirect_prerequisites():
+    graph = ConceptGraph(ITEMS)
+    assert graph.ancestors("Proportions") == ["Division", "Fractions", "Ratios"]
+    assert graph.ancestors("Division") == []
+    assert graph.ancestors("missing") == []
+    assert graph.depends_on("Proportions", "Division")
+    assert not graph.depends_on("Division", "Proportions")
+    assert not graph.depends_on("Proportions", "missing")
+
+
+def test_cycles_do_not_break_order_or_closure():
+    graph = ConceptGraph([
+        {"concept_id": "a", "prerequisites": ["b"]},
+        {"concept_id": "b", "prerequisites": ["a"]},
+        {"concept_id": "c", "prerequisites": []},
+    ])
+    assert [graph.labels[node] for node in graph.order] == ["c", "a", "b"]
+    assert graph.depends_on("a", "b")
+    assert graph.topological(["b", "x", "c"]) == ["c", "b", "x"]
+
+
+def test_from_iu_graph_keeps_edges_between_known_nodes():
+    graph = ConceptGraph.from_iu_graph({
+        "nodes": [{"id": "IU1"}, {"id": "IU2"}],
+        "edges": [{"from": "IU1", "to": "IU2"}, {"from": "IU9", "to": "IU2"}],
+    })
+    assert graph.prereq_labels("IU2") == ["IU1"]
+
+
+def test_clamp_update_in_one_topological_pass():
+    graph = ConceptGraph(ITEMS)
+    state = {"Division": {"state": "knows_well"}, "Fractions": {"state": "not_introduced"}}
+    gated = clamp_update(graph, state, {"Proportions": "knows_well", "Fractions": "knows_well", "Ratios": "knows_well"})
+    # Fractions is raised first, so Ratios may follow; Proportions also needs Ratios.
+    assert gated == {"Proportions": "knows_well", "Fractions": "knows_well", "Ratios": "knows_well"}
+
+    gated = clamp_update(graph, state, {"Ratios": "partial_understanding", "Proportions": "struggling"})
+    assert gated == {"Ratios": "struggling", "Proportions": "struggling"}
+
+
+def test_clamp_update_without_a_graph():
+    assert clamp_update(None, {}, {"x": "knows_well"}) == {"x": "knows_well"}
+
+
+def test_prerequisite_states_list_every_ancestor():
+    graph = ConceptGraph(ITEMS)
+    text = _format_prerequisite_states(["Ratios"], {"Division": {"state": "struggling"}}, graph)
+    assert json.loads(text) == {
+        "Ratios": [
+            {"concept": "Division", "state": "struggling"},
+            {"concept": "Fractions", "state": "unknown"},
+        ]
+    }
+    assert _format_prerequisite_states(["Ratios"], {}, None) == "{}"
+
+
+def test_iu_state_mapping_counts_edges_from_unknown_ids():
+    from simulation.simulation.runner import _iu_prereqs, _map_iu_state
+
+    iu_graph = {
+        "nodes": [{"id": "IU1"}, {"id": "IU2"}, {"id": "IU3"}],
+        "edges": [{"from": "IU1", "to": "IU2"}, {"from": "IU8", "to": "IU2"}, {"from": "IU9", "to": "IU2"},
+                  {"from": "IU9", "to": "IU3"}],
+    }
+    state = {"known": ["IU1"], "partially_known": ["IU2"], "unknown": ["IU3"]}
+    mapped = _map_iu_state(state, _iu_prereqs(iu_graph), {"IU1": "IU1: c1"})
+    assert mapped == {
+        "IU1: c1": {"state": "knows_well"},
+        # One of three prerequisites known, not one of one.
+        "IU2": {"state": "struggling"},
+        "IU3": {"state": "unknown_unknown"},
+    }
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from simulation.knowledge.graph_artifact import (
+    GraphArtifact,
+    artifact_mismatches,
+    problem_key,
+    template_sha256,
+    validate_iu_graph,
+    write_graph_artifact,
+)
+from simulation.simulation.runner import _open_graph_artifact, cli_parser
+
+PROMPTS_ROOT = os.path.join(os.path.dirname(__file__), "..", "simulation", "prompts")
+ENTRY = {"iu_graph": {"nodes": [{"id": "IU1"}], "edges": []}, "concept_items": [], "id_map": {}, "issues": []}
+
+
+def _write(path, iu_model="gpt-4o-mini"):
+    meta = {"iu_model": iu_model, "prompt_sha256": template_sha256(os.path.join(PROMPTS_ROOT, "iu_graph_extraction.txt"))}
+    entries = {problem_key("q1", "a1"): ENTRY, problem_key("q2", "a2"): dict(ENTRY, issues=["x"])}
+    return write_graph_artifact(str(path), entries, meta)
+
+
+def test_round_trip_decodes_entries_lazily(tmp_path):
+    path = tmp_path / "graphs.bin"
+    size = _write(path)
+    assert size == os.path.getsize(path)
+    with GraphArtifact(str(path)) as artifact:
+        assert len(artifact) == 2
+        key = problem_key("q2", "a2")
+        assert key in artifact and list(artifact)[1] == key
+        assert artifact.get(key)["issues"] == ["x"]
+        assert artifact.get(key) is artifact.get(key)
+        assert artifact.get("missing") is None
+        assert artifact.meta["iu_model"] == "gpt-4o-mini"
+
+
+def test_problem_key_separates_parts():
+    assert problem_key("ab", "c") != problem_key("a", "bc")
+
+
+def test_foreign_file_is_rejected(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not an artifact at all")
+    with pytest.raises(ValueError):
+        GraphArtifact(str(path))
+
+
+def test_validate_iu_graph():
+    assert validate_iu_graph(ENTRY["iu_graph"]) == []
+    issues = validate_iu_graph({
+        "nodes": [{"id": "A"}, {"id": "B"}, {"id": "B"}, {"id": "C"}],
+        "edges": [{"from": "A", "to": "A"}, {"from": "X", "to": "A"}, {"from": "B", "to": "C"}, {"from": "C", "to": "B"}],
+    })
+    assert issues == ["duplicate node B", "self-loop on A", "dangling edge X -> A", "cycle through A, B, B, C"]
+    assert validate_iu_graph({}) == ["no nodes"]
+
+
+def test_mismatches():
+    meta = {"iu_model": "a", "prompt_sha256": "h"}
+    assert artifact_mismatches(meta, iu_model="a", prompt_sha256="h") == []
+    assert len(artifact_mismatches(meta, iu_model="b", prompt_sha256="other")) == 2
+
+
+def test_runner_refuses_a_stale_artifact(tmp_path, capsys):
+    path = tmp_path / "graphs.bin"
+    _write(path, iu_model="older-model")
+    argv = ["--version", "v", "--prompts_root", PROMPTS_ROOT, "--graph_artifact", str(path)]
+    with pytest.raises(ValueError, match="stale: compiled with iu_model older-model"):
+        _open_graph_artifact(cli_parser().parse_args(argv))
+
+    artifact = _open_graph_artifact(cli_parser().parse_args(argv + ["--allow_stale_artifact"]))
+    assert len(artifact) == 2
+    artifact.close()
+    assert "using it anyway" in capsys.readouterr().out
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import os
+
+from simulation.knowledge.iu_cache import IUGraphCache, iu_cache_key
+from simulation.knowledge.iu_extraction import extract_iu_graphs
+
+PROMPT_PATH = os.path.join(os.path.dirname(__file__), "..", "simulation", "prompts", "iu_graph_extraction.txt")
+GRAPH = {"nodes": [{"id": "IU1"}], "edges": []}
+
+
+class GraphClient:
+    model_name = "gpt-4o-mini"
+
+    def __init__(self):
+        self.requests = 0
+
+    async def generate_responses(self, contexts, **kwargs):
+        self.requests += len(contexts)
+        return [[json.dumps(GRAPH)] for _ in contexts]
+
+
+def test_key_depends_on_every_part():
+    key = iu_cache_key("q", "a", "template", "m")
+    assert key == iu_cache_key("q", "a", "template", "m")
+    assert key != iu_cache_key("q", "a", "template v2", "m")
+    assert key != iu_cache_key("q", "a", "template", "other")
+    assert iu_cache_key("ab", "c", "t", "m") != iu_cache_key("a", "bc", "t", "m")
+
+
+def test_cache_persists_across_opens(tmp_path):
+    path = str(tmp_path / "cache" / "iu.sqlite")
+    cache = IUGraphCache(path)
+    assert cache.get("k") is None
+    cache.put("k", "m", GRAPH)
+    assert cache.get("k") == GRAPH
+    assert cache.stats()["hit_rate"] == 0.5
+    cache.close()
+
+    reopened = IUGraphCache(path)
+    assert reopened.entries_at_open == 1
+    assert reopened.get("k") == GRAPH
+    assert "1 hits, 0 misses" in reopened.format_stats()
+    reopened.close()
+
+
+def test_extraction_only_requests_uncached_problems(tmp_path):
+    cache = IUGraphCache(str(tmp_path / "iu.sqlite"))
+    client = GraphClient()
+    problems = {"1": ("q1", "a1"), "2": ("q2", "a2")}
+    graphs, errors = asyncio.run(extract_iu_graphs(problems, model_client=client, prompt_path=PROMPT_PATH, cache=cache))
+    assert graphs == {"1": GRAPH, "2": GRAPH} and errors == {}
+    assert client.requests == 2
+
+    problems["3"] = ("q3", "a3")
+    graphs, _ = asyncio.run(extract_iu_graphs(problems, model_client=client, prompt_path=PROMPT_PATH, cache=cache))
+    assert list(graphs) == ["1", "2", "3"]
+    assert client.requests == 3
+    assert cache.stats()["stored"] == 3
+    cache.close()
@@ -0,0 +1,51 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from simulation.knowledge.iu_extraction import RETRY_INSTRUCTION, UNPARSABLE_ERROR, extract_iu_graph, extract_iu_graphs
+
+PROMPT_PATH = os.path.join(os.path.dirname(__file__), "..", "simulation", "prompts", "iu_graph_extraction.txt")
+
+
+class FlakyClient:
+    """P1 parses, P2 only parses on the JSON-only retry, P3 never parses, P4's request fails."""
+
+    model_name = "m"
+
+    def __init__(self):
+        self.batches = []
+
+    async def generate_responses(self, contexts, request_errors=None, on_complete=None, **kwargs):
+        self.batches.append(len(contexts))
+        outputs = []
+        for i, ctx in enumerate(contexts):
+            prompt = ctx[-1]["content"]
+            if on_complete:
+                on_complete()
+            if "P4" in prompt:
+                request_errors[i] = TimeoutError("timed out")
+                outputs.append([""])
+            elif "P1" in prompt or ("P2" in prompt and prompt.endswith(RETRY_INSTRUCTION)):
+                outputs.append([json.dumps({"nodes": [], "edges": []})])
+            else:
+                outputs.append(["not json"])
+        return outputs
+
+
+def test_one_batch_plus_one_retry_batch():
+    client = FlakyClient()
+    problems = {pid: (f"P{pid}", "answer") for pid in "4321"}
+    graphs, errors = asyncio.run(extract_iu_graphs(problems, model_client=client, prompt_path=PROMPT_PATH))
+    assert client.batches == [4, 2]
+    assert list(graphs) == ["2", "1"]
+    assert errors == {"4": "request failed: timed out", "3": UNPARSABLE_ERROR}
+
+
+def test_single_extraction_raises_on_failure():
+    client = FlakyClient()
+    graph = asyncio.run(extract_iu_graph(question="P1", answer="a", model_client=client, prompt_path=PROMPT_PATH))
+    assert graph == {"nodes": [], "edges": []}
+    with pytest.raises(RuntimeError, match=UNPARSABLE_ERROR):
+        asyncio.run(extract_iu_graph(question="P3", answer="a", model_client=client, prompt_path=PROMPT_PATH))
@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+import pytest
+
+from simulation.knowledge.iu_init import initialize_knowledge_state
+from simulation.knowledge.iu_population import compile_iu_graph, population_rng, sample_population
+
+# A binary tree of 20 IUs; IU19 also needs an IU that is not a node, so it can never be known.
+IU_GRAPH = {
+    "nodes": [{"id": f"IU{i}"} for i in range(20)],
+    "edges": [{"from": f"IU{i // 2}", "to": f"IU{i}"} for i in range(1, 20)] + [{"from": "IUx", "to": "IU19"}],
+}
+STUDENTS = 3000
+
+
+def _scalar_frequencies(level):
+    rng = random.Random(0)
+    known = np.zeros(20)
+    partial = np.zeros(20)
+    for _ in range(STUDENTS):
+        state = initialize_knowledge_state(IU_GRAPH, level, rng)
+        for node in state["known"]:
+            known[int(node[2:])] += 1
+        for node in state["partially_known"]:
+            partial[int(node[2:])] += 1
+    return known / STUDENTS, partial / STUDENTS
+
+
+@pytest.mark.parametrize("level", ["novice", "intermediate", "advanced"])
+def test_population_matches_the_scalar_sampler(level):
+    sample = sample_population(IU_GRAPH, level, STUDENTS, 1)
+    order = [int(node[2:]) for node in sample.node_ids]
+    known = np.zeros(20)
+    partial = np.zeros(20)
+    known[order] = sample.known.mean(axis=0)
+    partial[order] = sample.partial.mean(axis=0)
+    scalar_known, scalar_partial = _scalar_frequencies(level)
+    assert np.abs(known - scalar_known).max() < 0.04
+    assert np.abs(partial - scalar_partial).max() < 0.04
+
+
+def test_sampled_states_follow_prerequisite_rules():
+    graph = compile_iu_graph(IU_GRAPH)
+    sample = sample_population(graph, "advanced", 500, population_rng(2, "p1"))
+    assert len(sample) == 500
+    assert not sample.known[:, graph.node_ids.index("IU19")].any()
+    assert not (sample.known & sample.partial).any()
+    for j, prereqs in enumerate(graph.prereqs):
+        if prereqs.size:
+            assert (~sample.known[:, j] | sample.known[:, prereqs].all(axis=1)).all()
+            assert (~sample.partial[:, j] | sample.known[:, prereqs].any(axis=1)).all()
+
+
+def test_state_matches_the_scalar_format():
+    sample = sample_population(IU_GRAPH, "intermediate", 3, 7)
+    state = sample.state(1)
+    assert sorted(state) == ["known", "partially_known", "unknown"]
+    assert sorted(state["known"] + state["partially_known"] + state["unknown"]) == sorted(sample.node_ids)
+
+
+def test_population_rng_is_per_problem_and_reproducible():
+    first = sample_population(IU_GRAPH, "intermediate", 10, population_rng(2, "p1"))
+    again = sample_population(IU_GRAPH, "intermediate", 10, population_rng(2, "p1"))
+    other = sample_population(IU_GRAPH, "intermediate", 10, population_rng(2, "p2"))
+    assert (first.known == again.known).all()
+    assert not ((first.known == other.known).all() and (first.partial == other.partial).all())
+
+
+def test_unknown_level_is_rejected():
+    with pytest.raises(ValueError):
+        sample_population(IU_GRAPH, "expert", 1, 0)
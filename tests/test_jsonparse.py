@@ -0,0 +1,45 @@
+import pytest
+
+from simulation.core.jsonparse import parse_json_object
+from simulation.core.models import _response_format, supports_json_schema
+from simulation.knowledge.schemas import explained_concepts_schema, knowledge_update_schema
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('Sure! ```json\n{"a": {"b": [1, 2]}}\n``` done', {"a": {"b": [1, 2]}}),
+    ('{"a": 1} and then {"b": 2}', {"a": 1}),
+    ('{"truncated": {"x": 1}, "y": ', {"x": 1}),
+    ("[1, 2, 3]", None),
+    ("no json here", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_json_object(text, expected):
+    assert parse_json_object(text) == expected
+
+
+def test_accept_skips_objects_it_rejects():
+    text = '{"state": "knows_well"} {"concept": {"new_state": "struggling"}}'
+    accept = lambda obj: all(isinstance(v, dict) for v in obj.values())
+    assert parse_json_object(text, accept=accept) == {"concept": {"new_state": "struggling"}}
+    assert parse_json_object('{"a": 1}', accept=lambda obj: False) is None
+
+
+def test_schemas_constrain_names():
+    schema = explained_concepts_schema(["a", "b", "a"])["schema"]
+    assert schema["properties"]["explained_concepts"]["items"]["enum"] == ["a", "b"]
+    assert "enum" not in explained_concepts_schema([])["schema"]["properties"]["explained_concepts"]["items"]
+
+    update = knowledge_update_schema(["a", "b"])["schema"]
+    assert update["required"] == ["a", "b"]
+    assert update["additionalProperties"] is False
+
+
+def test_response_format_falls_back_to_json_mode():
+    schema = explained_concepts_schema(["a"])
+    assert _response_format("gpt-4o-mini", False, schema) == {"type": "json_schema", "json_schema": schema}
+    assert not supports_json_schema("gpt-4o-2024-05-13")
+    assert _response_format("gpt-4o-2024-05-13", False, schema) == {"type": "json_object"}
+    assert _response_format("gpt-4o-mini", True, None) == {"type": "json_object"}
+    assert _response_format("gpt-4o-mini", False, None) is None
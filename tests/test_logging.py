@@ -0,0 +1,93 @@
+import json
+
+from simulation.core.logging import (
+    LLMLogWriter,
+    build_log_entry,
+    iter_log_entries,
+    log_base_path,
+    log_segments,
+)
+
+
+def _entry(turns, stage="user"):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i}"})
+        messages.append({"role": "assistant", "content": f"answer {i}"})
+    return build_log_entry(
+        model_name="m",
+        system_prompt="You are a student.",
+        user_prompt=f"turn {turns}",
+        messages=messages,
+        output=[f"out {turns}"],
+        temperature=0.7,
+        max_tokens=100,
+        n=1,
+        stage=stage,
+    )
+
+
+def _lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_dedup_writes_each_prompt_and_message_once_and_reads_back(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    entries = [_entry(1), _entry(2), _entry(3)]
+    writer = LLMLogWriter(path, compress=False)
+    writer.submit(entries)
+    writer.close()
+    # One system prompt blob, plus one blob per distinct message of the longest history.
+    assert writer.blobs == 1 + 6
+    assert all("messages" not in line and "system_prompt" not in line for line in _lines(path) if "blob" not in line)
+    assert list(iter_log_entries(path)) == entries
+
+
+def test_logs_without_dedup_and_torn_lines_are_read(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    entry = _entry(1)
+    writer = LLMLogWriter(path, dedup=False)
+    writer.submit([entry])
+    writer.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"model_name": "m", "sta')
+    assert list(iter_log_entries(path)) == [entry]
+
+
+def test_metadata_only_calls_keep_no_text(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    writer = LLMLogWriter(path, full_rate=0.0)
+    writer.submit([_entry(2)])
+    writer.close()
+    (entry,) = iter_log_entries(path)
+    assert entry["metadata_only"] and entry["message_count"] == 4
+    assert not {"system_prompt", "user_prompt", "output", "messages"} & set(entry)
+
+
+def test_rotated_segments_are_compressed_and_read_in_order(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    entries = [_entry(i + 1, stage=f"s{i}") for i in range(5)]
+    writer = LLMLogWriter(path, max_bytes=1)
+    for entry in entries:
+        writer.submit([entry])
+    writer.close()
+    segments = log_segments(path)
+    assert writer.rotations == 4
+    assert [segment.rsplit("/", 1)[-1] for segment in segments] == [
+        "calls.000.jsonl.gz", "calls.001.jsonl.gz", "calls.002.jsonl.gz", "calls.003.jsonl.gz", "calls.jsonl",
+    ]
+    # Every segment starts a new blob table, so each one is readable on its own.
+    assert list(iter_log_entries(path)) == entries
+    assert all(log_base_path(segment) == path for segment in segments)
+
+    writer = LLMLogWriter(path, max_bytes=1)
+    writer.submit([_entry(9), _entry(9)])
+    writer.close()
+    assert log_segments(path)[4].endswith("calls.004.jsonl.gz")
+
+
+def test_log_base_path_leaves_other_paths_alone():
+    assert log_base_path("logs/run.012.jsonl") == "logs/run.jsonl"
+    assert log_base_path("logs/run.jsonl") == "logs/run.jsonl"
+    assert log_base_path("logs/v1.2.jsonl") == "logs/v1.2.jsonl"
@@ -0,0 +1,49 @@
+import pytest
+
+from simulation.data.csv_index import select_rows
+from simulation.data.parquet import ParquetRows
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def _write(path):
+    table = pa.table({
+        "problem": [f"p{i}" for i in range(10)],
+        "solution": [f"s{i}" if i != 3 else None for i in range(10)],
+        "level": ["Level 1", "Level 2"] * 5,
+        "type": ["Algebra"] * 6 + ["Geometry"] * 4,
+        "unused": list(range(10)),
+    })
+    pq.write_table(table, str(path), row_group_size=3)
+    return str(path)
+
+
+def test_rows_are_projected_and_stringified(tmp_path):
+    source = ParquetRows(_write(tmp_path / "data.parquet"), batch_size=4)
+    assert len(source) == 10
+    rows = dict(source.rows())
+    assert set(rows[0]) == {"problem", "solution", "level", "type"}
+    assert rows[3]["solution"] == ""
+    assert [i for i, _ in source.rows([7, 2, 7])] == [2, 7]
+    assert list(source.rows([])) == []
+
+
+def test_filters_are_pushed_down_and_indices_count_filtered_rows(tmp_path):
+    source = ParquetRows(_write(tmp_path / "data.parquet"), levels=["Level 2"], types=["Geometry"], batch_size=2)
+    assert len(source) == 2
+    assert [row["problem"] for _, row in source.rows()] == ["p7", "p9"]
+    assert [(i, row["problem"]) for i, row in source.rows([1])] == [(1, "p9")]
+    assert source.stratum(0, ("level", "type")) == ("Level 2", "Geometry")
+
+
+def test_select_rows_works_over_parquet(tmp_path):
+    source = ParquetRows(_write(tmp_path / "data.parquet"))
+    assert select_rows(source, where={"type": ["Geometry"]}) == [6, 7, 8, 9]
+
+
+def test_filter_on_a_missing_column_is_an_error(tmp_path):
+    path = tmp_path / "data.parquet"
+    pq.write_table(pa.table({"problem": ["p"]}), str(path))
+    with pytest.raises(ValueError, match="no 'level' column"):
+        ParquetRows(str(path), levels=["Level 1"])
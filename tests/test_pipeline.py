@@ -0,0 +1,120 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from simulation.core import models
+from simulation.simulation.conversation import build_turn_settings
+from simulation.simulation.pipeline import JsonArrayWriter, run_streaming_pipeline
+from simulation.simulation.record import ConversationRecord
+
+
+class ScriptedClient:
+    """Student that ends after two tutor replies, and a tutor that echoes the turn."""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def generate_responses(self, contexts, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0)
+        self.active -= 1
+        if kwargs["stage"] == "assistant":
+            return [[f"reply {sum(m['role'] == 'assistant' for m in ctx)}"] for ctx in contexts]
+        return [
+            ["Terminate: true"] if ctx[-1]["content"].count("AI Tutor:") >= 2 else ["Thought: t\nMessage: q"]
+            for ctx in contexts
+        ]
+
+
+def _settings(client):
+    return build_turn_settings(
+        prompt_initial_query_template="{math_problem}",
+        prompt_template="{math_problem}\n{conversation_history}",
+        user_model_client=client,
+        assistant_model_client=client,
+        show_progress=False,
+    )
+
+
+async def _prepare(ann):
+    record = ConversationRecord(ann["problem"], problem_id=ann["id"])
+    record.metadata = {"priority": ann.get("priority", 0)}
+    return [record]
+
+
+def test_json_array_writer_matches_json_dump(tmp_path):
+    items = [{"a": 1, "b": [1, 2]}, {"c": {"d": "e"}}]
+    for count in (0, 1, 2):
+        path = tmp_path / f"out{count}.json"
+        with JsonArrayWriter(str(path)) as writer:
+            for item in items[:count]:
+                writer.write(item)
+        assert path.read_text(encoding="utf-8") == json.dumps(items[:count], indent=2)
+
+
+def test_pipeline_runs_every_problem_within_the_pool():
+    client = ScriptedClient()
+    results = []
+    annotations = ({"id": str(i), "problem": f"P{i}"} for i in range(7))
+    written = asyncio.run(run_streaming_pipeline(
+        annotations, _prepare, _settings(client), results.append, pool_size=2, extract_workers=3, queue_size=2
+    ))
+    assert written == 7
+    assert sorted(r["problem_id"] for r in results) == [str(i) for i in range(7)]
+    assert all(r["turns"] == 2 and r["finished"] for r in results)
+    # Each running conversation has at most one request in flight.
+    assert client.peak <= 2
+
+
+def test_pipeline_admits_highest_priority_first():
+    async def prepare(ann):
+        # All records of one annotation are queued before the free slot picks one.
+        return [(await _prepare({"id": str(i), "problem": "P", "priority": p}))[0] for i, p in enumerate([1, 5, 3])]
+
+    results = []
+    asyncio.run(run_streaming_pipeline(
+        [{}], prepare, _settings(ScriptedClient()), results.append,
+        pool_size=1, extract_workers=1, priority=lambda record: record.metadata["priority"],
+    ))
+    admitted = sorted(results, key=lambda r: r["metadata"]["admitted"])
+    assert [r["problem_id"] for r in admitted] == ["1", "2", "0"]
+
+
+def test_pipeline_surfaces_prepare_errors():
+    async def prepare(ann):
+        raise RuntimeError("extraction failed")
+
+    with pytest.raises(RuntimeError, match="extraction failed"):
+        asyncio.run(run_streaming_pipeline(
+            [{"id": "0", "problem": "P"}], prepare, _settings(ScriptedClient()), lambda r: None
+        ))
+
+
+def test_model_client_shares_one_limiter_and_semaphore(monkeypatch):
+    class FakeOpenAI:
+        def __init__(self):
+            self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+        async def create(self, **params):
+            message = SimpleNamespace(content="ok")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+    async def no_log(**kwargs):
+        return None
+
+    monkeypatch.setattr(models, "AsyncOpenAI", FakeOpenAI)
+    monkeypatch.setattr(models, "log_batch_calls", no_log)
+    client = models.SingleModelClient("gpt-4o", requests_per_minute=1000)
+
+    async def run():
+        first = await client.generate_responses([[{"role": "user", "content": "a"}]], 0, 10, show_progress=False)
+        limiter, semaphore = client._limiter, client._semaphore
+        second = await client.generate_responses([[{"role": "user", "content": "b"}]], 0, 10, show_progress=False)
+        assert client._limiter is limiter and client._semaphore is semaphore
+        return first + second
+
+    assert asyncio.run(run()) == [["ok"], ["ok"]]
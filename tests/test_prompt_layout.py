@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+from simulation.core.prompts import split_template_for_caching
+from simulation.core.usage import record_usage, reset_usage, usage_from_response, usage_summary
+from simulation.simulation.conversation import _prepare_templates
+
+TEMPLATE = (
+    "You are a student.\n"
+    "# Problem\n{math_problem}\n"
+    "# History\n{conversation_history}\n"
+    "# Style\n{message_style}\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def _clean_usage():
+    reset_usage()
+    yield
+    reset_usage()
+
+
+def test_split_moves_volatile_sections_behind_static_ones():
+    static, volatile = split_template_for_caching(TEMPLATE, ["conversation_history"])
+    assert static == "You are a student.\n# Problem\n{math_problem}\n# Style\n{message_style}\n"
+    assert volatile == "# History\n{conversation_history}\n"
+
+
+def test_split_without_volatile_fields_keeps_template_static():
+    static, volatile = split_template_for_caching(TEMPLATE, [])
+    assert static == TEMPLATE
+    assert volatile == "\n"
+
+
+def test_prepare_templates_layouts():
+    (inline,) = _prepare_templates([TEMPLATE], "inline")
+    assert len(inline) == 1 and inline[0].text == TEMPLATE
+
+    (cached,) = _prepare_templates([TEMPLATE], "cache")
+    static, volatile = cached
+    assert "{conversation_history}" not in static.text
+    assert "{conversation_history}" in volatile.text
+
+    with pytest.raises(ValueError):
+        _prepare_templates([TEMPLATE], "split")
+
+
+def test_usage_from_response_reads_cached_tokens():
+    resp = SimpleNamespace(usage=SimpleNamespace(
+        prompt_tokens=1000,
+        completion_tokens=50,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=768),
+    ))
+    assert usage_from_response(resp) == {"prompt_tokens": 1000, "cached_tokens": 768, "completion_tokens": 50}
+    assert usage_from_response(SimpleNamespace(usage=None))["cached_tokens"] == 0
+
+
+def test_usage_summary_reports_cache_hit_rate():
+    record_usage("user", prompt_tokens=1000, cached_tokens=768, completion_tokens=50, latency_s=0.5)
+    record_usage("user", prompt_tokens=1000, cached_tokens=0, completion_tokens=70, latency_s=0.5)
+    row = usage_summary()["user"]
+    assert row["calls"] == 2
+    assert row["cached_tokens"] == 768
+    assert row["cache_hit_rate"] == 0.384
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from simulation.core.prompts import CompiledPrompt, PromptRegistry, get_prompt
+from simulation.simulation.runner import _load_prompt_pair
+
+PROMPTS_ROOT = os.path.join(os.path.dirname(__file__), "..", "simulation", "prompts")
+
+
+@pytest.mark.parametrize("template", [
+    "plain text",
+    "{a} and {b}",
+    "{a!r} {b:>5} {{literal}}",
+    "{a.real} nested",
+])
+def test_compiled_prompt_renders_like_str_format(template):
+    values = {"a": 3, "b": "x"}
+    assert CompiledPrompt(template).render(values) == template.format(**values)
+
+
+def test_registry_reports_unsupplied_and_unparsable_templates(tmp_path):
+    (tmp_path / "good.txt").write_text("{question} {answer}", encoding="utf-8")
+    (tmp_path / "bad.txt").write_text("{unclosed", encoding="utf-8")
+    registry = PromptRegistry(str(tmp_path))
+    (problem,) = registry.validate({"good": ("question", "answer")})
+    assert problem.startswith("bad: unparsable template")
+    assert registry.check("good", ("question",)) == ["good: placeholder {answer} is not supplied by its call site"]
+    assert registry.check("missing", ()) == [f"missing: template not found under {tmp_path}"]
+    with pytest.raises(ValueError):
+        registry.get("bad")
+
+
+def test_get_prompt_reuses_the_registry_compilation(tmp_path):
+    (tmp_path / "t.txt").write_text("{x}", encoding="utf-8")
+    registry = PromptRegistry(str(tmp_path))
+    assert get_prompt(str(tmp_path / "t.txt")) is registry.get("t")
+
+
+@pytest.mark.parametrize("response_only", [False, True])
+@pytest.mark.parametrize("length_control", [False, True])
+def test_shipped_templates_pass_validation(response_only, length_control):
+    registry = PromptRegistry(PROMPTS_ROOT)
+    turn, initial = _load_prompt_pair(registry, "dynamic-knowledge-state", response_only, length_control)
+    assert turn.name.startswith("dynamic-knowledge-state")
+    assert initial.name.startswith("dynamic-knowledge-state-initial-query")
@@ -0,0 +1,41 @@
+import pytest
+
+from simulation.core.reasoning import (
+    REASONING_PROFILES,
+    default_reasoning_effort,
+    parse_reasoning_profile,
+    resolve_reasoning_effort,
+)
+from simulation.simulation.conversation import _extract_user_query
+
+
+def test_parse_named_and_explicit_profiles():
+    assert parse_reasoning_profile("") == {}
+    assert parse_reasoning_profile("balanced") == REASONING_PROFILES["balanced"]
+    assert parse_reasoning_profile("user=minimal, assistant=medium") == {"user": "minimal", "assistant": "medium"}
+    with pytest.raises(ValueError):
+        parse_reasoning_profile("quick")
+
+
+def test_default_effort_follows_model_name():
+    assert default_reasoning_effort("gpt-5-mini") == "minimal"
+    assert default_reasoning_effort("gpt-5-mini-thinking") == "medium"
+    assert default_reasoning_effort("gpt-4o") is None
+
+
+def test_resolve_effort_per_stage():
+    profile = parse_reasoning_profile("thorough")
+    assert resolve_reasoning_effort("gpt-5", "user", profile) == "low"
+    assert resolve_reasoning_effort("gpt-5", "assistant", profile) == "medium"
+    assert resolve_reasoning_effort("gpt-5", "assistant", {"user": "low"}) == "minimal"
+    assert resolve_reasoning_effort("gpt-5-thinking", None) == "medium"
+    # Models without reasoning never get an effort, whatever the profile says.
+    assert resolve_reasoning_effort("gpt-4o", "user", profile) is None
+
+
+def test_extract_user_query_with_and_without_thought():
+    assert _extract_user_query("Thought: hmm\nMessage: What is x?") == "What is x?"
+    assert _extract_user_query("Thought: hmm\nResponse: ok") == "ok"
+    assert _extract_user_query("Thought: no label here") is None
+    assert _extract_user_query("Message: just this") == "just this"
+    assert _extract_user_query("Is it 4?") == "Is it 4?"
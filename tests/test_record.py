@@ -0,0 +1,49 @@
+from simulation.simulation.record import TUTOR_SYSTEM_PROMPT, ConversationRecord
+
+
+def _record():
+    record = ConversationRecord("Solve x + 1 = 2.", problem_id="p1", user_profile="short", knowledge_state={"a": {"state": "struggling"}})
+    record.add_user_turn("Thought: hmm\nMessage: How do I start?", "How do I start?")
+    record.add_assistant_turn("Subtract 1 from both sides.")
+    record.add_user_turn("garbled", None)
+    record.add_user_turn("So x = 1?", "So x = 1?")
+    record.add_assistant_turn("Yes.")
+    return record
+
+
+def test_views_are_built_from_one_turn_store():
+    record = _record()
+    assert record.conversation == [
+        ("user", "Thought: hmm\nMessage: How do I start?"),
+        ("assistant", "Subtract 1 from both sides."),
+        ("user", "garbled"),
+        ("user", "So x = 1?"),
+        ("assistant", "Yes."),
+    ]
+    assert record.history_text() == (
+        "- You: How do I start?\n- AI Tutor: Subtract 1 from both sides.\n"
+        "- You: So x = 1?\n- AI Tutor: Yes.\n"
+    )
+    assert record.first_query_content == "How do I start?"
+    assert record.last_user_query == "So x = 1?"
+    assert record.last_assistant_message == "Yes."
+
+
+def test_tutor_messages_skip_unsent_turns_and_prefix_the_problem():
+    messages = _record().tutor_messages()
+    assert messages[0] == {"role": "system", "content": TUTOR_SYSTEM_PROMPT}
+    assert [m["role"] for m in messages[1:]] == ["user", "assistant", "user", "assistant"]
+    assert messages[1]["content"].startswith("Here is the problem that you will tutor me on:\nSolve x + 1 = 2.\n\n")
+    assert messages[1]["content"].endswith("How do I start?")
+
+
+def test_to_dict_keeps_legacy_keys():
+    data = _record().to_dict()
+    assert data["problem_id"] == "p1"
+    assert data["knowledge_state"] == {"a": {"state": "struggling"}}
+    assert data["knowledge_state_history"] == [{"a": {"state": "struggling"}}]
+    assert data["first_query_content"] == "How do I start?"
+    assert "concept_graph" not in data
+
+    plain = ConversationRecord("p", with_profile=False).to_dict()
+    assert "problem_id" not in plain and "knowledge_state" not in plain
@@ -0,0 +1,80 @@
+import gzip
+import json
+
+from simulation.simulation.pipeline import JsonArrayWriter
+from simulation.simulation.results import (
+    INDEX_SUFFIX,
+    CompressedResultWriter,
+    ResultReader,
+    _iter_json_array,
+    open_result_writer,
+    result_stem,
+)
+
+RESULTS = [
+    {"problem_id": 1, "metadata": {"student": "a"}, "text": "x" * 50},
+    {"problem_id": 1, "metadata": {"student": "b"}, "text": "é"},
+    {"problem_id": 2, "metadata": {}, "text": ""},
+]
+
+
+def _write_compressed(path):
+    with CompressedResultWriter(str(path)) as writer:
+        for result in RESULTS:
+            writer.write(result)
+    return str(path)
+
+
+def test_compressed_file_is_plain_gzip_jsonl(tmp_path):
+    path = _write_compressed(tmp_path / "results.jsonl.gz")
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == RESULTS
+
+
+def test_index_lookup(tmp_path):
+    reader = ResultReader(_write_compressed(tmp_path / "results.jsonl.gz"))
+    assert reader.indexed
+    assert len(reader) == 3
+    assert reader.keys() == [("1", "a"), ("1", "b"), ("2", None)]
+    assert reader.get(1, "b") == RESULTS[1]
+    assert reader.get("2") == RESULTS[2]
+    assert reader.get(3) is None
+    assert list(reader) == RESULTS
+
+
+def test_stale_or_missing_index_falls_back_to_a_scan(tmp_path):
+    path = _write_compressed(tmp_path / "results.jsonl.gz")
+    with open(path, "ab") as f:
+        f.write(gzip.compress(b'{"problem_id": 9}\n'))
+    reader = ResultReader(path)
+    assert not reader.indexed
+    assert reader.get(9) == {"problem_id": 9}
+    assert len(reader) == 4
+
+    (tmp_path / ("results.jsonl.gz" + INDEX_SUFFIX)).unlink()
+    assert ResultReader(path).get(1, "a") == RESULTS[0]
+
+
+def test_json_array_is_streamed_in_small_chunks(tmp_path):
+    path = tmp_path / "results.json"
+    with open_result_writer(str(path)) as writer:
+        assert isinstance(writer, JsonArrayWriter)
+        for result in RESULTS:
+            writer.write(result)
+    reader = ResultReader(str(path))
+    assert list(reader) == RESULTS
+    assert reader.keys() == [("1", "a"), ("1", "b"), ("2", None)]
+    with open(path, "r", encoding="utf-8") as f:
+        assert list(_iter_json_array(f, chunk_size=7)) == RESULTS
+
+
+def test_jsonl_checkpoint_skips_a_torn_line(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_text(json.dumps(RESULTS[0]) + "\n\n" + '{"problem_id": 2, "te', encoding="utf-8")
+    assert list(ResultReader(str(path))) == [RESULTS[0]]
+
+
+def test_result_stem():
+    assert result_stem("out/run.jsonl.gz") == "out/run"
+    assert result_stem("out/run.json") == "out/run"
+    assert result_stem("out/run") == "out/run"
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+
+from simulation.simulation.retrace import retrace_results, tutor_exchanges
+
+PROMPTS_ROOT = os.path.join(os.path.dirname(__file__), "..", "simulation", "prompts")
+CONCEPT_GRAPH = [
+    {"concept_id": "a", "description": "", "prerequisites": []},
+    {"concept_id": "b", "description": "", "prerequisites": ["a"]},
+]
+
+
+class KnowledgeClient:
+    """Explains "a" then "b"; every explained concept becomes knows_well (before gating)."""
+
+    def __init__(self):
+        self.batches = []
+
+    async def generate_responses(self, contexts, **kwargs):
+        self.batches.append((kwargs["stage"], len(contexts)))
+        outputs = []
+        for ctx in contexts:
+            text = ctx[-1]["content"]
+            if kwargs["stage"] == "knowledge_extract":
+                found = ["a"] if "explain a" in text else ["b"]
+                outputs.append([json.dumps({"explained_concepts": found})])
+            else:
+                names = json.loads(text.split("## Concepts Potentially Explained")[1].split("##")[0])
+                outputs.append([json.dumps({n: {"new_state": "knows_well", "evidence": "e"} for n in names})])
+        return outputs
+
+
+def _result(replies, first_query="q0"):
+    messages = [{"role": "system", "content": "tutor"}]
+    for i, reply in enumerate(replies):
+        query = f"Here is the problem...\n\n{first_query}" if i == 0 else f"q{i}"
+        messages += [{"role": "user", "content": query}, {"role": "assistant", "content": reply}]
+    return {
+        "problem_id": "1",
+        "assistant_messages": messages,
+        "first_query_content": first_query,
+        "concept_graph": CONCEPT_GRAPH,
+        "knowledge_state_history": [{"a": {"state": "not_introduced"}, "b": {"state": "not_introduced"}}],
+    }
+
+
+def test_tutor_exchanges_use_the_bare_first_query():
+    assert tutor_exchanges(_result(["r0", "r1"])) == [("q0", "r0"), ("q1", "r1")]
+    assert tutor_exchanges({"assistant_messages": []}) == []
+
+
+def test_retrace_batches_each_turn_across_conversations():
+    results = [
+        _result(["explain a", "explain b"]),
+        _result(["explain b"]),
+        {"problem_id": "old", "conversation": []},
+    ]
+    client = KnowledgeClient()
+    output, count = asyncio.run(retrace_results(
+        results,
+        model_client=client,
+        extract_prompt_path=os.path.join(PROMPTS_ROOT, "dynamic-knowledge-extract.txt"),
+        update_prompt_path=os.path.join(PROMPTS_ROOT, "dynamic-knowledge-update.txt"),
+    ))
+    assert count == 2
+    assert client.batches == [
+        ("knowledge_extract", 2), ("knowledge_update", 2),
+        ("knowledge_extract", 1), ("knowledge_update", 1),
+    ]
+    assert output[2] is results[2]
+
+    first = output[0]
+    assert first["explained_concepts_history"] == [["a"], ["b"]]
+    assert [h["b"]["state"] for h in first["knowledge_state_history"]] == ["not_introduced", "not_introduced", "knows_well"]
+    # "b" explained before its prerequisite "a" is gated to struggling.
+    assert output[1]["knowledge_state"]["b"]["state"] == "struggling"
@@ -0,0 +1,74 @@
+import json
+
+from simulation.simulation.scheduling import (
+    FEATURES,
+    TurnModel,
+    calibrate_turn_model,
+    conversation_features,
+    load_turn_samples,
+    makespan_report,
+    pool_makespan,
+)
+
+IU_GRAPH = {
+    "nodes": [{"id": "IU1"}, {"id": "IU2"}, {"id": "IU3"}],
+    "edges": [{"from": "IU1", "to": "IU2"}, {"from": "IU2", "to": "IU3"}],
+}
+
+
+def test_conversation_features():
+    assert conversation_features(IU_GRAPH, "novice", "Level 4") == {
+        "iu_nodes": 3, "iu_edges": 2, "iu_depth": 3, "knowledge_level": 0, "level": 4,
+    }
+    assert conversation_features({}, "unknown", "")["knowledge_level"] == 1
+
+
+def test_expected_turns_are_clamped():
+    model = TurnModel(intercept=0.0, weights={"iu_nodes": 1.0}, max_turns=15)
+    assert model.expected_turns({"iu_nodes": 40}) == 15
+    assert model.expected_turns({"iu_nodes": 0}) == 1
+    metadata = model.annotate({"iu_nodes": 4})
+    assert metadata["expected_turns"] == 4 and metadata["expected_tokens"] == 2400
+
+
+def test_fit_recovers_a_linear_relation():
+    samples = [
+        ({"iu_nodes": n, "iu_edges": 0, "iu_depth": 0, "knowledge_level": 1, "level": 3}, 2 + n)
+        for n in range(1, 30)
+    ]
+    model = TurnModel(max_turns=100)
+    model.fit(samples)
+    assert model.samples == len(samples)
+    assert abs(model.expected_turns(samples[10][0]) - samples[10][1]) < 0.5
+
+
+def test_longest_first_shortens_the_makespan():
+    durations = [1, 1, 1, 1, 1, 1, 6]
+    assert pool_makespan(durations, 2) == 9
+    assert pool_makespan(sorted(durations, reverse=True), 2) == 6
+    assert pool_makespan([], 4) == 0
+
+
+def test_calibration_reads_past_outputs_and_logs(tmp_path):
+    features = {name: 1 for name in FEATURES}
+    results = [
+        {"problem_id": "1", "finished": True, "turns": 5, "metadata": features},
+        {"problem_id": "2", "finished": False, "turns": 15, "metadata": features},
+        {"problem_id": "3", "finished": True, "turns": 4},
+    ]
+    (tmp_path / "run.json").write_text(json.dumps(results), encoding="utf-8")
+    (tmp_path / "broken.json").write_text("{", encoding="utf-8")
+    assert load_turn_samples(str(tmp_path / "*.json")) == [(features, 5)]
+
+    model = calibrate_turn_model(str(tmp_path / "*.json"), {"user": [100, 300], "assistant": [400]})
+    assert model.samples == 1
+    assert model.tokens_per_turn == 600
+
+
+def test_makespan_report_uses_admission_order():
+    results = [
+        {"turns": 2, "metadata": {"expected_turns": 2, "admitted": 1}},
+        {"turns": 6, "metadata": {"expected_turns": 5, "admitted": 0}},
+    ]
+    assert makespan_report(results, 1) == "makespan (turns, pool of 1): predicted 7.0, actual 8.0"
+    assert makespan_report([{"turns": 1}], 1) == "makespan: no scheduling metadata"
@@ -0,0 +1,101 @@
+import asyncio
+import random
+
+import pytest
+
+from simulation.knowledge.state import KnowledgeTrace
+from simulation.simulation.conversation import run_conversation_with_interaction_profile
+from simulation.simulation.record import ConversationRecord
+from simulation.simulation.snapshot import (
+    SimulationInterrupted,
+    read_snapshot,
+    remove_snapshot,
+    rng_state,
+    set_rng_state,
+    write_snapshot,
+)
+
+
+def test_write_read_remove(tmp_path):
+    path = str(tmp_path / "snap" / "run.snapshot.json.gz")
+    assert read_snapshot(path) is None
+    write_snapshot(path, {"turn": 3, "records": [{"problem": "é"}]})
+    assert read_snapshot(path) == {"version": 1, "turn": 3, "records": [{"problem": "é"}]}
+    remove_snapshot(path)
+    remove_snapshot(path)
+    assert read_snapshot(path) is None
+
+
+def test_unknown_version_is_refused(tmp_path):
+    path = str(tmp_path / "run.snapshot.json.gz")
+    write_snapshot(path, {"version": 99})
+    with pytest.raises(ValueError, match="Unsupported snapshot version"):
+        read_snapshot(path)
+
+
+def test_rng_state_survives_a_json_round_trip(tmp_path):
+    path = str(tmp_path / "rng.json.gz")
+    random.seed(5)
+    write_snapshot(path, {"rng": rng_state()})
+    expected = [random.random() for _ in range(3)]
+    set_rng_state(read_snapshot(path)["rng"])
+    assert [random.random() for _ in range(3)] == expected
+
+
+def test_record_round_trip():
+    record = ConversationRecord("p", problem_id="7", user_profile="u", knowledge_state={"a": {"state": "struggling"}}, user_token_budget=900)
+    record.knowledge.push({"a": {"state": "knows_well"}})
+    record.add_user_turn("Thought: t\nMessage: m", "m")
+    record.add_assistant_turn("r")
+    record.turns = 1
+    record.metadata = {"student": "s1"}
+    restored = ConversationRecord.from_snapshot(record.to_snapshot())
+    assert isinstance(restored.knowledge, KnowledgeTrace)
+    assert restored.to_dict() == record.to_dict()
+    assert restored.to_snapshot() == record.to_snapshot()
+
+
+class StoppingClient:
+    """Student that ends after three tutor replies; sets `stop` on the first tutor call."""
+
+    def __init__(self, stop=None):
+        self.stop = stop
+
+    async def generate_responses(self, contexts, **kwargs):
+        if kwargs["stage"] == "assistant":
+            if self.stop is not None:
+                self.stop.set()
+            return [[f"reply {sum(m['role'] == 'assistant' for m in ctx)}"] for ctx in contexts]
+        return [
+            ["Terminate: true"] if ctx[-1]["content"].count("AI Tutor:") >= 3 else ["Thought: t\nMessage: q"]
+            for ctx in contexts
+        ]
+
+
+def _run(client, **kwargs):
+    return asyncio.run(run_conversation_with_interaction_profile(
+        problems=["p0", "p1"],
+        problem_ids=["0", "1"],
+        user_profiles=["u0", "u1"],
+        user_model_client=client,
+        assistant_model_client=client,
+        prompt_initial_query_template="{math_problem}",
+        prompt_template="{math_problem}\n{conversation_history}",
+        show_progress=False,
+        max_turns=6,
+        **kwargs,
+    ))
+
+
+def test_interrupted_run_restores_to_the_same_results(tmp_path):
+    path = str(tmp_path / "run.snapshot.json.gz")
+    expected = _run(StoppingClient())
+
+    stop = asyncio.Event()
+    with pytest.raises(SimulationInterrupted) as info:
+        _run(StoppingClient(stop), snapshot_path=path, stop=stop)
+    assert info.value.turn == 1
+    assert read_snapshot(path)["turn"] == 1
+
+    assert _run(StoppingClient(), snapshot_path=path, restore=True) == expected
+    assert read_snapshot(path) is None
@@ -0,0 +1,58 @@
+import json
+
+from simulation.knowledge.state import KnowledgeTrace, is_higher_state
+
+INITIAL = {
+    "a": {"state": "not_introduced"},
+    "b": {"state": "struggling", "evidence": "e0"},
+}
+
+
+def test_push_stores_only_changed_concepts():
+    trace = KnowledgeTrace(INITIAL)
+    diff = trace.push({"a": {"state": "not_introduced"}, "b": {"state": "knows_well", "evidence": "e1"}})
+    assert list(diff) == [1]
+    assert trace.state_of("b") == "knows_well"
+    assert trace.current() == {"a": {"state": "not_introduced"}, "b": {"state": "knows_well", "evidence": "e1"}}
+
+
+def test_history_rebuilds_every_turn_including_new_concepts():
+    trace = KnowledgeTrace(INITIAL)
+    trace.push({"a": {"state": "struggling"}})
+    trace.push({"c": {"state": "confused"}})
+    history = trace.history()
+    assert len(history) == len(trace) == 3
+    assert history[0] == INITIAL
+    assert history[1] == {"a": {"state": "struggling"}, "b": {"state": "struggling", "evidence": "e0"}}
+    assert history[2]["c"] == {"state": "confused"}
+    assert "c" not in history[1]
+
+
+def test_entries_without_state_round_trip():
+    trace = KnowledgeTrace({"a": {"evidence": "none yet"}})
+    assert trace.state_of("a") is None
+    assert trace.current() == {"a": {"evidence": "none yet"}}
+
+
+def test_is_stuck_after_a_push_that_changed_nothing():
+    trace = KnowledgeTrace(INITIAL)
+    assert not trace.is_stuck()
+    trace.push({"a": {"state": "struggling"}})
+    assert not trace.is_stuck()
+    trace.push({"a": {"state": "struggling"}})
+    assert trace.is_stuck()
+
+
+def test_snapshot_round_trip_through_json():
+    trace = KnowledgeTrace(INITIAL)
+    trace.push({"a": {"state": "struggling"}, "c": {"state": "knows_well"}})
+    restored = KnowledgeTrace.from_snapshot(json.loads(json.dumps(trace.to_snapshot())))
+    assert restored.history() == trace.history()
+    assert restored.state_codes() == trace.state_codes()
+    restored.push({"c": {"state": "knows_well"}})
+    assert restored.is_stuck()
+
+
+def test_is_higher_state():
+    assert is_higher_state("knows_well", "struggling")
+    assert not is_higher_state("not_introduced", "struggling")
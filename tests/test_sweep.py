@@ -0,0 +1,34 @@
+import asyncio
+import sys
+
+import pytest
+
+from simulation.core.cli import split_list
+from simulation.simulation import sweep
+
+
+def test_split_list():
+    assert split_list(" gpt-5, gpt-4o ,,") == ["gpt-5", "gpt-4o"]
+    assert split_list("") == []
+
+
+def test_parse_model_limits():
+    assert sweep.parse_model_limits("gpt-5=16, gpt-4o=64") == {"gpt-5": 16, "gpt-4o": 64}
+    assert sweep.parse_model_limits("") == {}
+    with pytest.raises(ValueError):
+        sweep.parse_model_limits("gpt-5")
+
+
+def test_sweep_parser_requires_assistant_models():
+    args = sweep.sweep_parser().parse_args(["--version", "v", "--assistant_models", "a,b", "--seeds", "1,2"])
+    assert split_list(args.assistant_models) == ["a", "b"]
+    with pytest.raises(SystemExit):
+        sweep.sweep_parser().parse_args(["--version", "v"])
+
+
+@pytest.mark.parametrize("flag", [["--pipeline", "streaming"], ["--snapshot_every", "0"], ["--assistant_model", "x"]])
+def test_sweep_rejects_runner_flags_it_ignores(monkeypatch, capsys, flag):
+    monkeypatch.setattr(sys, "argv", ["sweep", "--version", "v", "--assistant_models", "a"] + flag)
+    with pytest.raises(SystemExit):
+        asyncio.run(sweep.main())
+    assert f"--{flag[0][2:]} is not supported by the sweep" in capsys.readouterr().err